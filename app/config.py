@@ -13,6 +13,14 @@ class Settings:
     JWT_SECRET: str = os.getenv("JWT_SECRET", "testing-key")
     JWT_ALGORITHM: str = os.getenv("JWT_ALGORITHM", "HS256")
     ACCESS_TOKEN_EXPIRE_MINUTES: int = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
+    REFRESH_TOKEN_EXPIRE_MINUTES: int = int(os.getenv("REFRESH_TOKEN_EXPIRE_MINUTES", "10080"))
+    # Stateless mode authorizes from the token's uid and role claims without a user lookup.
+    # Access tokens are then short lived and renewed through /users/refresh
+    STATELESS_AUTH: bool = os.getenv("STATELESS_AUTH", "False").lower() == "true"
+    STATELESS_ACCESS_TOKEN_EXPIRE_MINUTES: int = int(os.getenv("STATELESS_ACCESS_TOKEN_EXPIRE_MINUTES", "5"))
+    # How often each process reloads revocations made by the others, which is how long a
+    # revoked token or deleted user can still get in through another worker
+    REVOCATION_RELOAD_SECONDS: int = int(os.getenv("REVOCATION_RELOAD_SECONDS", "15"))
     
     # FastAPI Configuration
     API_TITLE: str = "Grocery Store Inventory API"
@@ -24,6 +32,54 @@ class Settings:
     DEFAULT_PAGE_SIZE: int = int(os.getenv("DEFAULT_PAGE_SIZE", "100"))
     MAX_PAGE_SIZE: int = int(os.getenv("MAX_PAGE_SIZE", "1000"))
 
+    # Bulk Import
+    BULK_IMPORT_CHUNK_SIZE: int = int(os.getenv("BULK_IMPORT_CHUNK_SIZE", "1000"))
+
+    # Rows fetched per round trip when streaming exports
+    EXPORT_BATCH_SIZE: int = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+
+    # Product lookup cache
+    PRODUCT_CACHE_SIZE: int = int(os.getenv("PRODUCT_CACHE_SIZE", "10000"))
+    PRODUCT_CACHE_TTL_SECONDS: int = int(os.getenv("PRODUCT_CACHE_TTL_SECONDS", "300"))
+
+    # bcrypt worker processes, and how many hashes may queue before logins get a 503
+    PASSWORD_HASH_WORKERS: int = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+    PASSWORD_HASH_MAX_PENDING: int = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "32"))
+
+    # Login attempts allowed per username and per client IP: a burst, then a steady
+    # rate per minute. Idle buckets are swept every LOGIN_LIMIT_SWEEP_SECONDS
+    LOGIN_USERNAME_BURST: int = int(os.getenv("LOGIN_USERNAME_BURST", "10"))
+    LOGIN_USERNAME_PER_MINUTE: int = int(os.getenv("LOGIN_USERNAME_PER_MINUTE", "5"))
+    LOGIN_IP_BURST: int = int(os.getenv("LOGIN_IP_BURST", "30"))
+    LOGIN_IP_PER_MINUTE: int = int(os.getenv("LOGIN_IP_PER_MINUTE", "60"))
+    LOGIN_LIMIT_SWEEP_SECONDS: int = int(os.getenv("LOGIN_LIMIT_SWEEP_SECONDS", "60"))
+    # Comma separated addresses of reverse proxies whose X-Forwarded-For is believed.
+    # Left empty, the client IP is the connecting address, which behind a proxy is the proxy's
+    LOGIN_TRUSTED_PROXIES: frozenset = frozenset(
+        address.strip() for address in os.getenv("LOGIN_TRUSTED_PROXIES", "").split(",") if address.strip()
+    )
+
+    # Authenticated user cache
+    USER_CACHE_SIZE: int = int(os.getenv("USER_CACHE_SIZE", "1000"))
+    USER_CACHE_TTL_SECONDS: int = int(os.getenv("USER_CACHE_TTL_SECONDS", "60"))
+
+    # Product/sale change feed
+    CHANGE_FEED_BUFFER_SIZE: int = int(os.getenv("CHANGE_FEED_BUFFER_SIZE", "10000"))
+    CHANGE_FEED_HEARTBEAT_SECONDS: int = int(os.getenv("CHANGE_FEED_HEARTBEAT_SECONDS", "15"))
+
+    # Minutes between stock ledger compactions
+    STOCK_COMPACTION_MINUTES: int = int(os.getenv("STOCK_COMPACTION_MINUTES", "5"))
+
+    # Reorder threshold recommendations: demand history, supplier lead time and the
+    # number of standard deviations of safety stock (1.65 is roughly a 95% service level)
+    REORDER_DEMAND_DAYS: int = int(os.getenv("REORDER_DEMAND_DAYS", "28"))
+    REORDER_LEAD_TIME_DAYS: int = int(os.getenv("REORDER_LEAD_TIME_DAYS", "7"))
+    REORDER_SERVICE_LEVEL_Z: float = float(os.getenv("REORDER_SERVICE_LEVEL_Z", "1.65"))
+
+    # Sales ending more than this many days ago are moved to the archive, in batches
+    SALE_ARCHIVE_RETENTION_DAYS: int = int(os.getenv("SALE_ARCHIVE_RETENTION_DAYS", "90"))
+    SALE_ARCHIVE_BATCH_SIZE: int = int(os.getenv("SALE_ARCHIVE_BATCH_SIZE", "1000"))
+
     # Email Settings
     SMTP_SERVER: str = os.getenv("SMTP_SERVER", "smtp.gmail.com")
     SMTP_PORT: int = int(os.getenv("SMTP_PORT", "587"))
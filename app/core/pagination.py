@@ -0,0 +1,39 @@
+import base64
+import json
+from typing import Optional
+from fastapi import HTTPException
+
+# Cursors are opaque to clients: base64 encoded JSON holding the last key seen
+def encode_cursor(value) -> str:
+    raw = json.dumps({"k": value}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        value = json.loads(base64.urlsafe_b64decode(padded.encode()))["k"]
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    # every listing pages on an integer id; anything else would only blow up in the query
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return value
+
+def paginate(query, key_column, page: int, size: int, after: Optional[str] = None):
+    """
+    Page a query ordered by key_column. When an `after` cursor is given the page
+    starts right after that key (keyset pagination), so every page costs the same
+    no matter how deep into the table it is. Otherwise falls back to offset paging.
+    Returns the rows and the cursor for the next page (None on the last page).
+    """
+    query = query.order_by(key_column)
+    if after is not None:
+        query = query.filter(key_column > decode_cursor(after))
+    else:
+        query = query.offset((page - 1) * size)
+    rows = query.limit(size).all()
+
+    next_cursor = None
+    if rows and len(rows) == size:
+        next_cursor = encode_cursor(getattr(rows[-1], key_column.key))
+    return rows, next_cursor
@@ -1,14 +1,16 @@
 import jwt
+import uuid
 from datetime import datetime, timedelta, timezone
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from typing import Annotated
+from typing import Annotated, Optional
 from jwt.exceptions import InvalidTokenError
 from passlib.context import CryptContext
 
 from app.config import settings
 from app.models.user import User
-from app.database import SessionLocal
+from app.services.user_cache import get_user_by_username
+from app.services.revocation import revocation_list
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="users/login")
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -19,36 +21,66 @@ def hash_password(password: str) -> str:
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
-# Creates a JWT with an expiry
-def create_access_token(data: dict) -> str:
+# Creates a JWT with an expiry, short lived in stateless mode
+def create_access_token(data: dict, expires_minutes: Optional[int] = None) -> str:
+    if expires_minutes is None:
+        if settings.STATELESS_AUTH:
+            expires_minutes = settings.STATELESS_ACCESS_TOKEN_EXPIRE_MINUTES
+        else:
+            expires_minutes = settings.ACCESS_TOKEN_EXPIRE_MINUTES
     to_encode = data.copy()
-    expire = datetime.now(timezone.utc) + timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode.update({"exp": expire})
+    expire = datetime.now(timezone.utc) + timedelta(minutes=expires_minutes)
+    # every token gets an id so it can be revoked on its own, and an issue time so
+    # revoking a user covers only the tokens issued before
+    to_encode.setdefault("jti", uuid.uuid4().hex)
+    to_encode.update({"exp": expire, "iat": datetime.now(timezone.utc)})
     encoded_jwt = jwt.encode(to_encode, settings.JWT_SECRET, algorithm=settings.JWT_ALGORITHM)
     return encoded_jwt
 
-# retrives the user based on the JWT
-def get_current_user(token: Annotated[str, Depends(oauth2_scheme)]):
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
+# Access token carrying the claims stateless mode authorizes from
+def create_user_token(user: User) -> str:
+    return create_access_token({"sub": user.username, "uid": user.id, "role": user.role})
+
+# Long lived token only good for getting new access tokens from /users/refresh
+def create_refresh_token(user: User) -> str:
+    return create_access_token(
+        {"sub": user.username, "uid": user.id, "type": "refresh"},
+        expires_minutes=settings.REFRESH_TOKEN_EXPIRE_MINUTES
     )
-    
+
+credentials_exception = HTTPException(
+    status_code=status.HTTP_401_UNAUTHORIZED,
+    detail="Could not validate credentials",
+    headers={"WWW-Authenticate": "Bearer"},
+)
+
+def decode_token(token: str, token_type: str = "access") -> dict:
+    """Verified claims of a token of the given type, or a 401"""
     try:
-        # Decode the JWT token
         payload = jwt.decode(token, settings.JWT_SECRET, algorithms=[settings.JWT_ALGORITHM])
-        username = payload.get("sub")
-        if username is None:
-            raise credentials_exception
     except InvalidTokenError:
         raise credentials_exception
-    
-    # Get user from database
-    with SessionLocal() as session:
-        user = session.query(User).filter(User.username == username).first()
-        if user is None:
-            raise credentials_exception
+    # tokens from before refresh tokens existed carry no type and are access tokens
+    if payload.get("sub") is None or payload.get("type", "access") != token_type:
+        raise credentials_exception
+    # stateless mode relies on this to shut out deleted users, as it never looks them up
+    if revocation_list.is_revoked(payload.get("jti"), payload.get("uid"), payload.get("iat")):
+        raise credentials_exception
+    return payload
+
+# retrives the user based on the JWT
+def get_current_user(token: Annotated[str, Depends(oauth2_scheme)]):
+    payload = decode_token(token)
+    username = payload["sub"]
+
+    if settings.STATELESS_AUTH and "uid" in payload and "role" in payload:
+        # authorized by the signed claims alone, no lookup at all
+        return User(id=payload["uid"], username=username, role=payload["role"])
+
+    # Get user from the cache, or the database on a miss
+    user = get_user_by_username(username)
+    if user is None:
+        raise credentials_exception
     return user
 
 # require special role for access
@@ -57,4 +89,4 @@ def require_role(required_role: str):
         if current_user.role != required_role:
             raise HTTPException(status_code=403, detail="Insufficient permissions")
         return current_user
-    return role_checker
\ No newline at end of file
+    return role_checker
@@ -1,5 +1,7 @@
 from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 
 from app.config import settings
 
@@ -15,4 +17,9 @@ if settings.DATABASE_URL == "sqlite:///./grocery_inventory.db":
 
 Base = declarative_base()
 
-SessionLocal = sessionmaker(bind=engine)
\ No newline at end of file
+SessionLocal = sessionmaker(bind=engine)
+
+# INSERT construct with ON CONFLICT support for whichever database we're running on
+def insert_for(model):
+    insert = postgresql_insert if engine.dialect.name == "postgresql" else sqlite_insert
+    return insert(model)
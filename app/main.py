@@ -2,6 +2,7 @@ from fastapi import FastAPI
 from contextlib import asynccontextmanager
 
 from app.database import engine, Base
+from app.migrations import upgrade
 from app.routes.products import router as products_router
 from app.routes.users import router as users_router
 from app.routes.sales import router as sales_router
@@ -9,9 +10,14 @@ from app.routes.admin import router as admin_router
 from app.config import settings
 
 from app.scheduler import start_scheduler, scheduler
+from app.services.search import search_index, uses_trigram_index
+from app.services.revocation import revocation_list
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    if not uses_trigram_index:
+        search_index.load_from_database()
+    revocation_list.load_from_database()
     start_scheduler()
     yield
 
@@ -24,6 +30,7 @@ app = FastAPI(
 )
 
 Base.metadata.create_all(engine)
+upgrade(engine)
 
 app.include_router(products_router, prefix="/products", tags=["products"])
 app.include_router(users_router, prefix="/users", tags=["users"])
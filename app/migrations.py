@@ -0,0 +1,170 @@
+from typing import List
+from sqlalchemy import BigInteger, inspect, text
+from sqlalchemy.engine import Engine
+
+from app.database import Base, engine
+from app.services.sync import VERSION_SHIFT
+
+# Tables that predate delta sync and need a version column added
+VERSION_TABLES = ("products", "sales")
+# SQLite tables whose ids must never be handed out again, each with the tables still
+# holding ids that are gone from it. create_all only declares AUTOINCREMENT on new tables
+AUTOINCREMENT_TABLES = {
+    "users": (("revoked_users", "user_id"),),
+    # archived sales keep their ids, which new sales must not take
+    "sales": (("sales_archive", "id"),),
+}
+# Columns widened to BIGINT for transaction id based sync versions (Postgres only)
+BIGINT_COLUMNS = (
+    ("products", "version"), ("sales", "version"), ("sales_archive", "version"),
+    ("tombstones", "version"), ("sync_counter", "value"),
+)
+
+def upgrade(bind: Engine = engine) -> List[str]:
+    """
+    Bring tables created by an older release up to the models: create_all only creates
+    missing tables, never changes existing ones. Each step checks the live schema first,
+    so running it again does nothing. Returns a description of each change made.
+    """
+    applied = []
+    missing = []
+    with bind.begin() as connection:
+        inspector = inspect(connection)
+        postgres = connection.dialect.name == "postgresql"
+
+        if postgres:
+            # the products table only creates it when it's new, and both the trigram
+            # index and name search need it on databases from before search existed
+            connection.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+
+        for table in VERSION_TABLES:
+            if "version" in {column["name"] for column in inspector.get_columns(table)}:
+                continue
+            # existing rows are versioned below, once the column exists
+            connection.execute(text(f"ALTER TABLE {table} ADD COLUMN version BIGINT NOT NULL DEFAULT 0"))
+            applied.append(f"added {table}.version")
+
+        if postgres:
+            for table, name in BIGINT_COLUMNS:
+                column = next(column for column in inspector.get_columns(table) if column["name"] == name)
+                if not isinstance(column["type"], BigInteger):
+                    connection.execute(text(f"ALTER TABLE {table} ALTER COLUMN {name} TYPE BIGINT"))
+                    applied.append(f"widened {table}.{name}")
+
+        # snapshots used to cover movements up to an id watermark, which a movement
+        # committing late could slip under; movements now record when they were applied
+        if "applied_at" not in {column["name"] for column in inspector.get_columns("stock_movements")}:
+            connection.execute(text("ALTER TABLE stock_movements ADD COLUMN applied_at TIMESTAMP"))
+            connection.execute(text("UPDATE stock_movements SET applied_at = created_at WHERE applied"))
+            applied.append("added and backfilled stock_movements.applied_at")
+        if "movement_id" in {column["name"] for column in inspector.get_columns("stock_snapshots")}:
+            connection.execute(text("ALTER TABLE stock_snapshots DROP COLUMN movement_id"))
+            applied.append("dropped stock_snapshots.movement_id")
+
+        if not postgres:
+            for table, used_elsewhere in AUTOINCREMENT_TABLES.items():
+                if _rebuild_with_autoincrement(connection, table, used_elsewhere):
+                    applied.append(f"rebuilt {table} with AUTOINCREMENT")
+            inspector = inspect(connection)
+
+        # indexes added to tables that already existed. A failed concurrent build leaves
+        # an invalid index behind, which is dropped and built again
+        invalid = set()
+        if postgres:
+            invalid = set(connection.execute(text(
+                "SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid WHERE NOT i.indisvalid"
+            )).scalars())
+        for table in Base.metadata.sorted_tables:
+            existing = {index["name"] for index in inspector.get_indexes(table.name)} - invalid
+            missing.extend(
+                index for index in sorted(table.indexes, key=lambda index: index.name) if index.name not in existing
+            )
+        if not postgres:
+            for index in missing:
+                _create_index(connection, index, applied)
+
+    for table in VERSION_TABLES:
+        versioned = _backfill_versions(bind, table)
+        if versioned:
+            applied.append(f"versioned {versioned} {table} rows")
+
+    if postgres and missing:
+        # built concurrently, outside any transaction, so writes carry on during startup
+        with bind.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            for index in missing:
+                connection.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS "{index.name}"'))
+                options = index.dialect_options["postgresql"]
+                options["concurrently"] = True
+                try:
+                    _create_index(connection, index, applied)
+                finally:
+                    options["concurrently"] = False
+    return applied
+
+def _backfill_versions(bind: Engine, table: str) -> int:
+    """
+    Give every row still at version 0 a version of its own, numbered like the writes of
+    one transaction (see services/sync.py). Sync pages by version alone, so rows sharing
+    one would stall it. Returns the number of rows versioned
+    """
+    total = 0
+    while True:
+        with bind.begin() as connection:
+            if connection.dialect.name == "postgresql":
+                # one transaction id numbers at most 1 << VERSION_SHIFT rows
+                first, limit = f"(pg_current_xact_id()::text::bigint << {VERSION_SHIFT})", 1 << VERSION_SHIFT
+            else:
+                first, limit = "(SELECT value FROM sync_counter WHERE id = 1) + 1", -1
+            count = connection.execute(text(
+                f"UPDATE {table} SET version = numbered.version FROM ("
+                f"SELECT id, {first} + row_number() OVER (ORDER BY id) - 1 AS version "
+                f"FROM {table} WHERE version = 0 ORDER BY id LIMIT {limit}"
+                f") AS numbered WHERE {table}.id = numbered.id"
+            )).rowcount
+            if connection.dialect.name != "postgresql":
+                connection.execute(text(f"UPDATE sync_counter SET value = value + {count} WHERE id = 1"))
+        total += count
+        if count == 0 or count != limit:
+            return total
+
+def _rebuild_with_autoincrement(connection, table: str, used_elsewhere) -> bool:
+    """
+    Recreate a SQLite table from its model, which declares AUTOINCREMENT, and copy its
+    rows across. Without it SQLite reuses the highest id once that row is deleted.
+    The sequence starts above every id the table or used_elsewhere has seen.
+    Returns False if the table already has AUTOINCREMENT
+    """
+    sql = connection.execute(
+        text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :table"), {"table": table}
+    ).scalar_one()
+    if "AUTOINCREMENT" in sql.upper():
+        return False
+    model = Base.metadata.tables[table]
+    connection.execute(text(f"ALTER TABLE {table} RENAME TO {table}_old"))
+    # the indexes moved with the table, and the new table's are created under the same names
+    indexes = connection.execute(text(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = :table AND sql IS NOT NULL"
+    ), {"table": f"{table}_old"}).scalars().all()
+    for name in indexes:
+        connection.execute(text(f'DROP INDEX "{name}"'))
+    model.create(connection)
+    columns = ", ".join(column.name for column in model.columns)
+    connection.execute(text(f"INSERT INTO {table} ({columns}) SELECT {columns} FROM {table}_old"))
+    connection.execute(text(f"DROP TABLE {table}_old"))
+    highest = max(
+        [connection.execute(text(f"SELECT COALESCE(MAX(id), 0) FROM {table}")).scalar_one()] + [
+            connection.execute(text(f"SELECT COALESCE(MAX({column}), 0) FROM {other}")).scalar_one()
+            for other, column in used_elsewhere
+        ]
+    )
+    connection.execute(text("DELETE FROM sqlite_sequence WHERE name = :table"), {"table": table})
+    connection.execute(
+        text("INSERT INTO sqlite_sequence (name, seq) VALUES (:table, :seq)"), {"table": table, "seq": highest}
+    )
+    return True
+
+def _create_index(connection, index, applied: List[str]) -> None:
+    index.create(connection)
+    # postgres only indexes are skipped elsewhere, so check it's really there
+    if inspect(connection).has_index(index.table.name, index.name):
+        applied.append(f"created index {index.name}")
@@ -0,0 +1,11 @@
+from sqlalchemy import Column, Integer, Float
+
+from app.database import Base
+
+# Running totals per report code, kept in step with products by every product write
+class InventorySummary(Base):
+    __tablename__ = 'inventory_summary'
+    report_code = Column(Integer, primary_key=True, autoincrement=False)
+    product_count = Column(Integer, nullable=False, default=0)
+    total_units = Column(Integer, nullable=False, default=0)
+    total_value = Column(Float, nullable=False, default=0.0)
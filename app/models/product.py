@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float
+from sqlalchemy import Column, Integer, BigInteger, String, Float, Index, DDL, event, text
 from sqlalchemy.orm import relationship
 
 from app.database import Base
@@ -12,10 +12,41 @@ class Product(Base):
     price = Column(Float, nullable=False)
     report_code = Column(Integer)
     reorder_threshold = Column(Integer)
+    # sync version of the last write (see services/sync.py). Every write reserves one;
+    # rows from before versioning are numbered by migrations.upgrade
+    version = Column(BigInteger, nullable=False, index=True)
+
+    # partial indexes holding only products at or below their reorder threshold,
+    # so the low stock report never scans the whole catalog
+    __table_args__ = (
+        Index(
+            'ix_products_low_stock', 'id',
+            sqlite_where=text('quantity <= reorder_threshold'),
+            postgresql_where=text('quantity <= reorder_threshold'),
+        ),
+        Index(
+            'ix_products_low_stock_report_code', 'report_code', 'id',
+            sqlite_where=text('quantity <= reorder_threshold'),
+            postgresql_where=text('quantity <= reorder_threshold'),
+        ),
+        # trigram index for prefix and fuzzy name search, postgres only
+        Index(
+            'ix_products_name_trgm', 'name',
+            postgresql_using='gin',
+            postgresql_ops={'name': 'gin_trgm_ops'},
+        ).ddl_if(dialect='postgresql'),
+    )
 
     sales = relationship(
         'Sale',
         back_populates="product",
         cascade="all, delete-orphan",
+        # let the database's ON DELETE CASCADE remove sales instead of loading them first
+        passive_deletes=True,
     )
-    
\ No newline at end of file
+
+event.listen(
+    Product.__table__,
+    'before_create',
+    DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(dialect='postgresql'),
+)
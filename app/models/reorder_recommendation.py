@@ -0,0 +1,11 @@
+from sqlalchemy import Column, Integer, Float, DateTime, ForeignKey
+
+from app.database import Base
+
+# Suggested reorder threshold per product, replaced wholesale by each recommendation run
+class ReorderRecommendation(Base):
+    __tablename__ = 'reorder_recommendations'
+    product_id = Column(Integer, ForeignKey('products.id', ondelete='CASCADE'), primary_key=True, autoincrement=False)
+    recommended_threshold = Column(Integer, nullable=False)
+    average_daily_demand = Column(Float, nullable=False)
+    computed_at = Column(DateTime, nullable=False)
@@ -0,0 +1,11 @@
+from datetime import datetime
+from sqlalchemy import Column, String, DateTime
+
+from app.database import Base
+
+# Token ids (jti) revoked before they expire. Rows can go once expires_at has passed
+class RevokedToken(Base):
+    __tablename__ = 'revoked_tokens'
+    jti = Column(String, primary_key=True)
+    expires_at = Column(DateTime, nullable=False, index=True)
+    revoked_at = Column(DateTime, nullable=False, default=datetime.now)
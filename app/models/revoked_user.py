@@ -0,0 +1,12 @@
+from datetime import datetime
+from sqlalchemy import Column, Integer, DateTime
+
+from app.database import Base
+
+# Deleted users whose tokens issued up to revoked_at must stop working. Rows can go once
+# expires_at has passed, when every such token has expired anyway
+class RevokedUser(Base):
+    __tablename__ = 'revoked_users'
+    user_id = Column(Integer, primary_key=True)
+    expires_at = Column(DateTime, nullable=False, index=True)
+    revoked_at = Column(DateTime, nullable=False, default=datetime.now)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, Float, Date, ForeignKey
+from sqlalchemy import Column, Integer, BigInteger, Float, Date, ForeignKey, Index
 from sqlalchemy.orm import relationship
 
 from app.database import Base
@@ -10,5 +10,19 @@ class Sale(Base):
     sale_price = Column(Float, nullable=False)
     sale_start = Column(Date, nullable=False)
     sale_end = Column(Date, nullable=False)
+    # sync version of the last write (see services/sync.py). Every write reserves one;
+    # rows from before versioning are numbered by migrations.upgrade
+    version = Column(BigInteger, nullable=False, index=True)
+
+    # "on sale at date d" is sale_end >= d AND sale_start <= d: leading with the end date
+    # skips every promotion that has already finished, however much history there is
+    # the product's sales overlapping a new one are found from the same leading end date,
+    # so checking for overlaps costs the same after years of promotions
+    __table_args__ = (
+        Index('ix_sales_end_start', 'sale_end', 'sale_start'),
+        Index('ix_sales_product_end_start', 'product_id', 'sale_end', 'sale_start'),
+        # archived sales keep their ids, so SQLite must never hand one out again
+        {'sqlite_autoincrement': True},
+    )
 
     product = relationship('Product', back_populates='sales')
\ No newline at end of file
@@ -0,0 +1,16 @@
+from datetime import datetime
+from sqlalchemy import Column, Integer, BigInteger, Float, Date, DateTime, ForeignKey
+
+from app.database import Base
+
+# Sales that ended longer ago than the retention, moved out of the live sales table.
+# Rows keep their original sale id
+class ArchivedSale(Base):
+    __tablename__ = 'sales_archive'
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    product_id = Column(Integer, ForeignKey('products.id', ondelete='CASCADE'), nullable=False, index=True)
+    sale_price = Column(Float, nullable=False)
+    sale_start = Column(Date, nullable=False)
+    sale_end = Column(Date, nullable=False, index=True)
+    version = Column(BigInteger, nullable=False, default=0)
+    archived_at = Column(DateTime, nullable=False, default=datetime.now)
@@ -0,0 +1,41 @@
+from datetime import datetime
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Index, text
+
+from app.database import Base
+
+# Append-only record of every change to a product's stock. Quantities are signed:
+# receipts add, sales and shrink subtract, adjustments go either way
+class StockMovement(Base):
+    __tablename__ = 'stock_movements'
+    id = Column(Integer, primary_key=True)
+    product_id = Column(Integer, ForeignKey('products.id', ondelete='CASCADE'), nullable=False)
+    kind = Column(String, nullable=False)
+    quantity = Column(Integer, nullable=False)
+    created_at = Column(DateTime, nullable=False, default=datetime.now)
+    # already reflected in products.quantity (checkouts apply theirs immediately), and
+    # since when: snapshots taken at or after applied_at include the movement
+    applied = Column(Boolean, nullable=False, default=False)
+    applied_at = Column(DateTime)
+
+    __table_args__ = (
+        # as-of queries read one product's ledger in time order
+        Index('ix_stock_movements_product_created', 'product_id', 'created_at'),
+        # compaction only ever looks at movements not yet folded in
+        Index(
+            'ix_stock_movements_pending', 'product_id',
+            sqlite_where=text('applied = 0'),
+            postgresql_where=text('applied = false'),
+        ),
+    )
+
+# products.quantity as of a compaction, covering every movement applied by taken_at
+class StockSnapshot(Base):
+    __tablename__ = 'stock_snapshots'
+    id = Column(Integer, primary_key=True)
+    product_id = Column(Integer, ForeignKey('products.id', ondelete='CASCADE'), nullable=False)
+    quantity = Column(Integer, nullable=False)
+    taken_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        Index('ix_stock_snapshots_product_taken', 'product_id', 'taken_at'),
+    )
@@ -0,0 +1,27 @@
+from sqlalchemy import Column, Integer, BigInteger, String, Index, DDL, event
+
+from app.database import Base
+
+# Single row holding the last sync version handed out (SQLite only; see services/sync.py)
+class SyncCounter(Base):
+    __tablename__ = 'sync_counter'
+    id = Column(Integer, primary_key=True)
+    value = Column(BigInteger, nullable=False)
+
+event.listen(
+    SyncCounter.__table__,
+    'after_create',
+    DDL('INSERT INTO sync_counter (id, value) VALUES (1, 0)'),
+)
+
+# Marks a deleted product (keyed by upc) or sale (keyed by id) for delta sync clients
+class Tombstone(Base):
+    __tablename__ = 'tombstones'
+    id = Column(Integer, primary_key=True)
+    entity = Column(String, nullable=False)
+    entity_key = Column(Integer, nullable=False)
+    version = Column(BigInteger, nullable=False)
+
+    __table_args__ = (
+        Index('ix_tombstones_entity_version', 'entity', 'version'),
+    )
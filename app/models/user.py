@@ -8,4 +8,7 @@ class User(Base):
     username = Column(String, unique=True, nullable=False)
     email = Column(String, unique=True, nullable=False)
     password_hash = Column(String, nullable=False)
-    role = Column(String, nullable=False)
\ No newline at end of file
+    role = Column(String, nullable=False)
+
+    # revoked user ids outlive the user, so SQLite must never hand one out again
+    __table_args__ = {'sqlite_autoincrement': True}
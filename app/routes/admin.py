@@ -1,9 +1,16 @@
-from fastapi import APIRouter  # , Depends
-# from typing import Annotated
+from fastapi import APIRouter, Depends
+from typing import Annotated
 
-# from app.models.user import User
+from app.models.user import User
+from app.database import SessionLocal
 from app.services.notifications import notification_service
-# from app.core.security import require_role
+from app.services.product_cache import product_cache
+from app.services.user_cache import user_cache
+from app.services.summary import rebuild_summary, check_summary
+from app.services.stock_ledger import run_compaction
+from app.services.reorder import run_recommendations
+from app.services.sale_archive import archive_expired_sales
+from app.core.security import require_role
 
 
 router = APIRouter()
@@ -15,4 +22,51 @@ def manual_check():
     return {
         "message": f"Checked sales. {notifications_sent} notifications sent.",
         "notifications_sent": notifications_sent
-    }
\ No newline at end of file
+    }
+
+# Hit/miss counters for sizing the in-process caches
+@router.get("/cache-stats")
+def cache_stats():
+    return {
+        "products": product_cache.stats(),
+        "users": user_cache.stats()
+    }
+
+# Recomputes the inventory summary from the products table. User must be a manager
+@router.post("/summary/rebuild")
+def rebuild_inventory_summary(_: Annotated[User, Depends(require_role("manager"))]):
+    with SessionLocal() as session:
+        report_codes = rebuild_summary(session)
+        session.commit()
+    return {"message": f"Summary rebuilt for {report_codes} report codes."}
+
+# Compares the maintained summary against a full aggregate. User must be a manager
+@router.get("/summary/check")
+def check_inventory_summary(_: Annotated[User, Depends(require_role("manager"))]):
+    with SessionLocal() as session:
+        mismatches = check_summary(session)
+    return {
+        "consistent": not mismatches,
+        "mismatches": mismatches
+    }
+
+# Folds pending stock movements into product quantities now instead of waiting for the
+# scheduled job. User must be a manager
+@router.post("/stock/compact")
+def compact_stock_ledger(_: Annotated[User, Depends(require_role("manager"))]):
+    products = run_compaction()
+    return {"message": f"Compacted stock for {products} products."}
+
+# Recomputes reorder threshold recommendations now instead of waiting for the nightly job.
+# User must be a manager
+@router.post("/reorder-recommendations/refresh")
+def refresh_reorder_recommendations(_: Annotated[User, Depends(require_role("manager"))]):
+    products = run_recommendations()
+    return {"message": f"Recommendations refreshed for {products} products."}
+
+# Moves sales past the retention window to the archive now instead of waiting for the
+# nightly job. User must be a manager
+@router.post("/sales/archive")
+def archive_sales(_: Annotated[User, Depends(require_role("manager"))]):
+    archived = archive_expired_sales()
+    return {"message": f"Archived {archived} sales."}
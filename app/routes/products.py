@@ -1,49 +1,394 @@
-from fastapi import APIRouter, Depends, HTTPException
-from typing import Annotated
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request
+from typing import Annotated, Literal, Optional
+from fastapi.responses import StreamingResponse
+from datetime import date, datetime
+import json
+from sqlalchemy import and_, func
 
 from app.models.product import Product
+from app.models.sale import Sale
+from app.models.inventory_summary import InventorySummary
+from app.models.reorder_recommendation import ReorderRecommendation
 from app.models.user import User
-from app.schemas.products import ProductCreate
+from app.schemas.products import (
+    ProductCreate, PriceCheckRequest, CheckoutRequest, ProductBulkDelete, PriceUpdate, StockMovementBatch
+)
 from app.database import SessionLocal
 from app.core.security import get_current_user, require_role
+from app.core.pagination import paginate
+from app.services.product_import import product_import_service
+from app.services.product_cache import product_cache, product_to_dict, get_product_by_upc
+from app.services.inventory import decrement_stock, record_sale, delete_products, update_prices
+from app.services.search import search_index, search_products
+from app.services.sale_index import sale_index
+from app.services.summary import record_changes
+from app.services.sync import reserve_versions, changes_since
+from app.services.stock_ledger import MOVEMENT_SIGNS, record_movements, on_hand_as_of
+from app.services.change_feed import (
+    change_feed, product_upserted, product_price, product_stock, product_deleted
+)
+from app.services.export import export_table, MEDIA_TYPES
 from app.config import settings
 
 router = APIRouter()
 
-# Gets all products with pagination
+# Gets all products with pagination, either by page number or by `after` cursor
 @router.get("/")
-def get_products(page: int = 1, size: int = settings.DEFAULT_PAGE_SIZE):
+def get_products(page: int = 1, size: int = settings.DEFAULT_PAGE_SIZE, after: Optional[str] = None):
     if size > settings.MAX_PAGE_SIZE:
         size = settings.MAX_PAGE_SIZE
     with SessionLocal() as session:
-        skip = (page - 1) * size
-        products = session.query(Product).offset(skip).limit(size).all()
+        products, next_cursor = paginate(session.query(Product), Product.id, page, size, after)
         return {
             "products": products,
-            "page": page,
-            "size": size
+            "page": page if after is None else None,
+            "size": size,
+            "next_cursor": next_cursor
         }
     
+# Products at or below their reorder threshold, optionally for one report code.
+# Paged with the `after` cursor
+@router.get("/low-stock")
+def get_low_stock(report_code: Optional[int] = None, size: int = settings.DEFAULT_PAGE_SIZE, after: Optional[str] = None):
+    if size > settings.MAX_PAGE_SIZE:
+        size = settings.MAX_PAGE_SIZE
+    with SessionLocal() as session:
+        query = session.query(Product).filter(Product.quantity <= Product.reorder_threshold)
+        if report_code is not None:
+            query = query.filter(Product.report_code == report_code)
+        products, next_cursor = paginate(query, Product.id, 1, size, after)
+        return {
+            "products": products,
+            "size": size,
+            "next_cursor": next_cursor
+        }
+
+# Suggested reorder thresholds from recent sales, next to the current ones, optionally for
+# one report code. Refreshed daily by the scheduler. Paged with the `after` cursor
+@router.get("/reorder-recommendations")
+def get_reorder_recommendations(
+    report_code: Optional[int] = None, size: int = settings.DEFAULT_PAGE_SIZE, after: Optional[str] = None
+):
+    if size > settings.MAX_PAGE_SIZE:
+        size = settings.MAX_PAGE_SIZE
+    with SessionLocal() as session:
+        query = session.query(
+            Product.id,
+            Product.upc,
+            Product.name,
+            Product.reorder_threshold,
+            ReorderRecommendation.recommended_threshold,
+            ReorderRecommendation.average_daily_demand,
+            ReorderRecommendation.computed_at
+        ).join(ReorderRecommendation, ReorderRecommendation.product_id == Product.id)
+        if report_code is not None:
+            query = query.filter(Product.report_code == report_code)
+        rows, next_cursor = paginate(query, Product.id, 1, size, after)
+        return {
+            "recommendations": [row._asdict() for row in rows],
+            "size": size,
+            "next_cursor": next_cursor
+        }
+
+# Searches product names by prefix, tolerating typos. Best matches first
+@router.get("/search")
+def search(q: Annotated[str, Query(min_length=1)], limit: Annotated[int, Query(ge=1, le=100)] = 20):
+    q = q.strip()
+    if not q:
+        # would otherwise prefix match every product
+        raise HTTPException(status_code=400, detail="Search query must not be blank")
+    with SessionLocal() as session:
+        results = search_products(session, q, limit)
+        return {
+            "products": [dict(product_to_dict(product), score=score) for product, score in results],
+            "query": q
+        }
+
+# Streams every product as NDJSON or CSV, optionally gzipped, without holding the table in memory
+@router.get("/export")
+def export_products(format: Literal["ndjson", "csv"] = "ndjson", gzip: bool = False):
+    filename = f"products.{format}" + (".gz" if gzip else "")
+    return StreamingResponse(
+        export_table(Product, format, compress=gzip),
+        media_type="application/gzip" if gzip else MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+# Server-sent events for product and sale changes, so registers can stop polling.
+# A new connection starts with a `ready` event carrying the current resume token.
+# Resume with the Last-Event-ID header (or `after`) to get only the events missed while away;
+# a `reset` event means too much was missed and the client must resync.
+# follow=false returns the backlog and closes instead of waiting for new events
+@router.get("/changes")
+async def product_changes(
+    request: Request,
+    after: Optional[str] = None,
+    last_event_id: Annotated[Optional[str], Header()] = None,
+    follow: bool = True
+):
+    token = last_event_id or after
+    sequence, missed = change_feed.resume(token)
+
+    async def events():
+        nonlocal sequence
+        if missed or token is None:
+            status = "reset" if missed else "ready"
+            yield f"id: {change_feed.token(sequence)}\nevent: {status}\ndata: {{}}\n\n"
+        while True:
+            if follow:
+                batch = await change_feed.wait(sequence, settings.CHANGE_FEED_HEARTBEAT_SECONDS)
+            else:
+                batch = change_feed.since(sequence)
+            for sequence, event in batch:
+                data = json.dumps(event, default=str, separators=(",", ":"))
+                yield f"id: {change_feed.token(sequence)}\nevent: change\ndata: {data}\n\n"
+            if not follow:
+                return
+            if not batch:
+                yield ": keep-alive\n\n"
+            if await request.is_disconnected():
+                return
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+# Delta sync for registers that can't hold a live connection: products written and upcs
+# deleted after `since`. Apply `deleted` before `products`, then call again with the returned
+# version until has_more is false
+@router.get("/sync")
+def sync_products(since: Annotated[int, Query(ge=0)] = 0, size: int = settings.DEFAULT_PAGE_SIZE):
+    if size > settings.MAX_PAGE_SIZE:
+        size = settings.MAX_PAGE_SIZE
+    with SessionLocal() as session:
+        changes = changes_since(session, Product, "product", since, size)
+        return {
+            "products": changes["rows"],
+            "deleted": changes["deleted"],
+            "version": changes["version"],
+            "has_more": changes["has_more"]
+        }
+
 # Creates a product. User must be logged in
 @router.post("/")
 def create_product(product_data: ProductCreate, _: Annotated[User, Depends(get_current_user)]):
     with SessionLocal() as session:
         try:
-            new_product = Product(**product_data.model_dump())
+            new_product = Product(**product_data.model_dump(), version=reserve_versions(session))
             session.add(new_product)
+            record_changes(session, after=[(new_product.report_code, new_product.quantity, new_product.price)])
+            session.flush()
+            record_movements(session, [{
+                "product_id": new_product.id, "kind": "adjustment", "quantity": new_product.quantity, "applied": True
+            }])
+            product = product_to_dict(new_product)
             session.commit()
+            product_cache.invalidate(product["upc"])
+            search_index.add(product["id"], product["name"])
+            change_feed.publish(product_upserted(product))
             return {"message": "Product created!"}
         except Exception:
             raise HTTPException(status_code=400, detail="Invalid product")
         
+# Imports many products from a CSV (with a header row) or NDJSON body, upserting on upc.
+# User must be logged in
+@router.post("/bulk")
+async def bulk_import_products(request: Request, _: Annotated[User, Depends(get_current_user)]):
+    content_type = request.headers.get("content-type", "")
+    if "csv" in content_type:
+        fmt = "csv"
+    elif "ndjson" in content_type or "jsonl" in content_type:
+        fmt = "ndjson"
+    else:
+        raise HTTPException(status_code=415, detail="Body must be text/csv or application/x-ndjson")
+    return await product_import_service.import_stream(request.stream(), fmt)
+
+# On hand units and value (quantity * price) per report code, read from the maintained summary
+@router.get("/summary")
+def get_inventory_summary():
+    with SessionLocal() as session:
+        rows = session.query(InventorySummary).order_by(InventorySummary.report_code).all()
+        return {
+            "report_codes": rows,
+            "total_units": sum(row.total_units for row in rows),
+            "total_value": round(sum(row.total_value for row in rows), 2)
+        }
+
+# Effective prices for a basket of upcs, applying any sale running today.
+# Resolves the whole basket with one joined query
+@router.post("/price-check")
+def price_check(request: PriceCheckRequest):
+    today = date.today()
+    with SessionLocal() as session:
+        rows = session.query(
+            Product.upc,
+            Product.name,
+            Product.price,
+            func.min(Sale.sale_price).label("sale_price")
+        ).outerjoin(
+            Sale,
+            and_(Sale.product_id == Product.id, Sale.sale_start <= today, Sale.sale_end >= today)
+        ).filter(
+            Product.upc.in_(set(request.upcs))
+        ).group_by(Product.id).all()
+
+    found = {row.upc: row for row in rows}
+    prices = []
+    for upc in request.upcs:
+        row = found.get(upc)
+        if row is None:
+            continue
+        prices.append({
+            "upc": row.upc,
+            "name": row.name,
+            "price": row.price,
+            "sale_price": row.sale_price,
+            "effective_price": row.sale_price if row.sale_price is not None else row.price
+        })
+    return {
+        "prices": prices,
+        "not_found": [upc for upc in dict.fromkeys(request.upcs) if upc not in found]
+    }
+
+# Records a basket sold at a register, decrementing stock for every item in one transaction.
+# Baskets that would take stock negative are rejected unless allow_negative is set; those
+# can't be refused, so they only append to the stock ledger and never wait on another
+# register. User must be logged in
+@router.post("/checkout")
+def checkout(basket: CheckoutRequest, _: Annotated[User, Depends(get_current_user)]):
+    totals = {}
+    for item in basket.items:
+        totals[item.upc] = totals.get(item.upc, 0) + item.quantity
+
+    with SessionLocal() as session:
+        if basket.allow_negative:
+            remaining = record_sale(session, totals)
+        else:
+            remaining = decrement_stock(session, totals)
+
+        not_found = [upc for upc in totals if upc not in remaining]
+        if not_found:
+            session.rollback()
+            raise HTTPException(status_code=404, detail={"message": "Product not found!", "upcs": not_found})
+
+        short = [
+            {"upc": upc, "requested": totals[upc], "available": quantity + totals[upc]}
+            for upc, quantity in remaining.items() if quantity < 0
+        ]
+        if short and not basket.allow_negative:
+            session.rollback()
+            raise HTTPException(status_code=409, detail={"message": "Insufficient stock", "items": short})
+
+        session.commit()
+    product_cache.invalidate_many(totals)
+    change_feed.publish(*(product_stock(upc, quantity) for upc, quantity in remaining.items()))
+    return {
+        "message": "Checkout complete!",
+        "remaining": [{"upc": upc, "quantity": quantity} for upc, quantity in remaining.items()],
+        "negative_stock": short
+    }
+
+# Appends receipts, sales, shrink and adjustments to the stock ledger in one batched insert.
+# Product rows aren't touched, so writers never queue on them; the compaction job folds
+# the movements into quantity later. User must be logged in
+@router.post("/movements")
+def record_stock_movements(batch: StockMovementBatch, _: Annotated[User, Depends(get_current_user)]):
+    upcs = {movement.upc for movement in batch.movements}
+    with SessionLocal() as session:
+        # the inserts share-lock each product they reference; taking those locks up front
+        # in id order keeps this from deadlocking with a delete locking the same products
+        ids = dict(session.query(Product.upc, Product.id).filter(
+            Product.upc.in_(upcs)
+        ).order_by(Product.id).with_for_update(read=True, key_share=True))
+        not_found = [upc for upc in dict.fromkeys(movement.upc for movement in batch.movements) if upc not in ids]
+        if not_found:
+            raise HTTPException(status_code=404, detail={"message": "Product not found!", "upcs": not_found})
+        recorded = record_movements(session, (
+            {
+                "product_id": ids[movement.upc],
+                "kind": movement.kind,
+                "quantity": MOVEMENT_SIGNS[movement.kind] * movement.quantity
+            }
+            for movement in batch.movements
+        ))
+        session.commit()
+    return {
+        "message": "Movements recorded!",
+        "recorded": recorded
+    }
+
+# Reprices a list of upcs or a whole report code in one statement. User must be a manager
+@router.patch("/prices")
+def patch_prices(change: PriceUpdate, _: Annotated[User, Depends(require_role("manager"))]):
+    with SessionLocal() as session:
+        updated = update_prices(session, change)
+        session.commit()
+    # one clear is cheaper than invalidating hundreds of upcs one by one
+    if updated:
+        product_cache.clear()
+    change_feed.publish(*(product_price(row.upc, row.price) for row in updated))
+    return {
+        "message": "Prices updated!",
+        "updated": len(updated)
+    }
+
 # deletes a product. User must be a manager
 @router.delete("/{upc}")
 def delete_product(upc: int, _: Annotated[User, Depends(require_role("manager"))]):
     with SessionLocal() as session:
-        product_to_delete = session.query(Product).filter(Product.upc == upc).first()
-        if product_to_delete:
-            session.delete(product_to_delete)
+        deleted = delete_products(session, [upc])
+        if deleted:
             session.commit()
+            product_cache.invalidate(upc)
+            search_index.remove(deleted[0].id)
+            sale_index.remove_products([deleted[0].id])
+            change_feed.publish(product_deleted(upc))
             return {"message": "Product deleted!"}
         else:
-            raise HTTPException(status_code=404, detail="Product not found!")
\ No newline at end of file
+            raise HTTPException(status_code=404, detail="Product not found!")
+
+# deletes many products by upc, along with their sales. User must be a manager
+@router.delete("/")
+def bulk_delete_products(request: ProductBulkDelete, _: Annotated[User, Depends(require_role("manager"))]):
+    with SessionLocal() as session:
+        deleted = delete_products(session, set(request.upcs))
+        session.commit()
+    product_cache.invalidate_many(row.upc for row in deleted)
+    for row in deleted:
+        search_index.remove(row.id)
+    sale_index.remove_products(row.id for row in deleted)
+    change_feed.publish(*(product_deleted(row.upc) for row in deleted))
+    deleted_upcs = {row.upc for row in deleted}
+    return {
+        "message": "Products deleted!",
+        "deleted": len(deleted),
+        "not_found": [upc for upc in dict.fromkeys(request.upcs) if upc not in deleted_upcs]
+    }
+
+# Units on hand at a point in time (default now), from the latest stock snapshot plus
+# the movements recorded after it
+@router.get("/{upc}/stock")
+def get_stock_as_of(upc: int, as_of: Optional[datetime] = None):
+    if as_of is None:
+        as_of = datetime.now()
+    elif as_of.tzinfo is not None:
+        # the ledger stores local server time
+        as_of = as_of.astimezone().replace(tzinfo=None)
+    with SessionLocal() as session:
+        product = session.query(Product).filter(Product.upc == upc).first()
+        if product is None:
+            raise HTTPException(status_code=404, detail="Product not found!")
+        on_hand, snapshot_at = on_hand_as_of(session, product, as_of)
+    return {
+        "upc": upc,
+        "as_of": as_of,
+        "on_hand": on_hand,
+        "snapshot_at": snapshot_at
+    }
+
+# Looks up a single product by upc, served from the product cache when possible.
+# Declared last so it doesn't shadow the other GET routes
+@router.get("/{upc}")
+def get_product(upc: int):
+    product = get_product_by_upc(upc)
+    if product is None:
+        raise HTTPException(status_code=404, detail="Product not found!")
+    return product
@@ -1,41 +1,186 @@
-from fastapi import APIRouter, HTTPException, Depends
-from typing import Annotated
+from fastapi import APIRouter, HTTPException, Depends, Query, Request
+from typing import Annotated, Literal, Optional
+from datetime import date
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import delete, select
+from sqlalchemy.orm import joinedload
 
 from app.models.sale import Sale
-from app.schemas.sales import SaleCreate
+from app.models.product import Product
+from app.schemas.sales import SaleCreate, SaleBulkDelete
 from app.database import SessionLocal
 from app.models.user import User
 from app.core.security import require_role, get_current_user
+from app.core.pagination import paginate
+from app.services.export import export_table, MEDIA_TYPES
+from app.services.change_feed import change_feed, sale_created, sale_deleted
+from app.services.sync import reserve_versions, record_tombstones, changes_since
+from app.services.sale_index import sale_index, sale_to_dict, overlapping_sales, sale_conflict
+from app.services.sale_import import parse_flyer, import_flyer
+from app.services.product_cache import product_to_dict
+from app.services.sale_archive import live_and_archived_sales
 from app.config import settings
 
 router = APIRouter()
 
-# lists all sales
+# lists all sales, by page number or by `after` cursor.
+# expand=product embeds each sale's product, fetched in the same query.
+# include_archived=true also lists sales moved to the archive, flagged with `archived`
 @router.get("/")
-def get_sales(page: int = 1, size: int = settings.DEFAULT_PAGE_SIZE):
+def get_sales(
+    page: int = 1,
+    size: int = settings.DEFAULT_PAGE_SIZE,
+    after: Optional[str] = None,
+    expand: Optional[Literal["product"]] = None,
+    include_archived: bool = False
+):
     if size > settings.MAX_PAGE_SIZE:
         size = settings.MAX_PAGE_SIZE
     with SessionLocal() as session:
-        skip = (page - 1) * size
-        sales = session.query(Sale).offset(skip).limit(size).all()
+        if include_archived:
+            all_sales = live_and_archived_sales()
+            rows, next_cursor = paginate(session.query(all_sales), all_sales.c.id, page, size, after)
+            sales = [row._asdict() for row in rows]
+            if expand == "product":
+                # one query for every product on the page
+                products = {
+                    product.id: product_to_dict(product)
+                    for product in session.query(Product).filter(Product.id.in_({sale["product_id"] for sale in sales}))
+                }
+                sales = [dict(sale, product=products.get(sale["product_id"])) for sale in sales]
+            return {
+                "sales": sales,
+                "page": page if after is None else None,
+                "size": size,
+                "next_cursor": next_cursor
+            }
+
+        query = session.query(Sale)
+        if expand == "product":
+            query = query.options(joinedload(Sale.product))
+        sales, next_cursor = paginate(query, Sale.id, page, size, after)
+        if expand == "product":
+            sales = [dict(sale_to_dict(sale), product=product_to_dict(sale.product)) for sale in sales]
         return {
             "sales": sales,
-            "page": page,
-            "size": size
+            "page": page if after is None else None,
+            "size": size,
+            "next_cursor": next_cursor
         }
     
-# creates a sale, must be logged in
+# Streams every sale as NDJSON or CSV, optionally gzipped, without holding the table in memory
+@router.get("/export")
+def export_sales(format: Literal["ndjson", "csv"] = "ndjson", gzip: bool = False):
+    filename = f"sales.{format}" + (".gz" if gzip else "")
+    return StreamingResponse(
+        export_table(Sale, format, compress=gzip),
+        media_type="application/gzip" if gzip else MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+# Delta sync of sales: sales written and sale ids deleted after `since`.
+# Apply `deleted` before `sales`, then call again with the returned version until has_more is false
+@router.get("/sync")
+def sync_sales(since: Annotated[int, Query(ge=0)] = 0, size: int = settings.DEFAULT_PAGE_SIZE):
+    if size > settings.MAX_PAGE_SIZE:
+        size = settings.MAX_PAGE_SIZE
+    with SessionLocal() as session:
+        changes = changes_since(session, Sale, "sale", since, size)
+        return {
+            "sales": changes["rows"],
+            "deleted": changes["deleted"],
+            "version": changes["version"],
+            "has_more": changes["has_more"]
+        }
+
+# Sales running on a date (default today). For one product the in-memory interval index
+# answers without touching the database; otherwise the (sale_end, sale_start) index skips
+# finished promotions. Paged with the `after` cursor
+@router.get("/active")
+def get_active_sales(
+    on: Annotated[Optional[date], Query(alias="date")] = None,
+    product_id: Optional[int] = None,
+    size: int = settings.DEFAULT_PAGE_SIZE,
+    after: Optional[str] = None
+):
+    if size > settings.MAX_PAGE_SIZE:
+        size = settings.MAX_PAGE_SIZE
+    if on is None:
+        on = date.today()
+    if product_id is not None:
+        return {
+            "date": on,
+            "sales": sale_index.active(product_id, on),
+            "size": size,
+            "next_cursor": None
+        }
+    with SessionLocal() as session:
+        query = session.query(Sale).filter(Sale.sale_end >= on, Sale.sale_start <= on)
+        sales, next_cursor = paginate(query, Sale.id, 1, size, after)
+        return {
+            "date": on,
+            "sales": sales,
+            "size": size,
+            "next_cursor": next_cursor
+        }
+
+# creates a sale, must be logged in. A sale overlapping another one for the same product
+# is rejected with the conflicting sales, so the effective price is never ambiguous
 @router.post("/")
 def create_sale(sale_data: SaleCreate, _: Annotated[User, Depends(get_current_user)]):
     with SessionLocal() as session:
+        # locking the product (and, on SQLite, taking the write lock with the version)
+        # stops two overlapping sales passing the check at the same time
+        product = session.query(Product.id).filter(
+            Product.id == sale_data.product_id
+        ).with_for_update(key_share=True).first()
+        version = reserve_versions(session)
+        if product is None:
+            raise HTTPException(status_code=400, detail="Invalid sale")
+        conflicts = overlapping_sales(session, sale_data.product_id, sale_data.sale_start, sale_data.sale_end)
+        if conflicts:
+            raise HTTPException(status_code=409, detail={
+                "message": "Sale overlaps an existing sale",
+                "conflicts": [sale_conflict(sale) for sale in conflicts]
+            })
         try:
-            new_sale = Sale(**sale_data.model_dump())
+            new_sale = Sale(**sale_data.model_dump(), version=version)
             session.add(new_sale)
+            session.flush()
+            sale = sale_to_dict(new_sale)
             session.commit()
+            sale_index.add(sale)
+            change_feed.publish(sale_created(sale))
             return {"message": "Sale created!"}
         except Exception:
             raise HTTPException(status_code=400, detail="Invalid sale")
     
+# Creates a whole weekly flyer of sales from a JSON array or CSV (with a header row) keyed
+# by upc, in one transaction. Rows that are invalid, name an unknown upc or overlap another
+# sale are skipped and reported. User must be logged in
+@router.post("/bulk")
+async def bulk_create_sales(request: Request, _: Annotated[User, Depends(get_current_user)]):
+    content_type = request.headers.get("content-type", "")
+    if "csv" in content_type:
+        fmt = "csv"
+    elif "json" in content_type:
+        fmt = "json"
+    else:
+        raise HTTPException(status_code=415, detail="Body must be text/csv or application/json")
+    try:
+        processed, items, errors = parse_flyer(await request.body(), fmt)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid flyer: {e}")
+
+    created, row_errors = await run_in_threadpool(import_flyer, items)
+    errors = sorted(errors + row_errors, key=lambda e: e["row"])
+    return {
+        "processed": processed,
+        "created": len(created),
+        "errors": errors
+    }
+
 # deletes a sale, must be a manager
 @router.delete("/{sale_id}")
 def delete_sale(sale_id: int, _: Annotated[User, Depends(require_role("manager"))]):
@@ -43,7 +188,37 @@ def delete_sale(sale_id: int, _: Annotated[User, Depends(require_role("manager")
         sale_to_delete = session.query(Sale).filter(Sale.id == sale_id).first()
         if sale_to_delete:
             session.delete(sale_to_delete)
+            record_tombstones(session, "sale", [sale_id])
             session.commit()
+            sale_index.remove([sale_id])
+            change_feed.publish(sale_deleted(sale_id))
             return {"message": "Sale deleted!"}
         else:
-            raise HTTPException(status_code=404, detail="Sale not found!")
\ No newline at end of file
+            raise HTTPException(status_code=404, detail="Sale not found!")
+
+# deletes many sales by id or by end date range in one statement, must be a manager
+@router.delete("/")
+def bulk_delete_sales(request: SaleBulkDelete, _: Annotated[User, Depends(require_role("manager"))]):
+    conditions = []
+    if request.ids is not None:
+        conditions.append(Sale.id.in_(request.ids))
+    if request.end_from is not None:
+        conditions.append(Sale.sale_end >= request.end_from)
+    if request.end_to is not None:
+        conditions.append(Sale.sale_end <= request.end_to)
+    stmt = delete(Sale).where(*conditions).execution_options(synchronize_session=False)
+
+    with SessionLocal() as session:
+        if session.get_bind().dialect.delete_returning:
+            deleted_ids = session.execute(stmt.returning(Sale.id)).scalars().all()
+        else:
+            deleted_ids = session.execute(select(Sale.id).where(*conditions)).scalars().all()
+            session.execute(stmt)
+        record_tombstones(session, "sale", deleted_ids)
+        session.commit()
+    sale_index.remove(deleted_ids)
+    change_feed.publish(*(sale_deleted(sale_id) for sale_id in deleted_ids))
+    return {
+        "message": "Sales deleted!",
+        "deleted": len(deleted_ids)
+    }
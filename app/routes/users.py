@@ -1,27 +1,38 @@
-from fastapi import APIRouter, HTTPException, Depends, status
-from typing import Annotated
+from fastapi import APIRouter, HTTPException, Depends, Request, status
+from typing import Annotated, Optional
+from datetime import datetime, timedelta
 from fastapi.security import OAuth2PasswordRequestForm
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy.exc import IntegrityError
 
 from app.models.user import User
-from app.schemas.users import UserCreate
+from app.schemas.users import UserCreate, RefreshRequest, LogoutRequest, RevokeRequest
 from app.database import SessionLocal
-from app.core.security import hash_password, verify_password, create_access_token, require_role, get_current_user
+from app.core.security import (
+    create_user_token, create_refresh_token, decode_token, credentials_exception,
+    require_role, get_current_user, oauth2_scheme
+)
+from app.core.pagination import paginate
+from app.services.user_cache import user_cache
+from app.services.password_hasher import password_hasher
+from app.services.login_limiter import check_login_allowed, client_ip
+from app.services.revocation import revocation_list, revoke_token, revoke_user
 from app.config import settings
 
 router = APIRouter()
 
-# get all users with pagination
+# get all users with pagination, by page number or by `after` cursor
 @router.get("/")
-def get_users(page: int = 1, size: int = settings.DEFAULT_PAGE_SIZE):
+def get_users(page: int = 1, size: int = settings.DEFAULT_PAGE_SIZE, after: Optional[str] = None):
     if size > settings.MAX_PAGE_SIZE:
         size = settings.MAX_PAGE_SIZE
     with SessionLocal() as session:
-        skip = (page - 1) * size
-        users = session.query(User).offset(skip).limit(size).all()
+        users, next_cursor = paginate(session.query(User), User.id, page, size, after)
         return {
             "users": users,
-            "page": page,
-            "size": size
+            "page": page if after is None else None,
+            "size": size,
+            "next_cursor": next_cursor
         }
     
 # get info on currently authenticated user
@@ -33,36 +44,45 @@ def get_current_user_info(current_user: Annotated[User, Depends(get_current_user
         "role": current_user.role
     }
 
-# create new user
-@router.post("/register")
-def register(user_data: UserCreate):
+def find_user(username: str):
     with SessionLocal() as session:
-        matching_user = session.query(User).filter(User.username == user_data.username).first()
-        if matching_user:
-            raise HTTPException(status_code=400, detail="User already registered")
-        else:
-            user_dict = user_data.model_dump()
-            user_dict['password_hash'] = hash_password(user_data.password)
-            del user_dict['password']
-            new_user = User(**user_dict)
-            session.add(new_user)
+        return session.query(User).filter(User.username == username).first()
+
+def add_user(user_dict: dict):
+    with SessionLocal() as session:
+        try:
+            session.add(User(**user_dict))
             session.commit()
-            return {"message": "User created!"}
+        except IntegrityError:
+            # registered by someone else while the password was hashing
+            raise HTTPException(status_code=400, detail="User already registered")
+
+# create new user. Hashing runs in the password worker pool, off the request threads
+@router.post("/register")
+async def register(user_data: UserCreate):
+    if await run_in_threadpool(find_user, user_data.username):
+        raise HTTPException(status_code=400, detail="User already registered")
+    user_dict = user_data.model_dump()
+    user_dict['password_hash'] = await password_hasher.hash(user_data.password)
+    del user_dict['password']
+    await run_in_threadpool(add_user, user_dict)
+    return {"message": "User created!"}
 
 # verify password for login attempt
-def authenticate_user(username: str, password: str):
-    with SessionLocal() as session:
-        user = session.query(User).filter(User.username == username).first()
-        if not user:
-            return False
-        if not verify_password(password, user.password_hash):
-            return False
-        return user
+async def authenticate_user(username: str, password: str):
+    user = await run_in_threadpool(find_user, username)
+    if not user:
+        return False
+    if not await password_hasher.verify(password, user.password_hash):
+        return False
+    return user
 
-# gets a JWT token
+# gets a JWT token. Attempts are rate limited per username and per client IP before
+# any password is checked
 @router.post("/login")
-def login(form_data: Annotated[OAuth2PasswordRequestForm, Depends()]):
-    user = authenticate_user(form_data.username, form_data.password)
+async def login(request: Request, form_data: Annotated[OAuth2PasswordRequestForm, Depends()]):
+    check_login_allowed(form_data.username, client_ip(request))
+    user = await authenticate_user(form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -70,18 +90,67 @@ def login(form_data: Annotated[OAuth2PasswordRequestForm, Depends()]):
             headers={"WWW-Authenticate": "Bearer"},
         )
     return {
-        "access_token": create_access_token({"sub": user.username}),
+        "access_token": create_user_token(user),
+        "refresh_token": create_refresh_token(user),
+        "token_type": "bearer"
+    }
+
+# swaps a refresh token for a new access token, re-reading the user so a changed role
+# or a deleted account takes effect here
+@router.post("/refresh")
+def refresh(request: RefreshRequest):
+    payload = decode_token(request.refresh_token, token_type="refresh")
+    user = find_user(payload["sub"])
+    if user is None or user.id != payload.get("uid"):
+        raise credentials_exception
+    return {
+        "access_token": create_user_token(user),
         "token_type": "bearer"
     }
 
+# Revokes the token used for this request, and the refresh token if given, so neither
+# works again even before it expires
+@router.post("/logout")
+def logout(token: Annotated[str, Depends(oauth2_scheme)], request: Optional[LogoutRequest] = None):
+    claims = [decode_token(token)]
+    if request is not None and request.refresh_token is not None:
+        refresh_claims = decode_token(request.refresh_token, token_type="refresh")
+        if refresh_claims["sub"] != claims[0]["sub"]:
+            raise HTTPException(status_code=400, detail="Refresh token belongs to another user")
+        claims.append(refresh_claims)
+    revoked = [payload["jti"] for payload in claims if "jti" in payload]
+    with SessionLocal() as session:
+        for payload in claims:
+            if "jti" in payload:
+                revoke_token(session, payload["jti"], datetime.fromtimestamp(payload["exp"]))
+        session.commit()
+    for jti in revoked:
+        revocation_list.add(jti)
+    return {"message": "Logged out!"}
+
+# Revokes any token by id, e.g. one reported stolen. User must be a manager
+@router.post("/revoke")
+def revoke(request: RevokeRequest, _: Annotated[User, Depends(require_role("manager"))]):
+    # the token itself isn't at hand, so keep the entry as long as any token can live
+    lifetime = max(settings.ACCESS_TOKEN_EXPIRE_MINUTES, settings.REFRESH_TOKEN_EXPIRE_MINUTES)
+    with SessionLocal() as session:
+        revoke_token(session, request.jti, datetime.now() + timedelta(minutes=lifetime))
+        session.commit()
+    revocation_list.add(request.jti)
+    return {"message": "Token revoked!"}
+
 # Delete a user by id. User must be a manager
 @router.delete("/{user_id}")
 def delete_user(user_id: int, _: Annotated[User, Depends(require_role("manager"))]):
     with SessionLocal() as session:
         user_to_delete = session.query(User).filter(User.id == user_id).first()
         if user_to_delete:
+            username = user_to_delete.username
             session.delete(user_to_delete)
+            revoked_at = revoke_user(session, user_id)
             session.commit()
+            user_cache.invalidate(username)
+            revocation_list.add_user(user_id, revoked_at)
             return {"message": "User deleted!"}
         else:
             raise HTTPException(status_code=404, detail="User not found!")
\ No newline at end of file
@@ -1,9 +1,15 @@
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
 from datetime import datetime
 import atexit
 
+from app.config import settings
 from app.services.notifications import notification_service
+from app.services.stock_ledger import run_compaction
+from app.services.reorder import run_recommendations
+from app.services.sale_archive import archive_expired_sales
+from app.services.revocation import revocation_list, purge_expired_revocations
 
 scheduler = BackgroundScheduler()
 
@@ -13,14 +19,68 @@ def daily_notification_check():
     notifications_sent = notification_service.process_expiring_sales()
     print(f"Sent {notifications_sent} notifications")
 
+def stock_compaction():
+    """Fold pending stock movements into product quantities"""
+    products = run_compaction()
+    print(f"Compacted stock for {products} products at {datetime.now()}")
+
+def reorder_recommendations():
+    """Run nightly at 2 AM, after the day's sales are in"""
+    products = run_recommendations()
+    print(f"Refreshed reorder recommendations for {products} products at {datetime.now()}")
+
+def sale_archival():
+    """Run nightly at 3 AM, moving long finished sales out of the live table"""
+    archived = archive_expired_sales()
+    print(f"Archived {archived} sales at {datetime.now()}")
+
+def revocation_reload():
+    """Run every few seconds: pick up tokens and users other processes have revoked"""
+    revocation_list.load_from_database()
+
+def revocation_purge():
+    """Run hourly: forget revocations of tokens that have expired anyway"""
+    removed = purge_expired_revocations()
+    print(f"Purged {removed} expired revocations at {datetime.now()}")
+
 def start_scheduler():
-    """Start daily notifications"""
+    """Start daily notifications, stock compaction, reorder recommendations, sale archival, revocation reloads and purges"""
     scheduler.add_job(
         func=daily_notification_check,
         trigger=CronTrigger(hour=9, minute=0, timezone="America/Los_Angeles"),
         id='daily_notifications',
         replace_existing=True
     )
+    scheduler.add_job(
+        func=stock_compaction,
+        trigger=IntervalTrigger(minutes=settings.STOCK_COMPACTION_MINUTES),
+        id='stock_compaction',
+        replace_existing=True
+    )
+    scheduler.add_job(
+        func=reorder_recommendations,
+        trigger=CronTrigger(hour=2, minute=0, timezone="America/Los_Angeles"),
+        id='reorder_recommendations',
+        replace_existing=True
+    )
+    scheduler.add_job(
+        func=sale_archival,
+        trigger=CronTrigger(hour=3, minute=0, timezone="America/Los_Angeles"),
+        id='sale_archival',
+        replace_existing=True
+    )
+    scheduler.add_job(
+        func=revocation_reload,
+        trigger=IntervalTrigger(seconds=settings.REVOCATION_RELOAD_SECONDS),
+        id='revocation_reload',
+        replace_existing=True
+    )
+    scheduler.add_job(
+        func=revocation_purge,
+        trigger=IntervalTrigger(hours=1),
+        id='revocation_purge',
+        replace_existing=True
+    )
     scheduler.start()
     atexit.register(lambda: scheduler.shutdown())
     print("Daily notification scheduler started")
\ No newline at end of file
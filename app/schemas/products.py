@@ -1,4 +1,5 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, model_validator
+from typing import List, Literal, Optional
 
 # Pydantic schema for validating product creation
 class ProductCreate(BaseModel):
@@ -7,4 +8,56 @@ class ProductCreate(BaseModel):
     quantity: int
     price: float
     report_code: int
-    reorder_threshold: int
\ No newline at end of file
+    reorder_threshold: int
+
+# Pydantic schema for a basket price check
+class PriceCheckRequest(BaseModel):
+    upcs: List[int] = Field(min_length=1, max_length=1000)
+
+# Pydantic schemas for a point of sale checkout
+class CheckoutItem(BaseModel):
+    upc: int
+    quantity: int = Field(gt=0)
+
+class CheckoutRequest(BaseModel):
+    items: List[CheckoutItem] = Field(min_length=1, max_length=1000)
+    # record the sale even if it takes stock below zero, flagging the items instead
+    allow_negative: bool = False
+
+# Pydantic schemas for appending to the stock ledger. Receipts, sales and shrink
+# take a positive quantity; adjustments are signed
+class StockMovementCreate(BaseModel):
+    upc: int
+    kind: Literal["receipt", "sale", "shrink", "adjustment"]
+    quantity: int
+
+    @model_validator(mode='after')
+    def quantity_matches_kind(self):
+        if self.quantity == 0:
+            raise ValueError('quantity must not be 0')
+        if self.kind != "adjustment" and self.quantity < 0:
+            raise ValueError('quantity must be positive unless kind is adjustment')
+        return self
+
+class StockMovementBatch(BaseModel):
+    movements: List[StockMovementCreate] = Field(min_length=1, max_length=10000)
+
+# Pydantic schema for deleting many products at once
+class ProductBulkDelete(BaseModel):
+    upcs: List[int] = Field(min_length=1, max_length=10000)
+
+# Pydantic schema for repricing a list of upcs or a whole report code.
+# Either sets an absolute price or applies a percentage markup (negative for a markdown)
+class PriceUpdate(BaseModel):
+    upcs: Optional[List[int]] = Field(default=None, min_length=1, max_length=10000)
+    report_code: Optional[int] = None
+    price: Optional[float] = Field(default=None, gt=0)
+    markup_percent: Optional[float] = Field(default=None, gt=-100)
+
+    @model_validator(mode='after')
+    def one_target_and_one_change(self):
+        if (self.upcs is None) == (self.report_code is None):
+            raise ValueError('Give either upcs or report_code')
+        if (self.price is None) == (self.markup_percent is None):
+            raise ValueError('Give either price or markup_percent')
+        return self
@@ -1,5 +1,6 @@
-from pydantic import BaseModel, field_validator
+from pydantic import BaseModel, Field, field_validator, model_validator
 from datetime import date
+from typing import List, Optional
 
 # Pydantic schema for validating product creation
 class SaleCreate(BaseModel):
@@ -13,4 +14,31 @@ class SaleCreate(BaseModel):
     def end_date_after_start_date(cls, v, info):
         if 'sale_start' in info.data and v < info.data['sale_start']:
             raise ValueError('End date must be after start date')
-        return v
\ No newline at end of file
+        return v
+
+# Pydantic schema for one row of a weekly flyer, keyed by upc rather than product id
+class SaleFlyerItem(BaseModel):
+    upc: int
+    sale_price: float
+    sale_start: date
+    sale_end: date
+
+    @field_validator('sale_end')
+    @classmethod
+    def end_date_after_start_date(cls, v, info):
+        if 'sale_start' in info.data and v < info.data['sale_start']:
+            raise ValueError('End date must be after start date')
+        return v
+
+# Pydantic schema for deleting many sales, either by id or by an inclusive range their end date falls in
+class SaleBulkDelete(BaseModel):
+    ids: Optional[List[int]] = Field(default=None, min_length=1, max_length=10000)
+    end_from: Optional[date] = None
+    end_to: Optional[date] = None
+
+    @model_validator(mode='after')
+    def ids_or_date_range(self):
+        has_range = self.end_from is not None or self.end_to is not None
+        if (self.ids is None) == (not has_range):
+            raise ValueError('Give either ids or an end date range')
+        return self
@@ -1,8 +1,21 @@
 from pydantic import BaseModel
+from typing import Optional
 
 # Pydantic schema for validating product creation
 class UserCreate(BaseModel):
     username: str
     password: str
     email: str
-    role: str
\ No newline at end of file
+    role: str
+
+# Pydantic schema for exchanging a refresh token for a new access token
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
+# Pydantic schema for logging out, optionally revoking the session's refresh token too
+class LogoutRequest(BaseModel):
+    refresh_token: Optional[str] = None
+
+# Pydantic schema for revoking any token by its id
+class RevokeRequest(BaseModel):
+    jti: str
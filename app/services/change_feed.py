@@ -0,0 +1,110 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import List, Optional, Tuple
+
+from app.config import settings
+
+class ChangeFeed:
+    """
+    Bounded in-memory log of product and sale changes for registers to follow.
+    Every event gets a resume token "<epoch>-<sequence>"; the epoch changes on restart,
+    so a token from an older process (or one that fell out of the buffer) asks for a resync.
+    """
+
+    def __init__(self, maxlen: int):
+        self.epoch = format(time.time_ns(), "x")
+        self._events = deque(maxlen=maxlen)   # (sequence, event)
+        self._last = 0
+        self._lock = threading.Lock()
+        self._waiters = set()                 # (event loop, asyncio.Event)
+
+    def token(self, sequence: int) -> str:
+        return f"{self.epoch}-{sequence}"
+
+    def publish(self, *events: dict) -> None:
+        if not events:
+            return
+        with self._lock:
+            for event in events:
+                self._last += 1
+                self._events.append((self._last, event))
+            waiters = list(self._waiters)
+        # writers run in worker threads, so wake each listener on its own loop
+        for loop, waiter in waiters:
+            try:
+                loop.call_soon_threadsafe(waiter.set)
+            except RuntimeError:
+                pass  # loop already closed
+
+    def resume(self, token: Optional[str]) -> Tuple[int, bool]:
+        """
+        Position to read from for a resume token, and whether the client missed events
+        it can't get back (so must resync). No token means start from now.
+        """
+        with self._lock:
+            oldest = self._events[0][0] if self._events else self._last + 1
+            if token is None:
+                return self._last, False
+            epoch, _, sequence = token.partition("-")
+            if epoch != self.epoch or not sequence.isdigit() or int(sequence) > self._last:
+                return self._last, True
+            sequence = int(sequence)
+            return sequence, sequence < oldest - 1
+
+    def since(self, sequence: int) -> List[Tuple[int, dict]]:
+        with self._lock:
+            if not self._events or self._events[-1][0] <= sequence:
+                return []
+            skip = max(0, sequence - self._events[0][0] + 1)
+            return [self._events[i] for i in range(skip, len(self._events))]
+
+    async def wait(self, sequence: int, timeout: float) -> List[Tuple[int, dict]]:
+        """Events after sequence, waiting up to timeout seconds for the first one"""
+        events = self.since(sequence)
+        if events:
+            return events
+        key = (asyncio.get_running_loop(), asyncio.Event())
+        with self._lock:
+            self._waiters.add(key)
+        try:
+            # check again now we're registered, in case an event slipped in between
+            events = self.since(sequence)
+            if not events:
+                await asyncio.wait_for(key[1].wait(), timeout)
+                events = self.since(sequence)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self._lock:
+                self._waiters.discard(key)
+        return events
+
+    def clear(self) -> None:
+        with self._lock:
+            self._events.clear()
+
+# Compact event builders so every write path sends the same shapes
+def product_upserted(product: dict) -> dict:
+    return dict(product, type="product.upserted")
+
+def product_price(upc: int, price: float) -> dict:
+    return {"type": "product.price", "upc": upc, "price": price}
+
+def product_stock(upc: int, quantity: int) -> dict:
+    return {"type": "product.stock", "upc": upc, "quantity": quantity}
+
+def product_deleted(upc: int) -> dict:
+    # a deleted product's sales are gone too
+    return {"type": "product.deleted", "upc": upc}
+
+def sale_created(sale: dict) -> dict:
+    return dict(sale, type="sale.created")
+
+def sale_deleted(sale_id: int) -> dict:
+    return {"type": "sale.deleted", "id": sale_id}
+
+
+# Global instance
+change_feed = ChangeFeed(settings.CHANGE_FEED_BUFFER_SIZE)
@@ -0,0 +1,51 @@
+import csv
+import io
+import json
+import zlib
+from typing import Iterator
+from sqlalchemy import select
+
+from app.config import settings
+from app.database import SessionLocal
+
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+def _encode_rows(model, fmt: str) -> Iterator[bytes]:
+    """Yield the whole table as NDJSON or CSV, one fetched batch at a time"""
+    table = model.__table__
+    columns = [column.name for column in table.columns]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    if fmt == "csv":
+        writer.writerow(columns)
+
+    with SessionLocal() as session:
+        # yield_per turns on server side cursors where the driver supports them,
+        # so memory stays flat no matter how big the table is
+        stmt = select(table).order_by(*table.primary_key.columns).execution_options(yield_per=settings.EXPORT_BATCH_SIZE)
+        for batch in session.execute(stmt).partitions():
+            for row in batch:
+                if fmt == "csv":
+                    writer.writerow(row)
+                else:
+                    buffer.write(json.dumps(dict(row._mapping), default=str))
+                    buffer.write("\n")
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+def _gzip(chunks: Iterator[bytes]) -> Iterator[bytes]:
+    compressor = zlib.compressobj(wbits=31)  # 31 selects the gzip container
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+def export_table(model, fmt: str, compress: bool = False) -> Iterator[bytes]:
+    chunks = _encode_rows(model, fmt)
+    return _gzip(chunks) if compress else chunks
@@ -0,0 +1,161 @@
+from typing import Dict, Iterable, List
+from sqlalchemy import Numeric, case, cast, delete, func, select, update
+from sqlalchemy.orm import Session
+
+from app.models.product import Product
+from app.models.sale import Sale
+from app.models.stock import StockMovement, StockSnapshot
+from app.models.reorder_recommendation import ReorderRecommendation
+from app.models.sale_archive import ArchivedSale
+from app.schemas.products import PriceUpdate
+from app.services.summary import record_changes
+from app.services.sync import reserve_versions, record_tombstones
+from app.services.stock_ledger import record_movements, on_hand
+
+def decrement_stock(session: Session, totals: Dict[int, int]) -> Dict[int, int]:
+    """
+    Subtract quantities (keyed by upc) from stock with a single set-based UPDATE,
+    so concurrent checkouts never lose each other's writes.
+    Each decrement is also written to the stock ledger as an already applied sale.
+    Returns the units now on hand (quantity plus pending movements) of every product
+    that exists. Nothing is committed.
+    """
+    columns = (Product.id, Product.upc, Product.quantity, Product.report_code, Product.price)
+    # every multi-product write locks its rows in id order first; left to the UPDATE,
+    # rows lock in whatever order the scan meets them and two baskets can deadlock.
+    # FOR NO KEY UPDATE (key_share) still lets ledger and sale inserts reference the rows
+    session.execute(
+        select(Product.id).where(Product.upc.in_(totals)).order_by(Product.id).with_for_update(key_share=True)
+    )
+    first_version = reserve_versions(session, len(totals))
+    versions = {upc: first_version + i for i, upc in enumerate(totals)}
+    stmt = update(Product).where(
+        Product.upc.in_(totals)
+    ).values(
+        quantity=func.coalesce(Product.quantity, 0) - case(totals, value=Product.upc),
+        version=case(versions, value=Product.upc)
+    ).execution_options(synchronize_session=False)
+
+    if session.get_bind().dialect.update_returning:
+        rows = session.execute(stmt.returning(*columns)).all()
+    else:
+        # the UPDATE holds the row locks, so reading back in the same transaction is safe
+        session.execute(stmt)
+        rows = session.execute(select(*columns).where(Product.upc.in_(totals))).all()
+
+    record_changes(
+        session,
+        before=[(row.report_code, row.quantity + totals[row.upc], row.price) for row in rows],
+        after=[(row.report_code, row.quantity, row.price) for row in rows],
+    )
+    record_movements(session, (
+        {"product_id": row.id, "kind": "sale", "quantity": -totals[row.upc], "applied": True}
+        for row in rows
+    ))
+    levels = on_hand(session, [row.id for row in rows])
+    return {row.upc: levels[row.id] for row in rows}
+
+def record_sale(session: Session, totals: Dict[int, int]) -> Dict[int, int]:
+    """
+    Append a basket (quantities keyed by upc) to the stock ledger as pending sales without
+    touching the product rows, so registers selling the same items never wait on each
+    other; compaction folds them into quantity. Returns the units now on hand of every
+    product that exists. Nothing is committed.
+    """
+    # share locks only hold off a delete, taken in id order like every other product lock
+    ids = dict(session.execute(
+        select(Product.upc, Product.id).where(Product.upc.in_(totals))
+        .order_by(Product.id).with_for_update(read=True, key_share=True)
+    ).all())
+    record_movements(session, (
+        {"product_id": product_id, "kind": "sale", "quantity": -totals[upc]}
+        for upc, product_id in ids.items()
+    ))
+    levels = on_hand(session, ids.values())
+    return {upc: levels[product_id] for upc, product_id in ids.items()}
+
+def delete_products(session: Session, upcs: Iterable[int]) -> List:
+    """
+    Delete products and their sales with set-based DELETEs instead of loading every
+    sale through the ORM cascade. Returns the (id, upc, name) of each deleted product.
+    Nothing is committed.
+    """
+    upcs = list(upcs)
+    returning = session.get_bind().dialect.delete_returning
+    # products before their sales, the same order create_sale locks them in
+    session.execute(select(Product.id).where(Product.upc.in_(upcs)).order_by(Product.id).with_for_update())
+    columns = (Product.id, Product.upc, Product.name, Product.report_code, Product.quantity, Product.price)
+
+    # sales go first, explicitly rather than through ON DELETE CASCADE, because delta sync
+    # needs their ids for tombstones (and SQLite connections may not enforce foreign keys)
+    product_ids = select(Product.id).where(Product.upc.in_(upcs)).scalar_subquery()
+    sales_stmt = delete(Sale).where(Sale.product_id.in_(product_ids)).execution_options(synchronize_session=False)
+    if returning:
+        sale_ids = session.execute(sales_stmt.returning(Sale.id)).scalars().all()
+    else:
+        sale_ids = session.execute(select(Sale.id).where(Sale.product_id.in_(product_ids))).scalars().all()
+        session.execute(sales_stmt)
+
+    # the stock ledger, recommendations and archived sales have no sync clients, so they can just go
+    for model in (StockMovement, StockSnapshot, ReorderRecommendation, ArchivedSale):
+        session.execute(
+            delete(model).where(model.product_id.in_(product_ids)).execution_options(synchronize_session=False)
+        )
+
+    stmt = delete(Product).where(Product.upc.in_(upcs)).execution_options(synchronize_session=False)
+    if returning:
+        rows = session.execute(stmt.returning(*columns)).all()
+    else:
+        rows = session.execute(select(*columns).where(Product.upc.in_(upcs))).all()
+        session.execute(stmt)
+
+    record_changes(session, before=[(row.report_code, row.quantity, row.price) for row in rows])
+    record_tombstones(session, "sale", sale_ids)
+    record_tombstones(session, "product", [row.upc for row in rows])
+    return rows
+
+def update_prices(session: Session, change: PriceUpdate) -> List:
+    """
+    Reprice every targeted product with one UPDATE. Returns the (upc, price) of each
+    updated product. Nothing is committed.
+    """
+    if change.upcs is not None:
+        target = Product.upc.in_(change.upcs)
+    else:
+        target = Product.report_code == change.report_code
+
+    if change.price is not None:
+        new_price = change.price
+    else:
+        new_price = func.round(cast(Product.price * (1 + change.markup_percent / 100), Numeric), 2)
+
+    # the summary needs the value before the change; the lock stops it moving underneath us
+    before = session.execute(
+        select(Product.id, Product.report_code, Product.quantity, Product.price)
+        .where(target).order_by(Product.id).with_for_update(key_share=True)
+    ).all()
+    if not before:
+        return []
+
+    # only the rows locked above: one committed to the report code since then was never
+    # read, so it has no before value and no version
+    locked = Product.id.in_([row.id for row in before])
+    first_version = reserve_versions(session, len(before))
+    versions = {row.id: first_version + i for i, row in enumerate(before)}
+    columns = (Product.upc, Product.report_code, Product.quantity, Product.price)
+    stmt = update(Product).where(locked).values(
+        price=new_price,
+        version=case(versions, value=Product.id)
+    ).execution_options(synchronize_session=False)
+    if session.get_bind().dialect.update_returning:
+        rows = session.execute(stmt.returning(*columns)).all()
+    else:
+        session.execute(stmt)
+        rows = session.execute(select(*columns).where(locked)).all()
+
+    record_changes(
+        session,
+        before=[(row.report_code, row.quantity, row.price) for row in before],
+        after=[(row.report_code, row.quantity, row.price) for row in rows]
+    )
+    return rows
@@ -0,0 +1,113 @@
+import math
+import threading
+import time
+from typing import Callable, Dict, Tuple
+from fastapi import HTTPException, Request
+
+from app.config import settings
+
+class TokenBucketLimiter:
+    """
+    Token buckets keyed by a string, each holding up to `burst` tokens and refilling at
+    `per_minute`. A bucket is just (tokens, last refill time); one that has sat idle long
+    enough to refill completely says nothing a new bucket wouldn't, so sweeps drop it.
+    """
+
+    def __init__(self, burst: int, per_minute: int, sweep_seconds: int, clock: Callable[[], float] = time.monotonic):
+        self.burst = burst
+        self.rate = per_minute / 60
+        self.sweep_seconds = sweep_seconds
+        self._clock = clock
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+        self._next_sweep = clock() + sweep_seconds
+        self._lock = threading.Lock()
+
+    def _tokens(self, key: str, now: float) -> float:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            return self.burst
+        tokens, updated = bucket
+        return min(self.burst, tokens + (now - updated) * self.rate)
+
+    def _sweep(self, now: float) -> None:
+        idle = self.burst / self.rate
+        self._buckets = {key: bucket for key, bucket in self._buckets.items() if now - bucket[1] < idle}
+        self._next_sweep = now + self.sweep_seconds
+
+    def retry_after(self, key: str) -> float:
+        """Seconds until key has a token, 0 if it has one now"""
+        with self._lock:
+            tokens = self._tokens(key, self._clock())
+        return 0 if tokens >= 1 else (1 - tokens) / self.rate
+
+    def take(self, key: str) -> bool:
+        """Spend one of key's tokens. False, spending nothing, if it has none left"""
+        with self._lock:
+            now = self._clock()
+            if now >= self._next_sweep:
+                self._sweep(now)
+            tokens = self._tokens(key, now)
+            if tokens < 1:
+                return False
+            self._buckets[key] = (tokens - 1, now)
+            return True
+
+    def give_back(self, key: str) -> None:
+        """Return a token spent by take, e.g. when the attempt was refused elsewhere"""
+        with self._lock:
+            now = self._clock()
+            self._buckets[key] = (min(self.burst, self._tokens(key, now) + 1), now)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._buckets.clear()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+def check_login_allowed(username: str, client_ip: str) -> None:
+    """
+    Spend a login attempt for the username and the client IP, or raise a 429 if either
+    is out. Neither is charged when the other refuses, so a flood from one address
+    doesn't lock its victims out from everywhere else.
+    """
+    wait = max(username_limiter.retry_after(username), ip_limiter.retry_after(client_ip))
+    if wait == 0 and username_limiter.take(username):
+        if ip_limiter.take(client_ip):
+            return
+        # lost the IP's last token to a concurrent attempt, so undo the username's
+        username_limiter.give_back(username)
+        wait = ip_limiter.retry_after(client_ip)
+    raise HTTPException(
+        status_code=429,
+        detail="Too many login attempts, try again later",
+        headers={"Retry-After": str(max(1, math.ceil(wait)))}
+    )
+
+def client_ip(request: Request) -> str:
+    """
+    Address a login came from. Behind a proxy the connection comes from the proxy, so
+    when it's one of LOGIN_TRUSTED_PROXIES the address is taken from X-Forwarded-For
+    instead: the last hop a trusted proxy didn't add. With no trusted proxies the header
+    is ignored, as any client could write it; every user behind an untrusted proxy
+    then shares that proxy's IP bucket.
+    """
+    address = request.client.host if request.client else "unknown"
+    trusted = settings.LOGIN_TRUSTED_PROXIES
+    if address not in trusted:
+        return address
+    hops = [hop.strip() for hop in request.headers.get("x-forwarded-for", "").split(",") if hop.strip()]
+    for hop in reversed(hops):
+        address = hop
+        if hop not in trusted:
+            break
+    return address
+
+
+# Global instances
+username_limiter = TokenBucketLimiter(
+    settings.LOGIN_USERNAME_BURST, settings.LOGIN_USERNAME_PER_MINUTE, settings.LOGIN_LIMIT_SWEEP_SECONDS
+)
+ip_limiter = TokenBucketLimiter(
+    settings.LOGIN_IP_BURST, settings.LOGIN_IP_PER_MINUTE, settings.LOGIN_LIMIT_SWEEP_SECONDS
+)
@@ -1,6 +1,7 @@
 from datetime import datetime, timedelta
 import logging
 from typing import List
+from sqlalchemy.orm import joinedload
 
 from app.database import SessionLocal
 from app.models.sale import Sale
@@ -27,10 +28,11 @@ class NotificationService:
         cutoff_date = datetime.now().date() + timedelta(days=days_ahead)
         
         with SessionLocal() as session:
-            expiring_sales = session.query(Sale).filter(
+            # join the product in up front rather than lazy loading it once per sale
+            expiring_sales = session.query(Sale).options(joinedload(Sale.product)).filter(
                 Sale.sale_end <= cutoff_date,
                 Sale.sale_end >= datetime.now().date()
-            ).all()
+            ).order_by(Sale.sale_end).all()
             return [{
                 "sale_end": sale.sale_end,
                 "sale_price": sale.sale_price,
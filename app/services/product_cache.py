@@ -0,0 +1,27 @@
+from typing import Optional
+
+from app.config import settings
+from app.database import SessionLocal
+from app.models.product import Product
+from app.services.cache import TTLCache
+
+# Products by upc. Every product write path must invalidate the upcs it touches
+product_cache = TTLCache(settings.PRODUCT_CACHE_SIZE, settings.PRODUCT_CACHE_TTL_SECONDS)
+
+def product_to_dict(product: Product) -> dict:
+    return {column.name: getattr(product, column.name) for column in Product.__table__.columns}
+
+def get_product_by_upc(upc: int) -> Optional[dict]:
+    """Look up a product through the cache, falling back to the database"""
+    product = product_cache.get(upc)
+    if product is not None:
+        return product
+    # a write committing while this reads must not leave its old row cached
+    generation = product_cache.generation
+    with SessionLocal() as session:
+        row = session.query(Product).filter(Product.upc == upc).first()
+        if row is None:
+            return None
+        product = product_to_dict(row)
+    product_cache.set(upc, product, generation)
+    return product
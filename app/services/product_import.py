@@ -0,0 +1,196 @@
+import csv
+import json
+import logging
+from collections import deque
+from typing import AsyncIterator, Dict, List, Tuple
+from pydantic import ValidationError
+from starlette.concurrency import run_in_threadpool
+
+from app.config import settings
+from app.database import SessionLocal, insert_for
+from app.models.product import Product
+from app.schemas.products import ProductCreate
+from app.services.product_cache import product_cache
+from app.services.search import search_index
+from app.services.summary import record_changes
+from app.services.sync import reserve_versions
+from app.services.stock_ledger import record_movements
+from app.services.change_feed import change_feed, product_upserted
+
+logger = logging.getLogger(__name__)
+
+def upsert(model, index_elements: List[str]):
+    """Build an INSERT ... ON CONFLICT DO UPDATE for the current database"""
+    stmt = insert_for(model)
+    updates = {
+        column.name: stmt.excluded[column.name]
+        for column in model.__table__.columns
+        if not column.primary_key and column.name not in index_elements
+    }
+    return stmt.on_conflict_do_update(index_elements=index_elements, set_=updates)
+
+def format_validation_error(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in e['loc'])}: {e['msg']}" if e["loc"] else e["msg"]
+        for e in error.errors()
+    )
+
+class ProductImportService:
+    def __init__(self, chunk_size: int = settings.BULK_IMPORT_CHUNK_SIZE):
+        self.chunk_size = chunk_size
+
+    async def _lines(self, stream: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+        """Split a byte stream into lines, endings kept, without reading it all into memory"""
+        buffer = b""
+        async for data in stream:
+            buffer += data
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                yield line + b"\n"
+        if buffer:
+            yield buffer
+
+    async def _records(self, stream: AsyncIterator[bytes], fmt: str) -> AsyncIterator[Tuple[int, object]]:
+        """
+        Yield (row number, raw record) pairs, or (row number, ValueError) for a row that
+        can't be read. Row numbers count data rows from 1
+        """
+        header = None
+        row_number = 0
+        # one csv reader for the whole body, fed a record's lines once its quotes balance,
+        # so quoted fields may contain newlines
+        pending = deque()
+        reader = csv.reader(iter(pending.popleft, None))
+        record, quotes, undecodable = [], 0, False
+
+        async for raw in self._lines(stream):
+            try:
+                line = raw.decode("utf-8")
+            except UnicodeDecodeError:
+                line, undecodable = raw.decode("utf-8", errors="replace"), True
+
+            if fmt == "csv":
+                if not record and not line.strip():
+                    undecodable = False
+                    continue
+                record.append(line)
+                quotes += line.count('"')
+                if quotes % 2:
+                    continue
+                pending.extend(record)
+                values = next(reader)
+                bad, record, quotes, undecodable = undecodable, [], 0, False
+                if header is None:
+                    header = [name.strip() for name in values]
+                    continue
+                row_number += 1
+                yield row_number, ValueError("Invalid UTF-8") if bad else dict(zip(header, values))
+            else:
+                if not line.strip():
+                    undecodable = False
+                    continue
+                row_number += 1
+                if undecodable:
+                    undecodable = False
+                    yield row_number, ValueError("Invalid UTF-8")
+                    continue
+                try:
+                    yield row_number, json.loads(line)
+                except json.JSONDecodeError as e:
+                    yield row_number, ValueError(f"Invalid JSON: {e}")
+
+        if record:
+            yield row_number + 1, ValueError("Unterminated quoted field")
+
+    def _write_chunk(self, chunk: Dict[int, Tuple[int, dict]]) -> List[dict]:
+        """
+        Upsert one chunk on upc with a single executemany. If that fails the rows are
+        written one at a time, so only the rows that fail are reported. Returns row errors
+        """
+        with SessionLocal() as session:
+            try:
+                first_version = reserve_versions(session, len(chunk))
+                rows = [dict(row, version=first_version + i) for i, (_, row) in enumerate(chunk.values())]
+                existing = session.query(
+                    Product.upc, Product.report_code, Product.quantity, Product.price
+                ).filter(Product.upc.in_(chunk.keys())).order_by(Product.id).with_for_update(key_share=True).all()
+                session.execute(upsert(Product, ["upc"]), rows)
+                record_changes(
+                    session,
+                    before=[(row.report_code, row.quantity, row.price) for row in existing],
+                    after=[(row["report_code"], row["quantity"], row["price"]) for row in rows]
+                )
+                # the ledger records the import as an adjustment from the old quantity
+                previous = {row.upc: row.quantity or 0 for row in existing}
+                ids = dict(session.query(Product.upc, Product.id).filter(Product.upc.in_(chunk.keys())))
+                record_movements(session, (
+                    {
+                        "product_id": ids[row["upc"]],
+                        "kind": "adjustment",
+                        "quantity": row["quantity"] - previous.get(row["upc"], 0),
+                        "applied": True
+                    }
+                    for row in rows
+                ))
+                session.commit()
+                product_cache.invalidate_many(chunk.keys())
+                change_feed.publish(*(product_upserted(row) for row in rows))
+                if search_index.loaded:
+                    rows = session.query(Product.id, Product.name).filter(Product.upc.in_(chunk.keys()))
+                    for product_id, name in rows:
+                        search_index.add(product_id, name)
+                return []
+            except Exception as e:
+                session.rollback()
+                if len(chunk) == 1:
+                    row_number, _ = next(iter(chunk.values()))
+                    # the driver's message names the cause, the SQLAlchemy wrapper adds only noise
+                    cause = str(getattr(e, "orig", None) or e).strip().splitlines()[0]
+                    return [{"row": row_number, "error": f"Invalid product: {cause}"}]
+                logger.error(f"Bulk product import chunk failed, retrying it row by row: {e}")
+        # one bad row fails the whole statement, so find it without dropping the good rows
+        errors = []
+        for upc, entry in chunk.items():
+            errors.extend(self._write_chunk({upc: entry}))
+        return errors
+
+    async def import_stream(self, stream: AsyncIterator[bytes], fmt: str) -> dict:
+        """
+        Validate and upsert products from a CSV or NDJSON stream in chunks.
+        A later row with the same upc replaces an earlier one.
+        """
+        processed = 0
+        errors = []
+        chunk: Dict[int, Tuple[int, dict]] = {}
+
+        async for row_number, record in self._records(stream, fmt):
+            processed += 1
+            if isinstance(record, Exception):
+                errors.append({"row": row_number, "error": str(record)})
+                continue
+            try:
+                product = ProductCreate.model_validate(record)
+            except ValidationError as e:
+                errors.append({"row": row_number, "error": format_validation_error(e)})
+                continue
+
+            # Postgres refuses to upsert the same key twice in one statement
+            chunk.pop(product.upc, None)
+            chunk[product.upc] = (row_number, product.model_dump())
+            if len(chunk) >= self.chunk_size:
+                errors.extend(await run_in_threadpool(self._write_chunk, chunk))
+                chunk = {}
+
+        if chunk:
+            errors.extend(await run_in_threadpool(self._write_chunk, chunk))
+
+        errors.sort(key=lambda e: e["row"])
+        return {
+            "processed": processed,
+            "imported": processed - len(errors),
+            "errors": errors
+        }
+
+
+# Global instance
+product_import_service = ProductImportService()
@@ -0,0 +1,80 @@
+from datetime import date, datetime, timedelta
+from typing import Optional, Tuple
+import numpy as np
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.database import SessionLocal
+from app.models.product import Product
+from app.models.stock import StockMovement
+from app.models.reorder_recommendation import ReorderRecommendation
+
+def daily_demand(session: Session, days: int, today: date) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Units sold per product per day over the last `days` days (today last), read from the
+    stock ledger with one grouped query. Returns the sorted product ids and a
+    (products x days) matrix; products without sales get a row of zeros.
+    """
+    start = today - timedelta(days=days - 1)
+    product_ids = np.fromiter(
+        session.execute(select(Product.id).order_by(Product.id)).scalars(), dtype=np.int64
+    )
+    demand = np.zeros((len(product_ids), days))
+
+    day = func.date(StockMovement.created_at)
+    rows = session.execute(
+        select(StockMovement.product_id, day, func.sum(-StockMovement.quantity))
+        .where(StockMovement.kind == "sale", StockMovement.created_at >= datetime.combine(start, datetime.min.time()))
+        .group_by(StockMovement.product_id, day)
+    ).all()
+    if rows and len(product_ids):
+        ids, days_sold, units = zip(*rows)
+        # SQLite returns dates as ISO strings and Postgres as dates; datetime64 takes both
+        columns = (np.array(days_sold, dtype="datetime64[D]") - np.datetime64(start, "D")).astype(np.int64)
+        ids = np.array(ids, dtype=np.int64)
+        rows_at = np.searchsorted(product_ids, ids)
+        # a product created and sold since the ids were read has no row of its own
+        keep = np.isin(ids, product_ids) & (columns >= 0) & (columns < days)
+        demand[rows_at[keep], columns[keep]] = np.array(units, dtype=np.float64)[keep]
+    return product_ids, demand
+
+def recommend_thresholds(demand: np.ndarray, lead_time_days: float, service_z: float) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Reorder thresholds for a (products x days) demand matrix, all products at once:
+    average daily demand over the lead time plus safety stock of service_z standard
+    deviations of lead time demand. Returns the average demand and the thresholds.
+    """
+    average = demand.mean(axis=1)
+    safety_stock = service_z * demand.std(axis=1) * np.sqrt(lead_time_days)
+    thresholds = np.ceil(average * lead_time_days + safety_stock).astype(np.int64)
+    return average, thresholds
+
+def refresh_recommendations(session: Session, today: Optional[date] = None) -> int:
+    """Replace every stored recommendation. Returns the number of products. Nothing is committed"""
+    product_ids, demand = daily_demand(session, settings.REORDER_DEMAND_DAYS, today or date.today())
+    average, thresholds = recommend_thresholds(
+        demand, settings.REORDER_LEAD_TIME_DAYS, settings.REORDER_SERVICE_LEVEL_Z
+    )
+    computed_at = datetime.now()
+    session.execute(delete(ReorderRecommendation))
+    if len(product_ids):
+        session.execute(insert(ReorderRecommendation), [
+            {
+                "product_id": product_id,
+                "recommended_threshold": threshold,
+                "average_daily_demand": round(demand_per_day, 4),
+                "computed_at": computed_at
+            }
+            for product_id, threshold, demand_per_day in zip(
+                product_ids.tolist(), thresholds.tolist(), average.tolist()
+            )
+        ])
+    return len(product_ids)
+
+def run_recommendations() -> int:
+    """Recompute recommendations in their own transaction"""
+    with SessionLocal() as session:
+        products = refresh_recommendations(session)
+        session.commit()
+    return products
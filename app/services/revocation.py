@@ -0,0 +1,127 @@
+import threading
+from datetime import datetime, timedelta
+from typing import Iterable, Optional, Tuple
+from sqlalchemy import delete, select
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.database import SessionLocal, insert_for
+from app.models.revoked_token import RevokedToken
+from app.models.revoked_user import RevokedUser
+
+class RevocationList:
+    """
+    In-process mirror of the revoked_tokens and revoked_users tables, so checking a token
+    costs two lookups and no query. A user revocation covers only the tokens issued up
+    to it: SQLite tables from before AUTOINCREMENT can give a deleted user's id to the
+    next registrant, whose tokens must keep working. Loaded at startup and updated by this process's
+    revocations. Other processes' revocations arrive when the list is reloaded, every
+    REVOCATION_RELOAD_SECONDS, so a token revoked elsewhere keeps working here for at
+    most that long
+    """
+
+    def __init__(self):
+        self.loaded = False
+        self._lock = threading.Lock()
+        self._revoked = set()
+        # user id -> revoked_at as a timestamp
+        self._revoked_users = {}
+        # revocations made here while a reload reads the tables, which it may have missed
+        self._reloads = 0
+        self._added = set()
+        self._added_users = {}
+
+    def load(self, jtis: Iterable[str], users: Iterable[Tuple[int, datetime]] = ()) -> None:
+        revoked = set(jtis)
+        revoked_users = {user_id: revoked_at.timestamp() for user_id, revoked_at in users}
+        with self._lock:
+            revoked |= self._added
+            revoked_users.update(self._added_users)
+            self._revoked, self._revoked_users = revoked, revoked_users
+            self.loaded = True
+
+    def load_from_database(self) -> None:
+        now = datetime.now()
+        with self._lock:
+            self._reloads += 1
+        try:
+            with SessionLocal() as session:
+                jtis = session.execute(select(RevokedToken.jti).where(RevokedToken.expires_at > now)).scalars()
+                users = session.execute(
+                    select(RevokedUser.user_id, RevokedUser.revoked_at).where(RevokedUser.expires_at > now)
+                ).all()
+                self.load(jtis, users)
+        finally:
+            with self._lock:
+                self._reloads -= 1
+                if not self._reloads:
+                    self._added.clear()
+                    self._added_users.clear()
+
+    def add(self, jti: str) -> None:
+        with self._lock:
+            self._revoked.add(jti)
+            if self._reloads:
+                self._added.add(jti)
+
+    def add_user(self, user_id: int, revoked_at: datetime) -> None:
+        with self._lock:
+            self._revoked_users[user_id] = revoked_at.timestamp()
+            if self._reloads:
+                self._added_users[user_id] = revoked_at.timestamp()
+
+    def clear(self) -> None:
+        self.load([])
+        self.loaded = False
+
+    def is_revoked(self, jti: Optional[str], user_id: Optional[int] = None, issued_at: Optional[float] = None) -> bool:
+        """
+        Whether the token with this id has been revoked, or its user was revoked after it
+        was issued. iat has whole seconds, so a token from the second of the revocation
+        counts as revoked, as does one with no iat at all
+        """
+        if not self.loaded:
+            self.load_from_database()
+        if jti in self._revoked:
+            return True
+        revoked_at = self._revoked_users.get(user_id)
+        return revoked_at is not None and (issued_at is None or issued_at <= revoked_at)
+
+    def __len__(self) -> int:
+        return len(self._revoked) + len(self._revoked_users)
+
+
+# Global instance
+revocation_list = RevocationList()
+
+def revoke_token(session: Session, jti: str, expires_at: datetime) -> None:
+    """Record a revoked token id in the caller's transaction. Call revocation_list.add after commit"""
+    stmt = insert_for(RevokedToken).values(jti=jti, expires_at=expires_at, revoked_at=datetime.now())
+    session.execute(stmt.on_conflict_do_nothing(index_elements=["jti"]))
+
+def revoke_user(session: Session, user_id: int) -> datetime:
+    """
+    Revoke every token issued so far to a deleted user, in the caller's transaction.
+    Returns the revocation time to pass to revocation_list.add_user after commit
+    """
+    # the user's tokens aren't at hand, so keep the entry as long as any token can live
+    lifetime = max(settings.ACCESS_TOKEN_EXPIRE_MINUTES, settings.REFRESH_TOKEN_EXPIRE_MINUTES)
+    revoked_at = datetime.now()
+    stmt = insert_for(RevokedUser).values(
+        user_id=user_id, expires_at=revoked_at + timedelta(minutes=lifetime), revoked_at=revoked_at
+    )
+    # an id given out again and deleted again: the later revocation covers both users
+    session.execute(stmt.on_conflict_do_update(
+        index_elements=["user_id"],
+        set_={"expires_at": stmt.excluded.expires_at, "revoked_at": stmt.excluded.revoked_at}
+    ))
+    return revoked_at
+
+def purge_expired_revocations() -> int:
+    """Drop token and user revocations that have expired anyway and reload the list. Returns rows removed"""
+    with SessionLocal() as session:
+        removed = session.execute(delete(RevokedToken).where(RevokedToken.expires_at <= datetime.now())).rowcount
+        removed += session.execute(delete(RevokedUser).where(RevokedUser.expires_at <= datetime.now())).rowcount
+        session.commit()
+    revocation_list.load_from_database()
+    return removed
@@ -0,0 +1,52 @@
+from datetime import date, datetime, timedelta
+from typing import Optional
+from sqlalchemy import delete, insert, literal, select, union_all
+
+from app.config import settings
+from app.database import SessionLocal
+from app.models.sale import Sale
+from app.models.sale_archive import ArchivedSale
+from app.services.sale_index import sale_index
+from app.services.sync import record_tombstones
+from app.services.change_feed import change_feed, sale_deleted
+
+SALE_COLUMNS = ("id", "product_id", "sale_price", "sale_start", "sale_end", "version")
+
+def archive_expired_sales(cutoff: Optional[date] = None, batch_size: int = settings.SALE_ARCHIVE_BATCH_SIZE) -> int:
+    """
+    Move sales that ended before cutoff (default: the retention window ago) into the
+    archive, one batch per transaction so live writers are never blocked for long.
+    They're tombstoned like any deleted sale, so registers drop them too.
+    Returns the number of sales moved.
+    """
+    if cutoff is None:
+        cutoff = date.today() - timedelta(days=settings.SALE_ARCHIVE_RETENTION_DAYS)
+    columns = [getattr(Sale, name) for name in SALE_COLUMNS]
+    moved = 0
+    while True:
+        with SessionLocal() as session:
+            # oldest first, straight off the (sale_end, sale_start) index
+            ids = session.execute(
+                select(Sale.id).where(Sale.sale_end < cutoff).order_by(Sale.sale_end).limit(batch_size).with_for_update()
+            ).scalars().all()
+            if not ids:
+                return moved
+            session.execute(insert(ArchivedSale).from_select(
+                [*SALE_COLUMNS, "archived_at"],
+                select(*columns, literal(datetime.now())).where(Sale.id.in_(ids))
+            ))
+            session.execute(delete(Sale).where(Sale.id.in_(ids)).execution_options(synchronize_session=False))
+            record_tombstones(session, "sale", ids)
+            session.commit()
+        sale_index.remove(ids)
+        change_feed.publish(*(sale_deleted(sale_id) for sale_id in ids))
+        moved += len(ids)
+        if len(ids) < batch_size:
+            return moved
+
+def live_and_archived_sales():
+    """Live and archived sales as one selectable, with an `archived` flag"""
+    return union_all(
+        select(*(getattr(Sale, name) for name in SALE_COLUMNS), literal(False).label("archived")),
+        select(*(getattr(ArchivedSale, name) for name in SALE_COLUMNS), literal(True).label("archived")),
+    ).subquery("all_sales")
@@ -0,0 +1,112 @@
+import csv
+import io
+import json
+from collections import defaultdict
+from typing import List, Tuple
+from pydantic import ValidationError
+from sqlalchemy import insert
+
+from app.config import settings
+from app.database import SessionLocal
+from app.models.product import Product
+from app.models.sale import Sale
+from app.schemas.sales import SaleFlyerItem
+from app.services.product_import import format_validation_error
+from app.services.sale_index import sale_index, sale_conflict
+from app.services.sync import reserve_versions
+from app.services.change_feed import change_feed, sale_created
+
+def parse_flyer(body: bytes, fmt: str) -> Tuple[int, List[Tuple[int, SaleFlyerItem]], List[dict]]:
+    """
+    Parse a flyer sent as a JSON array or CSV with a header row.
+    Returns the number of rows, the valid (row number, item) pairs and the row errors.
+    Row numbers count data rows from 1
+    """
+    if fmt == "csv":
+        records = list(csv.DictReader(io.StringIO(body.decode("utf-8"))))
+    else:
+        records = json.loads(body)
+        if not isinstance(records, list):
+            raise ValueError("Body must be a JSON array")
+
+    items, errors = [], []
+    for row_number, record in enumerate(records, start=1):
+        try:
+            items.append((row_number, SaleFlyerItem.model_validate(record)))
+        except ValidationError as e:
+            errors.append({"row": row_number, "error": format_validation_error(e)})
+    return len(records), items, errors
+
+def _overlaps(first, second) -> bool:
+    return first.sale_start <= second.sale_end and second.sale_start <= first.sale_end
+
+def import_flyer(items: List[Tuple[int, SaleFlyerItem]]) -> Tuple[List[dict], List[dict]]:
+    """
+    Create the sales of a flyer in one transaction: one query resolves every upc, one
+    range query finds the existing sales they could overlap, and the inserts go out in
+    batches. Rows for unknown upcs, or overlapping an existing sale or an earlier row,
+    are skipped. Returns the created sales and the row errors
+    """
+    errors = []
+    with SessionLocal() as session:
+        upcs = {item.upc for _, item in items}
+        # locked like create_sale does, so a single sale can't slip in between check and insert
+        product_ids = dict(
+            session.query(Product.upc, Product.id).filter(Product.upc.in_(upcs)).order_by(Product.id).with_for_update(key_share=True)
+        ) if upcs else {}
+
+        resolved = []
+        for row_number, item in items:
+            if item.upc in product_ids:
+                resolved.append((row_number, item, product_ids[item.upc]))
+            else:
+                errors.append({"row": row_number, "error": "Product not found"})
+        if not resolved:
+            return [], errors
+        first_version = reserve_versions(session, len(resolved))
+
+        # only sales ending on or after the flyer starts can overlap it, which the
+        # (product_id, sale_end, sale_start) index finds without reading old promotions
+        existing = defaultdict(list)
+        for sale in session.query(Sale).filter(
+            Sale.product_id.in_({product_id for _, _, product_id in resolved}),
+            Sale.sale_end >= min(item.sale_start for _, item, _ in resolved),
+            Sale.sale_start <= max(item.sale_end for _, item, _ in resolved)
+        ):
+            existing[sale.product_id].append(sale)
+
+        rows = []
+        accepted = defaultdict(list)   # product id -> (row number, item) already in this flyer
+        for row_number, item, product_id in resolved:
+            conflicts = [sale for sale in existing[product_id] if _overlaps(sale, item)]
+            if conflicts:
+                errors.append({
+                    "row": row_number,
+                    "error": "Sale overlaps an existing sale",
+                    "conflicts": [sale_conflict(sale) for sale in conflicts]
+                })
+                continue
+            earlier = next((row for row, other in accepted[product_id] if _overlaps(other, item)), None)
+            if earlier is not None:
+                errors.append({"row": row_number, "error": f"Sale overlaps row {earlier}"})
+                continue
+            accepted[product_id].append((row_number, item))
+            rows.append({
+                "product_id": product_id,
+                "sale_price": item.sale_price,
+                "sale_start": item.sale_start,
+                "sale_end": item.sale_end,
+                "version": first_version + len(rows)
+            })
+
+        created = []
+        stmt = insert(Sale).returning(*Sale.__table__.columns, sort_by_parameter_order=True)
+        for start in range(0, len(rows), settings.BULK_IMPORT_CHUNK_SIZE):
+            batch = rows[start:start + settings.BULK_IMPORT_CHUNK_SIZE]
+            created.extend(row._asdict() for row in session.execute(stmt, batch))
+        session.commit()
+
+    for sale in created:
+        sale_index.add(sale)
+    change_feed.publish(*(sale_created(sale) for sale in created))
+    return created, errors
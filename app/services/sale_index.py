@@ -0,0 +1,149 @@
+import bisect
+import threading
+from datetime import date
+from typing import Iterable, List
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal
+from app.models.sale import Sale
+
+def sale_to_dict(sale: Sale) -> dict:
+    return {column.name: getattr(sale, column.name) for column in Sale.__table__.columns}
+
+def overlapping_sales(session: Session, product_id: int, start: date, end: date) -> List[Sale]:
+    """
+    The product's sales sharing at least one day with start..end. A range scan of
+    ix_sales_product_end_start from `start` on, so finished promotions are never read
+    """
+    return session.query(Sale).filter(
+        Sale.product_id == product_id, Sale.sale_end >= start, Sale.sale_start <= end
+    ).order_by(Sale.sale_start).all()
+
+def sale_conflict(sale: Sale) -> dict:
+    # goes out in an error detail, which isn't run through the response encoder
+    return {
+        "id": sale.id,
+        "sale_price": sale.sale_price,
+        "sale_start": sale.sale_start.isoformat(),
+        "sale_end": sale.sale_end.isoformat()
+    }
+
+class _ProductSales:
+    """One product's sales sorted by start date, with the running maximum end date"""
+
+    def __init__(self):
+        self.keys = []      # (sale_start, sale id)
+        self.sales = []     # sale dicts, same order as keys
+        self.max_end = []   # max_end[i] = latest sale_end among sales[:i + 1]
+
+    def _refresh_max_end(self, start: int) -> None:
+        running = self.max_end[start - 1] if start else date.min
+        del self.max_end[start:]
+        for sale in self.sales[start:]:
+            running = max(running, sale["sale_end"])
+            self.max_end.append(running)
+
+    def add(self, sale: dict) -> None:
+        key = (sale["sale_start"], sale["id"])
+        i = bisect.bisect_left(self.keys, key)
+        self.keys.insert(i, key)
+        self.sales.insert(i, sale)
+        self._refresh_max_end(i)
+
+    def remove(self, sale: dict) -> None:
+        i = bisect.bisect_left(self.keys, (sale["sale_start"], sale["id"]))
+        if i < len(self.keys) and self.keys[i][1] == sale["id"]:
+            del self.keys[i]
+            del self.sales[i]
+            self._refresh_max_end(i)
+
+    def active(self, on: date) -> List[dict]:
+        """
+        Sales running on a date. Only sales starting by then can be running; walking back
+        from the last of them stops as soon as nothing earlier ends late enough
+        """
+        i = bisect.bisect_right(self.keys, (on, float("inf")))
+        found = []
+        while i > 0 and self.max_end[i - 1] >= on:
+            i -= 1
+            if self.sales[i]["sale_end"] >= on:
+                found.append(self.sales[i])
+        found.reverse()
+        return found
+
+class ActiveSaleIndex:
+    """
+    Per product interval index of sales, so "what's on sale for this product" costs a
+    binary search however much promotion history piles up.
+    Built once from the sales table and kept current by the sale write paths.
+    """
+
+    def __init__(self):
+        self.loaded = False
+        self._lock = threading.RLock()
+        self._products = {}    # product id -> _ProductSales
+        self._sales = {}       # sale id -> sale dict
+
+    def load(self, sales: Iterable[dict]) -> None:
+        with self._lock:
+            self._products.clear()
+            self._sales.clear()
+            for sale in sales:
+                self._add(sale)
+            self.loaded = True
+
+    def load_from_database(self) -> None:
+        with SessionLocal() as session:
+            self.load(sale_to_dict(sale) for sale in session.query(Sale).yield_per(10_000))
+
+    def _add(self, sale: dict) -> None:
+        self._remove(sale["id"])
+        self._products.setdefault(sale["product_id"], _ProductSales()).add(sale)
+        self._sales[sale["id"]] = sale
+
+    def _remove(self, sale_id: int) -> None:
+        sale = self._sales.pop(sale_id, None)
+        if sale is None:
+            return
+        product = self._products[sale["product_id"]]
+        product.remove(sale)
+        if not product.keys:
+            del self._products[sale["product_id"]]
+
+    def add(self, sale: dict) -> None:
+        with self._lock:
+            if self.loaded:
+                self._add(sale)
+
+    def remove(self, sale_ids: Iterable[int]) -> None:
+        with self._lock:
+            if self.loaded:
+                for sale_id in sale_ids:
+                    self._remove(sale_id)
+
+    def remove_products(self, product_ids: Iterable[int]) -> None:
+        with self._lock:
+            if not self.loaded:
+                return
+            for product_id in product_ids:
+                product = self._products.pop(product_id, None)
+                if product is not None:
+                    for sale in product.sales:
+                        del self._sales[sale["id"]]
+
+    def clear(self) -> None:
+        with self._lock:
+            self.load([])
+            self.loaded = False
+
+    def active(self, product_id: int, on: date) -> List[dict]:
+        """Sales of one product running on a date, earliest start first"""
+        with self._lock:
+            if not self.loaded:
+                self.load_from_database()
+            product = self._products.get(product_id)
+            return product.active(on) if product is not None else []
+
+
+# Global instance
+sale_index = ActiveSaleIndex()
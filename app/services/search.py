@@ -0,0 +1,164 @@
+import bisect
+import heapq
+import math
+import threading
+from collections import Counter, defaultdict
+from typing import Iterable, List, Tuple
+from sqlalchemy import case, func, literal, or_
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal, engine
+from app.models.product import Product
+
+def trigrams(text: str) -> set:
+    """Trigrams of each word padded like pg_trgm, so both indexes rank alike"""
+    grams = set()
+    for word in text.lower().split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+class ProductSearchIndex:
+    """
+    In-memory name index used when the database has no pg_trgm: a sorted list of
+    names for prefix matches and a trigram posting list for typo tolerant matches.
+    Built once from the products table and kept current by the product write paths.
+    """
+
+    def __init__(self, min_similarity: float = 0.6):
+        self.min_similarity = min_similarity
+        self.loaded = False
+        self._lock = threading.RLock()
+        self._names = {}                 # product id -> lower case name
+        self._gram_counts = {}           # product id -> number of trigrams in its name
+        self._postings = defaultdict(set)
+        self._sorted = []                # (lower case name, product id)
+
+    def load(self, products: Iterable[Tuple[int, str]]) -> None:
+        with self._lock:
+            self._names.clear()
+            self._gram_counts.clear()
+            self._postings.clear()
+            self._sorted = []
+            for product_id, name in products:
+                self._add(product_id, name)
+            self._sorted.sort()
+            self.loaded = True
+
+    def load_from_database(self) -> None:
+        with SessionLocal() as session:
+            self.load(session.query(Product.id, Product.name).yield_per(10_000))
+
+    def _add(self, product_id: int, name: str, keep_sorted: bool = False) -> None:
+        name = name.lower()
+        grams = trigrams(name)
+        self._names[product_id] = name
+        self._gram_counts[product_id] = len(grams)
+        for gram in grams:
+            self._postings[gram].add(product_id)
+        if keep_sorted:
+            bisect.insort(self._sorted, (name, product_id))
+        else:
+            self._sorted.append((name, product_id))
+
+    def _remove(self, product_id: int) -> None:
+        name = self._names.pop(product_id, None)
+        if name is None:
+            return
+        del self._gram_counts[product_id]
+        for gram in trigrams(name):
+            postings = self._postings.get(gram)
+            if postings is not None:
+                postings.discard(product_id)
+                if not postings:
+                    del self._postings[gram]
+        i = bisect.bisect_left(self._sorted, (name, product_id))
+        if i < len(self._sorted) and self._sorted[i] == (name, product_id):
+            del self._sorted[i]
+
+    def add(self, product_id: int, name: str) -> None:
+        """Add or rename a product"""
+        with self._lock:
+            if not self.loaded:
+                return
+            self._remove(product_id)
+            self._add(product_id, name, keep_sorted=True)
+
+    def remove(self, product_id: int) -> None:
+        with self._lock:
+            if self.loaded:
+                self._remove(product_id)
+
+    def clear(self) -> None:
+        with self._lock:
+            self.load([])
+            self.loaded = False
+
+    def _similar(self, q: str) -> Iterable[Tuple[int, float]]:
+        """
+        Products containing at least min_similarity of the query's trigrams, scored by
+        the fraction they contain (like pg_trgm's word_similarity). A match must appear in
+        at least one of the rarest len - needed + 1 trigrams, so only those seed candidates.
+        """
+        q_grams = sorted(trigrams(q), key=lambda gram: len(self._postings.get(gram, ())))
+        if not q_grams:
+            return
+        needed = max(1, math.ceil(self.min_similarity * len(q_grams)))
+        candidates = set()
+        for gram in q_grams[:len(q_grams) - needed + 1]:
+            candidates.update(self._postings.get(gram, ()))
+
+        shared = Counter()
+        for gram in q_grams:
+            shared.update(candidates.intersection(self._postings.get(gram, ())))
+        for product_id, count in shared.items():
+            if count >= needed:
+                yield product_id, count / len(q_grams)
+
+    def search(self, q: str, limit: int) -> List[Tuple[int, float]]:
+        """Return up to limit (product id, score) pairs. Prefix matches score 1.0"""
+        q = q.lower().strip()
+        with self._lock:
+            results = {}
+            i = bisect.bisect_left(self._sorted, (q,))
+            while i < len(self._sorted) and len(results) < limit and self._sorted[i][0].startswith(q):
+                results[self._sorted[i][1]] = 1.0
+                i += 1
+
+            if len(results) < limit:
+                # best score first, then the shortest (most specific) name
+                fuzzy = heapq.nsmallest(limit - len(results), (
+                    (-score, self._gram_counts[product_id], self._names[product_id], product_id)
+                    for product_id, score in self._similar(q)
+                    if product_id not in results
+                ))
+                for score, _, _, product_id in fuzzy:
+                    results[product_id] = -score
+        return list(results.items())
+
+
+# Postgres ranks with pg_trgm instead, so only SQLite deployments build the in-memory index
+uses_trigram_index = engine.dialect.name == "postgresql"
+
+# Global instance
+search_index = ProductSearchIndex()
+
+def search_products(session: Session, q: str, limit: int) -> List[Tuple[Product, float]]:
+    """Products whose name starts with or resembles q, best matches first"""
+    if uses_trigram_index:
+        escaped = q.replace("/", "//").replace("%", "/%").replace("_", "/_")
+        is_prefix = Product.name.ilike(f"{escaped}%", escape="/")
+        score = case((is_prefix, 1.0), else_=func.word_similarity(q, Product.name)).label("score")
+        # both ILIKE and the <% word similarity operator are served by the gin_trgm_ops index
+        return session.query(Product, score).filter(
+            or_(is_prefix, literal(q).op("<%")(Product.name))
+        ).order_by(score.desc(), func.length(Product.name), Product.name).limit(limit).all()
+
+    if not search_index.loaded:
+        search_index.load_from_database()
+    ranked = search_index.search(q, limit)
+    products = {
+        product.id: product
+        for product in session.query(Product).filter(Product.id.in_([product_id for product_id, _ in ranked]))
+    }
+    return [(products[product_id], score) for product_id, score in ranked if product_id in products]
@@ -0,0 +1,138 @@
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import case, func, insert, or_, select, update
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal
+from app.models.product import Product
+from app.models.stock import StockMovement, StockSnapshot
+from app.services.summary import record_changes
+from app.services.sync import reserve_versions
+from app.services.product_cache import product_cache
+from app.services.change_feed import change_feed, product_stock
+
+# Sign applied to the quantity a client sends for each kind of movement.
+# Adjustments are sent already signed
+MOVEMENT_SIGNS = {"receipt": 1, "sale": -1, "shrink": -1, "adjustment": 1}
+
+def record_movements(session: Session, movements: Iterable[dict]) -> int:
+    """
+    Append (product_id, kind, quantity[, applied]) movements with one executemany.
+    Quantities must already be signed. Nothing is committed.
+    """
+    now = datetime.now()
+    rows = [
+        dict(movement, created_at=now, applied_at=now if movement.get("applied") else None)
+        for movement in movements if movement["quantity"]
+    ]
+    if rows:
+        session.execute(insert(StockMovement), rows)
+    return len(rows)
+
+def _pending_total(product_id):
+    return select(func.coalesce(func.sum(StockMovement.quantity), 0)).where(
+        StockMovement.product_id == product_id, StockMovement.applied == False  # noqa: E712
+    ).scalar_subquery()
+
+def on_hand(session: Session, product_ids: Iterable[int]) -> Dict[int, int]:
+    """
+    Units on hand now: quantity plus the movements compaction hasn't folded in yet.
+    Read in one statement, so a compaction committing meanwhile can't count a movement twice
+    """
+    return dict(session.execute(
+        select(Product.id, func.coalesce(Product.quantity, 0) + _pending_total(Product.id))
+        .where(Product.id.in_(list(product_ids)))
+    ).all())
+
+def compact_movements(session: Session) -> List:
+    """
+    Fold every pending movement into products.quantity with one UPDATE and write a
+    snapshot for each product touched. Returns the (upc, quantity) of those products.
+    Nothing is committed.
+    """
+    pending = StockMovement.applied == False  # noqa: E712
+    # lock the products first, in id order like every other multi-product write, so an
+    # immediately applied checkout movement is either in the snapshot or stamped after it
+    product_ids = session.execute(
+        select(Product.id).where(
+            Product.id.in_(select(StockMovement.product_id).where(pending))
+        ).order_by(Product.id).with_for_update(key_share=True)
+    ).scalars().all()
+    if not product_ids:
+        return []
+
+    # the movements folded are exactly those this UPDATE marks; one committing later
+    # stays pending for the next run, whatever its id
+    taken_at = datetime.now()
+    folded = (pending, StockMovement.product_id.in_(product_ids))
+    mark = update(StockMovement).where(*folded).values(applied=True, applied_at=taken_at)
+    mark = mark.execution_options(synchronize_session=False)
+    if session.get_bind().dialect.update_returning:
+        moved = session.execute(mark.returning(StockMovement.product_id, StockMovement.quantity)).all()
+    else:
+        moved = session.execute(select(StockMovement.product_id, StockMovement.quantity).where(*folded)).all()
+        session.execute(mark)
+    deltas = defaultdict(int)
+    for product_id, quantity in moved:
+        deltas[product_id] += quantity
+    if not deltas:
+        return []   # a compaction we waited on for the locks got there first
+
+    first_version = reserve_versions(session, len(deltas))
+    versions = {product_id: first_version + i for i, product_id in enumerate(deltas)}
+    columns = (Product.id, Product.upc, Product.report_code, Product.quantity, Product.price)
+    stmt = update(Product).where(Product.id.in_(deltas)).values(
+        quantity=func.coalesce(Product.quantity, 0) + case(deltas, value=Product.id),
+        version=case(versions, value=Product.id)
+    ).execution_options(synchronize_session=False)
+    if session.get_bind().dialect.update_returning:
+        rows = session.execute(stmt.returning(*columns)).all()
+    else:
+        session.execute(stmt)
+        rows = session.execute(select(*columns).where(Product.id.in_(deltas))).all()
+
+    session.execute(insert(StockSnapshot), [
+        {"product_id": row.id, "quantity": row.quantity, "taken_at": taken_at}
+        for row in rows
+    ])
+    record_changes(
+        session,
+        before=[(row.report_code, row.quantity - deltas[row.id], row.price) for row in rows],
+        after=[(row.report_code, row.quantity, row.price) for row in rows]
+    )
+    return rows
+
+def on_hand_as_of(session: Session, product: Product, as_of: datetime) -> Tuple[int, Optional[datetime]]:
+    """
+    Units on hand at as_of: the latest snapshot taken by then plus the movements made
+    by then that it doesn't include. Without a snapshot, works back from on hand now.
+    Returns the quantity and the time of the snapshot used (None if none was).
+    """
+    snapshot = session.query(StockSnapshot).filter(
+        StockSnapshot.product_id == product.id, StockSnapshot.taken_at <= as_of
+    ).order_by(StockSnapshot.taken_at.desc(), StockSnapshot.id.desc()).first()
+    total = func.coalesce(func.sum(StockMovement.quantity), 0)
+
+    if snapshot is not None:
+        tail = session.execute(select(total).where(
+            StockMovement.product_id == product.id,
+            StockMovement.created_at <= as_of,
+            or_(StockMovement.applied_at.is_(None), StockMovement.applied_at > snapshot.taken_at)
+        )).scalar_one()
+        return snapshot.quantity + tail, snapshot.taken_at
+
+    now = on_hand(session, [product.id]).get(product.id, 0)
+    later = session.execute(select(total).where(
+        StockMovement.product_id == product.id, StockMovement.created_at > as_of
+    )).scalar_one()
+    return now - later, None
+
+def run_compaction() -> int:
+    """Compact the ledger in its own transaction. Returns the number of products updated"""
+    with SessionLocal() as session:
+        rows = compact_movements(session)
+        session.commit()
+    product_cache.invalidate_many(row.upc for row in rows)
+    change_feed.publish(*(product_stock(row.upc, row.quantity) for row in rows))
+    return len(rows)
@@ -0,0 +1,99 @@
+import sys
+from collections import defaultdict
+from typing import Iterable, List, Optional, Tuple
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal, insert_for
+from app.models.inventory_summary import InventorySummary
+from app.models.product import Product
+
+# (report_code, quantity, price) of a product before or after a write
+StockRow = Tuple[Optional[int], Optional[int], float]
+
+def record_changes(session: Session, before: Iterable[StockRow] = (), after: Iterable[StockRow] = ()) -> None:
+    """
+    Apply the difference between the before and after rows of a write to the summary
+    table, inside the caller's transaction. Products without a report code aren't summarised.
+    """
+    deltas = defaultdict(lambda: [0, 0, 0.0])
+    for sign, rows in ((-1, before), (1, after)):
+        for report_code, quantity, price in rows:
+            if report_code is None:
+                continue
+            delta = deltas[report_code]
+            delta[0] += sign
+            delta[1] += sign * (quantity or 0)
+            delta[2] += sign * (quantity or 0) * price
+
+    # upserted in report code order, so two writes touching the same codes lock their
+    # summary rows in the same order and can't deadlock
+    changed = [
+        {"report_code": code, "product_count": count, "total_units": units, "total_value": value}
+        for code, (count, units, value) in sorted(deltas.items())
+        if count or units or value
+    ]
+    if not changed:
+        return
+    stmt = insert_for(InventorySummary)
+    table = InventorySummary.__table__
+    session.execute(stmt.on_conflict_do_update(
+        index_elements=["report_code"],
+        set_={
+            "product_count": table.c.product_count + stmt.excluded.product_count,
+            "total_units": table.c.total_units + stmt.excluded.total_units,
+            "total_value": table.c.total_value + stmt.excluded.total_value,
+        }
+    ), changed)
+
+def full_aggregate(session: Session):
+    """The summary computed from scratch over the products table"""
+    quantity = func.coalesce(Product.quantity, 0)
+    return select(
+        Product.report_code,
+        func.count(Product.id).label("product_count"),
+        func.sum(quantity).label("total_units"),
+        func.sum(quantity * Product.price).label("total_value"),
+    ).where(Product.report_code.isnot(None)).group_by(Product.report_code)
+
+def rebuild_summary(session: Session) -> int:
+    """Replace the summary with a full aggregate. Returns the number of report codes"""
+    session.execute(delete(InventorySummary))
+    result = session.execute(insert(InventorySummary).from_select(
+        ["report_code", "product_count", "total_units", "total_value"],
+        full_aggregate(session)
+    ))
+    return result.rowcount
+
+def check_summary(session: Session, tolerance: float = 0.01) -> List[dict]:
+    """Report codes where the maintained summary disagrees with a full aggregate"""
+    expected = {row.report_code: row for row in session.execute(full_aggregate(session))}
+    actual = {row.report_code: row for row in session.query(InventorySummary)}
+    mismatches = []
+    for report_code in sorted(expected.keys() | actual.keys()):
+        want, have = expected.get(report_code), actual.get(report_code)
+        want_values = (want.product_count, want.total_units, want.total_value) if want else (0, 0, 0.0)
+        have_values = (have.product_count, have.total_units, have.total_value) if have else (0, 0, 0.0)
+        if (want_values[0] != have_values[0] or want_values[1] != have_values[1]
+                or abs(want_values[2] - have_values[2]) > tolerance):
+            mismatches.append({
+                "report_code": report_code,
+                "expected": dict(zip(("product_count", "total_units", "total_value"), want_values)),
+                "actual": dict(zip(("product_count", "total_units", "total_value"), have_values)),
+            })
+    return mismatches
+
+# python -m app.services.summary [rebuild|check]
+if __name__ == "__main__":
+    import app.main  # noqa: F401 - registers every model
+    command = sys.argv[1] if len(sys.argv) > 1 else "check"
+    with SessionLocal() as session:
+        if command == "rebuild":
+            print(f"Rebuilt summary for {rebuild_summary(session)} report codes")
+            session.commit()
+        else:
+            mismatches = check_summary(session)
+            print(f"{len(mismatches)} report codes out of sync")
+            for mismatch in mismatches:
+                print(mismatch)
+            sys.exit(1 if mismatches else 0)
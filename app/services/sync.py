@@ -0,0 +1,91 @@
+from typing import Iterable, Optional
+from sqlalchemy import BigInteger, String, cast, func, insert, select, update
+from sqlalchemy.orm import Session
+
+from app.models.sync import SyncCounter, Tombstone
+
+# On Postgres a version is the writing transaction's id, shifted up to leave room for
+# each row's position within it. Ids come without locking anything, and every id below
+# the oldest transaction still running belongs to a finished one
+VERSION_SHIFT = 20
+
+def _xid_as_bigint(xid):
+    # xid8 has no direct cast to bigint
+    return cast(cast(xid, String), BigInteger)
+
+def reserve_versions(session: Session, count: int = 1) -> int:
+    """
+    Reserve count consecutive sync versions for rows written in the caller's transaction
+    and return the first. On Postgres they come from the transaction id, so concurrent
+    writers never wait on each other for one. SQLite runs one writer at a time anyway,
+    so there a counter row hands them out.
+    """
+    if session.get_bind().dialect.name != "postgresql":
+        stmt = update(SyncCounter).where(SyncCounter.id == 1).values(value=SyncCounter.value + count)
+        if session.get_bind().dialect.update_returning:
+            last = session.execute(stmt.returning(SyncCounter.value)).scalar_one()
+        else:
+            session.execute(stmt)
+            last = session.execute(select(SyncCounter.value).where(SyncCounter.id == 1)).scalar_one()
+        return last - count + 1
+
+    transaction = session.get_transaction()
+    state = session.info.get("sync_versions")
+    if state is None or state[0] is not transaction:
+        xid = session.execute(select(_xid_as_bigint(func.pg_current_xact_id()))).scalar_one()
+        state = session.info["sync_versions"] = [transaction, xid << VERSION_SHIFT, 0]
+    if state[2] + count > 1 << VERSION_SHIFT:
+        raise ValueError("Too many rows written in one transaction to version them")
+    first = state[1] + state[2]
+    state[2] += count
+    return first
+
+def visible_before(session: Session) -> Optional[int]:
+    """
+    Versions below this are final: no transaction still running can commit one. None on
+    SQLite, where a write can't start until the one before it has committed
+    """
+    if session.get_bind().dialect.name != "postgresql":
+        return None
+    oldest_running = func.pg_snapshot_xmin(func.pg_current_snapshot())
+    return session.execute(select(_xid_as_bigint(oldest_running))).scalar_one() << VERSION_SHIFT
+
+def record_tombstones(session: Session, entity: str, keys: Iterable[int]) -> None:
+    keys = list(keys)
+    if not keys:
+        return
+    first = reserve_versions(session, len(keys))
+    session.execute(insert(Tombstone), [
+        {"entity": entity, "entity_key": key, "version": first + i}
+        for i, key in enumerate(keys)
+    ])
+
+def changes_since(session: Session, model, entity: str, since: int, size: int) -> dict:
+    """
+    Rows written and keys deleted after version `since`, oldest first, at most size in total.
+    Clients apply `deleted` before `rows`; a row only appears if it outlived its tombstones.
+    since=0 is a full sync. Writes of transactions still running are held back, along
+    with anything versioned after them.
+    """
+    horizon = visible_before(session)
+    window = [model.version > since]
+    tombstone_window = [Tombstone.version > since]
+    if horizon is not None:
+        window.append(model.version < horizon)
+        tombstone_window.append(Tombstone.version < horizon)
+    rows = session.query(model).filter(*window).order_by(model.version, model.id).limit(size).all()
+    tombstones = session.query(Tombstone.entity_key, Tombstone.version).filter(
+        Tombstone.entity == entity, *tombstone_window
+    ).order_by(Tombstone.version).limit(size).all()
+
+    # merge both streams by version and cut at size so no version is skipped
+    merged = sorted(
+        [(row.version, row) for row in rows] + [(t.version, t) for t in tombstones],
+        key=lambda pair: pair[0]
+    )[:size]
+    return {
+        "rows": [item for _, item in merged if isinstance(item, model)],
+        "deleted": [item.entity_key for _, item in merged if not isinstance(item, model)],
+        "version": merged[-1][0] if merged else since,
+        "has_more": len(merged) == size
+    }
@@ -0,0 +1,27 @@
+from typing import Optional
+
+from app.config import settings
+from app.database import SessionLocal
+from app.models.user import User
+from app.services.cache import TTLCache
+
+# Authenticated users by username, so get_current_user skips its own database round trip.
+# Every path that deletes a user or changes their role must invalidate the username.
+# Other processes only notice when the entry expires, which bounds how stale a role can be
+user_cache = TTLCache(settings.USER_CACHE_SIZE, settings.USER_CACHE_TTL_SECONDS)
+
+def get_user_by_username(username: str) -> Optional[User]:
+    """Look up a user through the cache, falling back to the database"""
+    user = user_cache.get(username)
+    if user is not None:
+        return user
+    # a role change or delete landing mid-read must not leave the old user cached
+    generation = user_cache.generation
+    with SessionLocal() as session:
+        user = session.query(User).filter(User.username == username).first()
+        if user is None:
+            return None
+        # detach with every column loaded, so the cached copy never goes back to a session
+        session.expunge(user)
+    user_cache.set(username, user, generation)
+    return user
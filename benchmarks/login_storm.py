@@ -0,0 +1,78 @@
+"""
+Load test: latency of an ordinary endpoint while a storm of logins hits the server.
+Every login is for its own user, but they all come from this one address, so start the
+API with the login rate limits out of the way or the storm is mostly refused with 429
+before reaching bcrypt:
+
+    LOGIN_USERNAME_BURST=1000000 LOGIN_IP_BURST=1000000 \
+    LOGIN_USERNAME_PER_MINUTE=1000000 LOGIN_IP_PER_MINUTE=1000000 uvicorn app.main:app
+
+then:
+
+    python -m benchmarks.login_storm [base url] [concurrent logins]
+"""
+import statistics
+import sys
+import threading
+import time
+import uuid
+import httpx
+
+PROBES = 100
+
+def probe_latencies(client: httpx.Client) -> list:
+    timings = []
+    for _ in range(PROBES):
+        start = time.perf_counter()
+        client.get("/products/", params={"size": 10}).raise_for_status()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+def report(label: str, timings: list) -> None:
+    timings = sorted(timings)
+    p95 = timings[int(len(timings) * 0.95) - 1]
+    print(f"{label:>14}: p50 {statistics.median(timings):6.1f} ms   p95 {p95:6.1f} ms   max {timings[-1]:6.1f} ms")
+
+def main(base_url: str = "http://localhost:8000", logins: int = 64):
+    run = uuid.uuid4().hex[:8]
+    usernames = [f"storm-{run}-{i}" for i in range(logins)]
+    with httpx.Client(base_url=base_url, timeout=60) as client:
+        for username in usernames:
+            client.post("/users/register", json={
+                "username": username, "password": "stormpassword", "role": "employee", "email": f"{username}@example.com"
+            }).raise_for_status()
+        report("idle", probe_latencies(client))
+
+        statuses = []
+        def login(username):
+            with httpx.Client(base_url=base_url, timeout=60) as login_client:
+                response = login_client.post("/users/login", data={"username": username, "password": "stormpassword"})
+                statuses.append(response.status_code)
+
+        stop = threading.Event()
+        def storm():
+            while not stop.is_set():
+                threads = [threading.Thread(target=login, args=(username,)) for username in usernames]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+
+        storm_thread = threading.Thread(target=storm)
+        storm_thread.start()
+        time.sleep(1)
+        try:
+            report("login storm", probe_latencies(client))
+        finally:
+            stop.set()
+            storm_thread.join()
+
+    ok, shed, limited = statuses.count(200), statuses.count(503), statuses.count(429)
+    other = len(statuses) - ok - shed - limited
+    print(f"{len(statuses)} logins: {ok} ok, {shed} shed with 503, {limited} rate limited with 429, {other} other")
+    if limited:
+        print("429s never reached bcrypt: restart the API with higher LOGIN_* limits (see above)")
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    main(*args[:1], *(int(arg) for arg in args[1:2]))
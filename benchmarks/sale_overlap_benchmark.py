@@ -0,0 +1,60 @@
+"""
+Benchmark the overlap check run on every new sale as a product's promotion history grows.
+
+    python -m benchmarks.sale_overlap_benchmark [number of products]
+"""
+import sys
+import time
+from datetime import date, timedelta
+from sqlalchemy import create_engine, insert, text
+from sqlalchemy.orm import Session
+
+from app.database import Base
+from app.models.product import Product
+from app.models.sale import Sale
+from app.services.sale_index import overlapping_sales
+
+CHECKS = 2_000
+
+def add_years(session: Session, products: int, first_week: int, weeks: int) -> None:
+    """One week-long sale per product per week, oldest first"""
+    start = date(2000, 1, 3)
+    session.execute(insert(Sale), [
+        {
+            "product_id": product_id,
+            "sale_price": 1.0,
+            "sale_start": start + timedelta(weeks=week),
+            "sale_end": start + timedelta(weeks=week, days=6)
+        }
+        for week in range(first_week, first_week + weeks)
+        for product_id in range(1, products + 1)
+    ])
+
+def main(products: int = 1_000):
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.execute(insert(Product), [
+            {"id": i, "upc": i, "name": f"Product {i}", "quantity": 1, "price": 1.0} for i in range(1, products + 1)
+        ])
+        plan = session.execute(text(
+            "EXPLAIN QUERY PLAN SELECT * FROM sales WHERE product_id = 1 AND sale_end >= '2000-01-01' "
+            "AND sale_start <= '2000-01-07'"
+        )).all()
+        print("plan:", "; ".join(row[-1] for row in plan))
+
+        weeks_done = 0
+        for years in (1, 2, 5, 10, 20):
+            add_years(session, products, weeks_done, years * 52 - weeks_done)
+            weeks_done = years * 52
+            # a new sale right after the latest week, the usual case
+            latest = date(2000, 1, 3) + timedelta(weeks=weeks_done)
+            begin = time.perf_counter()
+            for i in range(CHECKS):
+                overlapping_sales(session, i % products + 1, latest, latest + timedelta(days=6))
+            elapsed = time.perf_counter() - begin
+            print(f"{years:>2} years ({weeks_done * products:>9,} sales): "
+                  f"{elapsed / CHECKS * 1_000_000:.0f} us per overlap check")
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:2]))
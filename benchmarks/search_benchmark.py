@@ -0,0 +1,43 @@
+"""
+Benchmark the in-memory product name index over a synthetic catalog.
+
+    python -m benchmarks.search_benchmark [number of products]
+"""
+import random
+import sys
+import time
+
+from app.services.search import ProductSearchIndex
+
+BRANDS = ["Acme", "Golden", "Farm Fresh", "Sunny", "Valley", "Green Leaf", "Blue Ridge", "Harvest"]
+ITEMS = ["Milk", "Bread", "Cheddar Cheese", "Orange Juice", "Brown Rice", "Peanut Butter", "Apple Sauce",
+         "Chocolate Chips", "Greek Yogurt", "Tomato Soup", "Pasta", "Coffee Beans", "Maple Syrup"]
+SIZES = ["8 oz", "12 oz", "16 oz", "1 lb", "2 lb", "1 gal", "half gal", "family size"]
+QUERIES = ["gold", "farm fresh mi", "chedar chese", "peanut buter", "valley orange", "cofee beans", "map"]
+
+def synthetic_names(count: int):
+    rng = random.Random(42)
+    for product_id in range(1, count + 1):
+        yield product_id, f"{rng.choice(BRANDS)} {rng.choice(ITEMS)} {rng.choice(SIZES)} {product_id}"
+
+def main(count: int = 500_000):
+    index = ProductSearchIndex()
+    start = time.perf_counter()
+    index.load(synthetic_names(count))
+    print(f"built index over {count:,} names in {time.perf_counter() - start:.1f}s")
+
+    for q in QUERIES:
+        timings = []
+        for _ in range(5):
+            start = time.perf_counter()
+            results = index.search(q, 20)
+            timings.append(time.perf_counter() - start)
+        print(f"{q!r:>18}: {len(results):>2} results, best of 5 {min(timings) * 1000:.1f} ms")
+
+    start = time.perf_counter()
+    for product_id in range(count + 1, count + 1001):
+        index.add(product_id, f"New Product {product_id}")
+    print(f"1,000 incremental adds in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 500_000)
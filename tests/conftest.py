@@ -1,7 +1,8 @@
 import os
 import sys
 import pytest
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
 
 # make sure the project root (grocery-inventory) is in sys.path, not test/
 ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
@@ -10,6 +11,13 @@ if ROOT not in sys.path:
 
 from app.database import SessionLocal, Base
 from app.config import settings
+from app.services.product_cache import product_cache
+from app.services.user_cache import user_cache
+from app.services.search import search_index
+from app.services.change_feed import change_feed
+from app.services.sale_index import sale_index
+from app.services.revocation import revocation_list
+from app.services.login_limiter import username_limiter, ip_limiter
 
 # bind session to the test
 engine = create_engine(settings.TEST_DATABASE_URL, echo=False)
@@ -20,4 +28,24 @@ def use_test_database():
     # Reset DB for each test
     Base.metadata.drop_all(bind=engine)
     Base.metadata.create_all(bind=engine)
-    yield
\ No newline at end of file
+    # In-process caches would otherwise leak rows from earlier tests
+    product_cache.clear()
+    user_cache.clear()
+    search_index.clear()
+    change_feed.clear()
+    sale_index.clear()
+    # the database was just emptied, so the revocation list starts loaded and empty
+    revocation_list.load([])
+    username_limiter.clear()
+    ip_limiter.clear()
+    yield
+
+@pytest.fixture
+def count_queries():
+    """Collects every SQL statement executed while the test runs"""
+    statements = []
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    event.listen(Engine, "before_cursor_execute", record)
+    yield statements
+    event.remove(Engine, "before_cursor_execute", record)
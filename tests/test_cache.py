@@ -0,0 +1,68 @@
+from app.services.cache import TTLCache
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+class TestTTLCache:
+    def test_get_and_set(self):
+        """Test a stored value is returned and counted as a hit"""
+        cache = TTLCache(maxsize=10, ttl=60)
+        cache.set("a", 1)
+
+        assert cache.get("a") == 1
+        assert cache.get("b") is None
+        assert cache.stats()["hits"] == 1
+        assert cache.stats()["misses"] == 1
+
+    def test_least_recently_used_is_evicted(self):
+        """Test the cache drops the least recently used entry when full"""
+        cache = TTLCache(maxsize=2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+
+        assert cache.get("b") is None
+        assert cache.get("a") == 1
+        assert cache.get("c") == 3
+        assert cache.stats()["evictions"] == 1
+
+    def test_entries_expire(self):
+        """Test entries are not returned after their ttl"""
+        clock = FakeClock()
+        cache = TTLCache(maxsize=10, ttl=30, clock=clock)
+        cache.set("a", 1)
+
+        clock.now = 29
+        assert cache.get("a") == 1
+        clock.now = 30
+        assert cache.get("a") is None
+        assert cache.stats()["size"] == 0
+
+    def test_invalidate(self):
+        """Test invalidating single keys and many keys"""
+        cache = TTLCache(maxsize=10, ttl=60)
+        for key in "abc":
+            cache.set(key, key)
+
+        cache.invalidate("a")
+        cache.invalidate_many(["b", "missing"])
+
+        assert cache.get("a") is None
+        assert cache.get("b") is None
+        assert cache.get("c") == "c"
+
+    def test_set_after_invalidation_is_dropped(self):
+        """Test a value loaded before an invalidation isn't cached after it"""
+        cache = TTLCache(maxsize=10, ttl=60)
+        generation = cache.generation
+        cache.invalidate("a")
+        cache.set("a", "stale", generation)
+
+        assert cache.get("a") is None
+        cache.set("a", "fresh", cache.generation)
+        assert cache.get("a") == "fresh"
@@ -0,0 +1,63 @@
+import asyncio
+import threading
+
+from app.services.change_feed import ChangeFeed
+
+class TestChangeFeed:
+    def test_resume_returns_only_missed_events(self):
+        """Test a client resuming from a token gets only later events"""
+        feed = ChangeFeed(maxlen=10)
+        feed.publish({"n": 1}, {"n": 2})
+        token = feed.token(1)
+        feed.publish({"n": 3})
+
+        sequence, missed = feed.resume(token)
+
+        assert missed is False
+        assert [event["n"] for _, event in feed.since(sequence)] == [2, 3]
+
+    def test_no_token_starts_from_now(self):
+        """Test a new client doesn't replay history"""
+        feed = ChangeFeed(maxlen=10)
+        feed.publish({"n": 1})
+
+        sequence, missed = feed.resume(None)
+
+        assert missed is False
+        assert feed.since(sequence) == []
+
+    def test_token_older_than_buffer_needs_resync(self):
+        """Test a client that fell behind the buffer is told to resync"""
+        feed = ChangeFeed(maxlen=2)
+        feed.publish({"n": 1})
+        token = feed.token(1)
+        feed.publish({"n": 2}, {"n": 3}, {"n": 4})
+
+        assert feed.resume(token)[1] is True
+
+    def test_token_from_another_process_needs_resync(self):
+        """Test tokens from before a restart are rejected"""
+        old, new = ChangeFeed(maxlen=10), ChangeFeed(maxlen=10)
+        old.epoch, new.epoch = "a", "b"
+        old.publish({"n": 1})
+
+        assert new.resume(old.token(1))[1] is True
+        assert new.resume("garbage")[1] is True
+
+    def test_wait_wakes_on_publish_from_another_thread(self):
+        """Test a waiting listener is woken by a write from a worker thread"""
+        feed = ChangeFeed(maxlen=10)
+
+        async def listen():
+            timer = threading.Timer(0.05, feed.publish, args=({"n": 1},))
+            timer.start()
+            return await feed.wait(0, timeout=5)
+
+        events = asyncio.run(listen())
+        assert [event["n"] for _, event in events] == [1]
+
+    def test_wait_times_out(self):
+        """Test wait returns nothing when no event arrives"""
+        feed = ChangeFeed(maxlen=10)
+
+        assert asyncio.run(feed.wait(0, timeout=0.01)) == []
@@ -4,6 +4,7 @@ from datetime import datetime, timedelta
 from unittest.mock import patch
 
 from app.main import app
+from app.services.notifications import notification_service
 
 client = TestClient(app)
 
@@ -165,4 +166,29 @@ class TestEmailNotifications:
         # The sale should have product relationship loaded
         sale = sales_list[0]
         assert sale["product"]["name"] == "Test Product"
-        assert sale["sale_price"] == 7.99
\ No newline at end of file
+        assert sale["sale_price"] == 7.99
+
+    def test_expiring_sales_query_count_is_constant(self, employee_token, count_queries):
+        """Test expiring sales load their products in the same query, however many there are"""
+        headers = TestHelper.auth_headers(employee_token)
+        today = datetime.now().date()
+        counts = []
+        for upc in (1, 2, 3, 4, 5):
+            client.post("/products/", json={
+                "upc": upc, "name": f"Product {upc}", "price": 1.0,
+                "quantity": 1, "report_code": 1, "reorder_threshold": 0
+            }, headers=headers)
+            product_id = client.get(f"/products/{upc}").json()["id"]
+            client.post("/sales/", json={
+                "product_id": product_id,
+                "sale_price": 0.5,
+                "sale_start": today.isoformat(),
+                "sale_end": (today + timedelta(days=upc)).isoformat()
+            }, headers=headers)
+
+            count_queries.clear()
+            sales = notification_service.check_expiring_sales()
+            counts.append(len(count_queries))
+            assert [sale["product"]["name"] for sale in sales] == [f"Product {i}" for i in range(1, upc + 1)]
+
+        assert counts == [1] * 5
@@ -1,7 +1,18 @@
+import gzip
+import json
+import math
+import numpy as np
 import pytest
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
 from fastapi.testclient import TestClient
 
 from app.main import app
+from app.database import SessionLocal
+from app.models.inventory_summary import InventorySummary
+from app.services.reorder import recommend_thresholds
+from app.config import settings
 
 client = TestClient(app)
 
@@ -88,8 +99,52 @@ class TestGetProducts:
         assert response.status_code == 200
         product = response.json()["products"][0]
         del product["id"]
+        del product["version"]
         assert product == sample_product
 
+    def test_get_products_cursor_walk(self, employee_token, sample_product):
+        """Test walking all products with the next_cursor token"""
+        headers = TestHelper.auth_headers(employee_token)
+        for i in range(5):
+            product = sample_product.copy()
+            product["upc"] = 1000 + i
+            client.post("/products/", json=product, headers=headers)
+
+        seen = []
+        response = client.get("/products/?size=2")
+        while True:
+            data = response.json()
+            seen.extend(p["upc"] for p in data["products"])
+            if data["next_cursor"] is None:
+                break
+            response = client.get(f"/products/?size=2&after={data['next_cursor']}")
+            assert response.json()["page"] is None
+
+        assert seen == [1000, 1001, 1002, 1003, 1004]
+
+    def test_get_products_invalid_cursor(self):
+        """Test a garbage cursor is rejected"""
+        response = client.get("/products/?after=not-a-cursor")
+
+        assert response.status_code == 400
+        assert response.json()["detail"] == "Invalid cursor"
+
+    def test_get_products_cursor_with_non_integer_key(self):
+        """Test a well-formed cursor whose key isn't an integer id is rejected"""
+        from app.core.pagination import encode_cursor
+        for key in ([1, 2], {"upc": 1}, None, True, "abc", "1", 1.5):
+            response = client.get(f"/products/?after={encode_cursor(key)}")
+            assert response.status_code == 400
+
+    def test_get_products_empty_page_size(self, employee_token, sample_product):
+        """Test a page size of 0 returns an empty page and no cursor"""
+        client.post("/products/", json=sample_product, headers=TestHelper.auth_headers(employee_token))
+        response = client.get("/products/?size=0")
+
+        assert response.status_code == 200
+        assert response.json()["products"] == []
+        assert response.json()["next_cursor"] is None
+
 class TestCreateProducts:
     def test_create_product_requires_auth(self, sample_product):
         """Test creating product without authentication fails"""
@@ -155,4 +210,1053 @@ class TestDeleteProducts:
         
         response = client.delete("/products/99999", headers=headers)
         assert response.status_code == 404  # Not Found
-        assert response.json()["detail"] == "Product not found!"
\ No newline at end of file
+        assert response.json()["detail"] == "Product not found!"
+
+class TestBulkImportProducts:
+    def test_bulk_import_requires_auth(self):
+        """Test bulk import without authentication fails"""
+        response = client.post("/products/bulk", content="", headers={"Content-Type": "text/csv"})
+
+        assert response.status_code == 401
+
+    def test_bulk_import_csv(self, employee_token):
+        """Test importing products from CSV, with a bad row reported by row number"""
+        headers = TestHelper.auth_headers(employee_token)
+        headers["Content-Type"] = "text/csv"
+        body = (
+            "upc,name,quantity,price,report_code,reorder_threshold\n"
+            "1,Milk,10,3.49,100,5\n"
+            "2,Eggs,not-a-number,4.99,100,5\n"
+            "3,Bread,20,2.99,200,5\n"
+        )
+        response = client.post("/products/bulk", content=body, headers=headers)
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["processed"] == 3
+        assert data["imported"] == 2
+        assert [e["row"] for e in data["errors"]] == [2]
+
+        products = client.get("/products/").json()["products"]
+        assert [p["name"] for p in products] == ["Milk", "Bread"]
+
+    def test_bulk_import_ndjson_upserts_on_upc(self, employee_token, sample_product):
+        """Test NDJSON import updates existing products with the same upc"""
+        headers = TestHelper.auth_headers(employee_token)
+        client.post("/products/", json=sample_product, headers=headers)
+
+        updated = dict(sample_product, price=1.99, quantity=5)
+        new = dict(sample_product, upc=456, name="Other Product")
+        headers["Content-Type"] = "application/x-ndjson"
+        body = "\n".join(json.dumps(p) for p in [updated, new]) + "\n{bad json\n"
+        response = client.post("/products/bulk", content=body, headers=headers)
+
+        data = response.json()
+        assert data["imported"] == 2
+        assert data["errors"][0]["row"] == 3
+
+        products = {p["upc"]: p for p in client.get("/products/").json()["products"]}
+        assert len(products) == 2
+        assert products[123]["price"] == 1.99
+        assert products[123]["quantity"] == 5
+
+    def test_bulk_import_csv_quoted_newlines(self, employee_token):
+        """Test a quoted CSV field may span lines without splitting the row"""
+        headers = dict(TestHelper.auth_headers(employee_token), **{"Content-Type": "text/csv"})
+        body = (
+            "upc,name,quantity,price,report_code,reorder_threshold\r\n"
+            '1,"Milk\r\n2%, ""organic""",10,3.49,100,5\r\n'
+            "2,Eggs,12,4.99,100,5\r\n"
+        )
+        response = client.post("/products/bulk", content=body, headers=headers)
+
+        data = response.json()
+        assert data["processed"] == 2
+        assert data["errors"] == []
+        products = client.get("/products/").json()["products"]
+        assert [p["name"] for p in products] == ['Milk\r\n2%, "organic"', "Eggs"]
+
+    def test_bulk_import_invalid_utf8_is_a_row_error(self, employee_token, sample_product):
+        """Test a row that isn't UTF-8 is reported by row number instead of failing the upload"""
+        headers = dict(TestHelper.auth_headers(employee_token), **{"Content-Type": "application/x-ndjson"})
+        body = b'{"upc": 1, "name": "Caf\xe9"}\n' + json.dumps(sample_product).encode() + b"\n"
+        response = client.post("/products/bulk", content=body, headers=headers)
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["imported"] == 1
+        assert data["errors"] == [{"row": 1, "error": "Invalid UTF-8"}]
+
+        headers["Content-Type"] = "text/csv"
+        body = b"upc,name,quantity,price,report_code,reorder_threshold\n1,Caf\xe9,1,1.0,100,1\n"
+        data = client.post("/products/bulk", content=body, headers=headers).json()
+        assert data["errors"] == [{"row": 1, "error": "Invalid UTF-8"}]
+
+    def test_bulk_import_reports_only_the_rows_the_database_refuses(self, employee_token):
+        """Test one row the database refuses doesn't take the rest of its chunk down with it"""
+        headers = dict(TestHelper.auth_headers(employee_token), **{"Content-Type": "text/csv"})
+        body = (
+            "upc,name,quantity,price,report_code,reorder_threshold\n"
+            "1,Milk,10,3.49,100,5\n"
+            f"{2 ** 64},Eggs,12,4.99,100,5\n"
+            "3,Bread,20,2.99,200,5\n"
+        )
+        data = client.post("/products/bulk", content=body, headers=headers).json()
+
+        assert data["imported"] == 2
+        assert [e["row"] for e in data["errors"]] == [2]
+        assert data["errors"][0]["error"].startswith("Invalid product: ")
+        assert data["errors"][0]["error"] != "Invalid product: "
+        products = client.get("/products/").json()["products"]
+        assert [p["name"] for p in products] == ["Milk", "Bread"]
+
+    def test_bulk_import_unsupported_content_type(self, employee_token):
+        """Test bulk import rejects bodies that are not CSV or NDJSON"""
+        headers = TestHelper.auth_headers(employee_token)
+        response = client.post("/products/bulk", json=[], headers=headers)
+
+        assert response.status_code == 415
+
+class TestGetProductByUpc:
+    def test_get_product_by_upc(self, employee_token, sample_product):
+        """Test looking up a single product by upc"""
+        headers = TestHelper.auth_headers(employee_token)
+        client.post("/products/", json=sample_product, headers=headers)
+
+        response = client.get(f"/products/{sample_product['upc']}")
+        assert response.status_code == 200
+        product = response.json()
+        del product["id"]
+        del product["version"]
+        assert product == sample_product
+
+    def test_write_during_lookup_is_not_cached_stale(self, employee_token, sample_product, monkeypatch):
+        """Test a row read just before a write commits isn't cached once the write invalidates it"""
+        from app.services import product_cache as cache_module
+        client.post("/products/", json=sample_product, headers=TestHelper.auth_headers(employee_token))
+        to_dict = cache_module.product_to_dict
+
+        def read_then_write(row):
+            product = to_dict(row)
+            # a price change commits and invalidates between the read and the set
+            cache_module.product_cache.invalidate(row.upc)
+            return product
+
+        monkeypatch.setattr(cache_module, "product_to_dict", read_then_write)
+        assert cache_module.get_product_by_upc(sample_product["upc"]) is not None
+        assert cache_module.product_cache.get(sample_product["upc"]) is None
+
+    def test_get_nonexistent_product(self):
+        """Test looking up a upc that doesn't exist"""
+        response = client.get("/products/99999")
+
+        assert response.status_code == 404
+        assert response.json()["detail"] == "Product not found!"
+
+    def test_lookup_is_cached(self, employee_token, sample_product):
+        """Test repeated lookups are served from the cache"""
+        headers = TestHelper.auth_headers(employee_token)
+        client.post("/products/", json=sample_product, headers=headers)
+
+        client.get(f"/products/{sample_product['upc']}")
+        client.get(f"/products/{sample_product['upc']}")
+
+        stats = client.get("/admin/cache-stats").json()["products"]
+        assert stats["hits"] >= 1
+        assert stats["size"] == 1
+
+    def test_delete_invalidates_cache(self, manager_token, sample_product):
+        """Test a deleted product is no longer returned from the cache"""
+        headers = TestHelper.auth_headers(manager_token)
+        client.post("/products/", json=sample_product, headers=headers)
+        assert client.get(f"/products/{sample_product['upc']}").status_code == 200
+
+        client.delete(f"/products/{sample_product['upc']}", headers=headers)
+
+        assert client.get(f"/products/{sample_product['upc']}").status_code == 404
+
+    def test_bulk_import_invalidates_cache(self, employee_token, sample_product):
+        """Test a bulk upsert replaces the cached product"""
+        headers = TestHelper.auth_headers(employee_token)
+        client.post("/products/", json=sample_product, headers=headers)
+        client.get(f"/products/{sample_product['upc']}")
+
+        headers["Content-Type"] = "application/x-ndjson"
+        client.post("/products/bulk", content=json.dumps(dict(sample_product, price=0.99)), headers=headers)
+
+        assert client.get(f"/products/{sample_product['upc']}").json()["price"] == 0.99
+
+class TestPriceCheck:
+    def test_price_check_applies_active_sales(self, employee_token, sample_product):
+        """Test only sales running today change the effective price"""
+        headers = TestHelper.auth_headers(employee_token)
+        client.post("/products/", json=sample_product, headers=headers)
+        client.post("/products/", json=dict(sample_product, upc=456, price=2.50), headers=headers)
+        product_id = client.get(f"/products/{sample_product['upc']}").json()["id"]
+
+        today = date.today()
+        client.post("/sales/", json={
+            "product_id": product_id,
+            "sale_price": 7.99,
+            "sale_start": str(today - timedelta(days=1)),
+            "sale_end": str(today + timedelta(days=1))
+        }, headers=headers)
+        client.post("/sales/", json={
+            "product_id": product_id,
+            "sale_price": 1.00,
+            "sale_start": str(today - timedelta(days=10)),
+            "sale_end": str(today - timedelta(days=5))
+        }, headers=headers)
+
+        response = client.post("/products/price-check", json={"upcs": [456, 123, 789]})
+
+        assert response.status_code == 200
+        data = response.json()
+        assert [p["upc"] for p in data["prices"]] == [456, 123]
+        assert data["prices"][0]["effective_price"] == 2.50
+        assert data["prices"][0]["sale_price"] is None
+        assert data["prices"][1]["effective_price"] == 7.99
+        assert data["not_found"] == [789]
+
+    def test_price_check_empty_basket(self):
+        """Test an empty basket is rejected"""
+        response = client.post("/products/price-check", json={"upcs": []})
+
+        assert response.status_code == 422
+
+class TestCheckout:
+    def test_checkout_requires_auth(self):
+        """Test checkout without authentication fails"""
+        response = client.post("/products/checkout", json={"items": [{"upc": 123, "quantity": 1}]})
+
+        assert response.status_code == 401
+
+    def test_checkout_decrements_stock(self, employee_token, sample_product):
+        """Test a basket decrements every item, combining repeated upcs"""
+        headers = TestHelper.auth_headers(employee_token)
+        client.post("/products/", json=sample_product, headers=headers)
+        client.post("/products/", json=dict(sample_product, upc=456), headers=headers)
+
+        basket = {"items": [{"upc": 123, "quantity": 2}, {"upc": 456, "quantity": 5}, {"upc": 123, "quantity": 1}]}
+        response = client.post("/products/checkout", json=basket, headers=headers)
+
+        assert response.status_code == 200
+        remaining = {r["upc"]: r["quantity"] for r in response.json()["remaining"]}
+        assert remaining == {123: 47, 456: 45}
+        assert client.get("/products/123").json()["quantity"] == 47
+
+    def test_checkout_rejects_negative_stock(self, employee_token, sample_product):
+        """Test a basket that oversells any item changes nothing"""
+        headers = TestHelper.auth_headers(employee_token)
+        client.post("/products/", json=sample_product, headers=headers)
+        client.post("/products/", json=dict(sample_product, upc=456), headers=headers)
+
+        basket = {"items": [{"upc": 123, "quantity": 1}, {"upc": 456, "quantity": 51}]}
+        response = client.post("/products/checkout", json=basket, headers=headers)
+
+        assert response.status_code == 409
+        assert response.json()["detail"]["items"] == [{"upc": 456, "requested": 51, "available": 50}]
+        assert client.get("/products/123").json()["quantity"] == 50
+        assert client.get("/products/456").json()["quantity"] == 50
+
+    def test_checkout_allow_negative_flags_items(self, employee_token, sample_product):
+        """Test allow_negative records the sale and flags the oversold item"""
+        headers = TestHelper.auth_headers(employee_token)
+        client.post("/products/", json=sample_product, headers=headers)
+
+        basket = {"items": [{"upc": 123, "quantity": 52}], "allow_negative": True}
+        response = client.post("/products/checkout", json=basket, headers=headers)
+
+        assert response.status_code == 200
+        assert response.json()["negative_stock"][0]["upc"] == 123
+        assert client.get("/products/123/stock").json()["on_hand"] == -2
+
+    def test_checkout_allow_negative_goes_through_the_ledger(self, manager_token, sample_product, count_queries):
+        """Test an allow_negative basket leaves the product row alone until compaction"""
+        headers = TestHelper.auth_headers(manager_token)
+        client.post("/products/", json=sample_product, headers=headers)
+
+        count_queries.clear()
+        basket = {"items": [{"upc": 123, "quantity": 5}], "allow_negative": True}
+        assert client.post("/products/checkout", json=basket, headers=headers).json()["remaining"][0]["quantity"] == 45
+        assert not any(statement.startswith("UPDATE products") for statement in count_queries)
+        assert client.get("/products/123").json()["quantity"] == 50
+
+        # strict baskets count the pending sale too
+        strict = {"items": [{"upc": 123, "quantity": 46}]}
+        assert client.post("/products/checkout", json=strict, headers=headers).status_code == 409
+
+        client.post("/admin/stock/compact", headers=headers)
+        assert client.get("/products/123").json()["quantity"] == 45
+
+    def test_checkout_unknown_upc(self, employee_token, sample_product):
+        """Test a basket with an unknown upc is rejected"""
+        headers = TestHelper.auth_headers(employee_token)
+        client.post("/products/", json=sample_product, headers=headers)
+
+        basket = {"items": [{"upc": 123, "quantity": 1}, {"upc": 999, "quantity": 1}]}
+        response = client.post("/products/checkout", json=basket, headers=headers)
+
+        assert response.status_code == 404
+        assert response.json()["detail"]["upcs"] == [999]
+        assert client.get("/products/123").json()["quantity"] == 50
+
+    def test_concurrent_checkouts_lose_no_updates(self, employee_token, sample_product):
+        """Test dozens of parallel registers selling the same items never lose a decrement"""
+        headers = TestHelper.auth_headers(employee_token)
+        client.post("/products/", json=dict(sample_product, quantity=1000), headers=headers)
+        client.post("/products/", json=dict(sample_product, upc=456, quantity=1000), headers=headers)
+
+        basket = {"items": [{"upc": 123, "quantity": 3}, {"upc": 456, "quantity": 1}]}
+
+        def register(_):
+            return client.post("/products/checkout", json=basket, headers=headers).status_code
+
+        with ThreadPoolExecutor(max_workers=32) as pool:
+            statuses = list(pool.map(register, range(200)))
+
+        assert statuses.count(200) == 200
+        assert client.get("/products/123").json()["quantity"] == 1000 - 3 * 200
+        assert client.get("/products/456").json()["quantity"] == 1000 - 200
+
+    def test_concurrent_checkouts_never_oversell(self, employee_token, sample_product):
+        """Test parallel baskets competing for the last units can't take stock negative"""
+        headers = TestHelper.auth_headers(employee_token)
+        client.post("/products/", json=dict(sample_product, quantity=30), headers=headers)
+
+        basket = {"items": [{"upc": 123, "quantity": 1}]}
+
+        def register(_):
+            return client.post("/products/checkout", json=basket, headers=headers).status_code
+
+        with ThreadPoolExecutor(max_workers=32) as pool:
+            statuses = list(pool.map(register, range(50)))
+
+        assert statuses.count(200) == 30
+        assert statuses.count(409) == 20
+        assert client.get("/products/123").json()["quantity"] == 0
+
+class TestLowStock:
+    def test_low_stock_report(self, employee_token, sample_product):
+        """Test only products at or below their reorder threshold are listed"""
+        headers = TestHelper.auth_headers(employee_token)
+        client.post("/products/", json=dict(sample_product, upc=1, quantity=50), headers=headers)
+        client.post("/products/", json=dict(sample_product, upc=2, quantity=10), headers=headers)
+        client.post("/products/", json=dict(sample_product, upc=3, quantity=0, report_code=99), headers=headers)
+
+        response = client.get("/products/low-stock")
+        assert response.status_code == 200
+        assert [p["upc"] for p in response.json()["products"]] == [2, 3]
+
+        response = client.get("/products/low-stock?report_code=99")
+        assert [p["upc"] for p in response.json()["products"]] == [3]
+
+    def test_low_stock_cursor(self, employee_token, sample_product):
+        """Test paging through the low stock report with a cursor"""
+        headers = TestHelper.auth_headers(employee_token)
+        for upc in range(1, 4):
+            client.post("/products/", json=dict(sample_product, upc=upc, quantity=0), headers=headers)
+
+        first = client.get("/products/low-stock?size=2").json()
+        second = client.get(f"/products/low-stock?size=2&after={first['next_cursor']}").json()
+
+        assert [p["upc"] for p in first["products"]] == [1, 2]
+        assert [p["upc"] for p in second["products"]] == [3]
+        assert second["next_cursor"] is None
+
+class TestSearchProducts:
+    def create_products(self, token, sample_product, names):
+        headers = TestHelper.auth_headers(token)
+        for upc, name in enumerate(names, start=1):
+            client.post("/products/", json=dict(sample_product, upc=upc, name=name), headers=headers)
+
+    def test_search_prefix(self, employee_token, sample_product):
+        """Test names starting with the query are returned"""
+        self.create_products(employee_token, sample_product, ["Banana", "Bread", "Brown Rice", "Apple"])
+
+        response = client.get("/products/search?q=br")
+
+        assert response.status_code == 200
+        assert [p["name"] for p in response.json()["products"]] == ["Bread", "Brown Rice"]
+
+    def test_search_tolerates_typos(self, employee_token, sample_product):
+        """Test a misspelled query still finds the product"""
+        self.create_products(employee_token, sample_product, ["Chocolate Milk", "Cheddar Cheese"])
+
+        response = client.get("/products/search?q=chocolat milk")
+
+        names = [p["name"] for p in response.json()["products"]]
+        assert names[0] == "Chocolate Milk"
+        assert "Cheddar Cheese" not in names
+
+    def test_search_sees_writes(self, manager_token, sample_product):
+        """Test the index picks up created, imported and deleted products"""
+        self.create_products(manager_token, sample_product, ["Oat Milk"])
+        assert len(client.get("/products/search?q=oat").json()["products"]) == 1
+
+        headers = TestHelper.auth_headers(manager_token)
+        client.post("/products/", json=dict(sample_product, upc=50, name="Oatmeal"), headers=headers)
+        client.post(
+            "/products/bulk",
+            content=json.dumps(dict(sample_product, upc=51, name="Oat Bran")),
+            headers=dict(headers, **{"Content-Type": "application/x-ndjson"})
+        )
+        client.delete("/products/1", headers=headers)
+
+        names = [p["name"] for p in client.get("/products/search?q=oat").json()["products"]]
+        assert sorted(names) == ["Oat Bran", "Oatmeal"]
+
+    def test_search_limit(self, employee_token, sample_product):
+        """Test the result limit is applied and validated"""
+        self.create_products(employee_token, sample_product, [f"Soup {i}" for i in range(5)])
+
+        assert len(client.get("/products/search?q=soup&limit=3").json()["products"]) == 3
+        assert client.get("/products/search?q=soup&limit=0").status_code == 422
+        assert client.get("/products/search?q=").status_code == 422
+
+    def test_search_rejects_blank_query(self, employee_token, sample_product):
+        """Test a query of only whitespace is rejected instead of matching everything"""
+        self.create_products(employee_token, sample_product, ["Soup"])
+
+        response = client.get("/products/search", params={"q": "   "})
+        assert response.status_code == 400
+        assert client.get("/products/search", params={"q": " soup "}).json()["products"][0]["name"] == "Soup"
+
+class TestExportProducts:
+    def create_products(self, token, sample_product, count):
+        headers = TestHelper.auth_headers(token)
+        for upc in range(1, count + 1):
+            client.post("/products/", json=dict(sample_product, upc=upc, name=f"Product, {upc}"), headers=headers)
+
+    def test_export_ndjson(self, employee_token, sample_product):
+        """Test every product is exported as one JSON object per line"""
+        self.create_products(employee_token, sample_product, 3)
+
+        response = client.get("/products/export")
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        rows = [json.loads(line) for line in response.text.splitlines()]
+        assert [row["upc"] for row in rows] == [1, 2, 3]
+        assert rows[0]["name"] == "Product, 1"
+
+    def test_export_csv(self, employee_token, sample_product):
+        """Test CSV export has a header row and quotes values with commas"""
+        self.create_products(employee_token, sample_product, 2)
+
+        response = client.get("/products/export?format=csv")
+
+        lines = response.text.splitlines()
+        assert lines[0] == "id,upc,name,quantity,price,report_code,reorder_threshold,version"
+        # the version depends on the database, so stop short of it
+        assert lines[1].startswith('1,1,"Product, 1",50,9.99,1234,10,')
+        assert len(lines) == 3
+
+    def test_export_gzip(self, employee_token, sample_product):
+        """Test gzipped export decompresses to the same rows"""
+        self.create_products(employee_token, sample_product, 2)
+
+        response = client.get("/products/export?gzip=true")
+
+        assert response.headers["content-type"] == "application/gzip"
+        assert "products.ndjson.gz" in response.headers["content-disposition"]
+        lines = gzip.decompress(response.content).decode().splitlines()
+        assert len(lines) == 2
+
+    def test_export_invalid_format(self):
+        """Test an unknown export format is rejected"""
+        assert client.get("/products/export?format=xml").status_code == 422
+
+class TestInventorySummary:
+    def summary(self):
+        data = client.get("/products/summary").json()
+        return {row["report_code"]: row for row in data["report_codes"]}, data
+
+    def test_summary_follows_every_write(self, manager_token, sample_product):
+        """Test create, bulk upsert, checkout and delete keep the summary in step"""
+        headers = TestHelper.auth_headers(manager_token)
+        client.post("/products/", json=dict(sample_product, upc=1, quantity=10, price=2.0), headers=headers)
+        client.post("/products/", json=dict(sample_product, upc=2, quantity=5, price=4.0), headers=headers)
+
+        rows, data = self.summary()
+        assert rows[1234]["product_count"] == 2
+        assert rows[1234]["total_units"] == 15
+        assert rows[1234]["total_value"] == 40.0
+
+        # move upc 2 to another report code and add a product
+        ndjson = "\n".join([
+            json.dumps(dict(sample_product, upc=2, quantity=5, price=4.0, report_code=77)),
+            json.dumps(dict(sample_product, upc=3, quantity=1, price=1.5, report_code=77)),
+        ])
+        client.post("/products/bulk", content=ndjson, headers=dict(headers, **{"Content-Type": "application/x-ndjson"}))
+        client.post("/products/checkout", json={"items": [{"upc": 1, "quantity": 4}]}, headers=headers)
+        client.delete("/products/3", headers=headers)
+
+        rows, data = self.summary()
+        assert rows[1234] == {"report_code": 1234, "product_count": 1, "total_units": 6, "total_value": 12.0}
+        assert rows[77] == {"report_code": 77, "product_count": 1, "total_units": 5, "total_value": 20.0}
+        assert data["total_units"] == 11
+        assert data["total_value"] == 32.0
+
+        check = client.get("/admin/summary/check", headers=headers).json()
+        assert check["consistent"] is True
+
+    def test_summary_check_and_rebuild(self, manager_token, sample_product):
+        """Test a drifted summary is reported and fixed by a rebuild"""
+        headers = TestHelper.auth_headers(manager_token)
+        client.post("/products/", json=sample_product, headers=headers)
+
+        with SessionLocal() as session:
+            session.query(InventorySummary).update({"total_units": 999})
+            session.commit()
+
+        check = client.get("/admin/summary/check", headers=headers).json()
+        assert check["consistent"] is False
+        assert check["mismatches"][0]["expected"]["total_units"] == 50
+
+        response = client.post("/admin/summary/rebuild", headers=headers)
+        assert response.status_code == 200
+        assert client.get("/admin/summary/check", headers=headers).json()["consistent"] is True
+
+    def test_summary_rebuild_requires_manager(self, employee_token):
+        """Test employees can't rebuild the summary"""
+        headers = TestHelper.auth_headers(employee_token)
+
+        assert client.post("/admin/summary/rebuild", headers=headers).status_code == 403
+
+    def test_summary_rows_upserted_in_report_code_order(self):
+        """Test a write upserts its summary rows sorted by report code whatever order it touched them in"""
+        from app.services.summary import record_changes
+        parameters = []
+        with SessionLocal() as session:
+            session.execute = lambda stmt, params=None: parameters.append(params)
+            record_changes(session, after=[(300, 1, 1.0), (100, 1, 1.0), (200, 1, 1.0)])
+
+        assert [row["report_code"] for row in parameters[0]] == [100, 200, 300]
+
+class TestBulkDeleteProducts:
+    def test_bulk_delete_requires_manager(self, employee_token):
+        """Test employees can't bulk delete products"""
+        headers = TestHelper.auth_headers(employee_token)
+        response = client.request("DELETE", "/products/", json={"upcs": [1]}, headers=headers)
+
+        assert response.status_code == 403
+
+    def test_bulk_delete_removes_products_and_sales(self, manager_token, sample_product):
+        """Test deleting many products also removes their sales and leaves others alone"""
+        headers = TestHelper.auth_headers(manager_token)
+        for upc in (1, 2, 3):
+            client.post("/products/", json=dict(sample_product, upc=upc), headers=headers)
+        for product_id in (1, 2, 3):
+            for week in range(3):
+                client.post("/sales/", json={
+                    "product_id": product_id,
+                    "sale_price": 1.0,
+                    "sale_start": str(date.today() + timedelta(weeks=week)),
+                    "sale_end": str(date.today() + timedelta(weeks=week, days=6))
+                }, headers=headers)
+
+        response = client.request("DELETE", "/products/", json={"upcs": [1, 2, 404]}, headers=headers)
+
+        assert response.status_code == 200
+        assert response.json()["deleted"] == 2
+        assert response.json()["not_found"] == [404]
+        assert [p["upc"] for p in client.get("/products/").json()["products"]] == [3]
+        assert {s["product_id"] for s in client.get("/sales/").json()["sales"]} == {3}
+        assert client.get("/products/1").status_code == 404
+        assert client.get("/admin/summary/check", headers=headers).json()["consistent"] is True
+
+class TestUpdatePrices:
+    def create_products(self, token, sample_product):
+        headers = TestHelper.auth_headers(token)
+        client.post("/products/", json=dict(sample_product, upc=1, price=2.00, report_code=10), headers=headers)
+        client.post("/products/", json=dict(sample_product, upc=2, price=3.00, report_code=10), headers=headers)
+        client.post("/products/", json=dict(sample_product, upc=3, price=4.00, report_code=20), headers=headers)
+        return headers
+
+    def prices(self):
+        return {p["upc"]: p["price"] for p in client.get("/products/").json()["products"]}
+
+    def test_absolute_price_for_upcs(self, manager_token, sample_product):
+        """Test setting an absolute price on a list of upcs"""
+        headers = self.create_products(manager_token, sample_product)
+        client.get("/products/1")  # warm the cache
+
+        response = client.patch("/products/prices", json={"upcs": [1, 3], "price": 5.25}, headers=headers)
+
+        assert response.status_code == 200
+        assert response.json()["updated"] == 2
+        assert self.prices() == {1: 5.25, 2: 3.00, 3: 5.25}
+        assert client.get("/products/1").json()["price"] == 5.25
+
+    def test_markup_for_report_code(self, manager_token, sample_product):
+        """Test a percentage markup on a whole report code, rounded to cents"""
+        headers = self.create_products(manager_token, sample_product)
+
+        response = client.patch("/products/prices", json={"report_code": 10, "markup_percent": 12.5}, headers=headers)
+
+        assert response.json()["updated"] == 2
+        assert self.prices() == {1: 2.25, 2: 3.38, 3: 4.00}
+        assert client.get("/admin/summary/check", headers=headers).json()["consistent"] is True
+
+    def test_product_added_after_the_lock_is_left_alone(self, manager_token, sample_product, monkeypatch):
+        """Test a product joining the report code after the locking read isn't repriced"""
+        from app.models.product import Product
+        from app.services import inventory
+        headers = self.create_products(manager_token, sample_product)
+        reserve_versions = inventory.reserve_versions
+
+        def commit_a_product_first(session, count):
+            # stands in for another transaction committing between the SELECT and the UPDATE
+            session.add(Product(
+                **dict(sample_product, upc=4, price=6.00, report_code=10), version=reserve_versions(session)
+            ))
+            session.flush()
+            return reserve_versions(session, count)
+
+        monkeypatch.setattr(inventory, "reserve_versions", commit_a_product_first)
+        response = client.patch("/products/prices", json={"report_code": 10, "price": 1.00}, headers=headers)
+
+        assert response.status_code == 200
+        assert response.json()["updated"] == 2
+        assert self.prices() == {1: 1.00, 2: 1.00, 3: 4.00, 4: 6.00}
+
+    @pytest.mark.parametrize("body", [
+        {"upcs": [1], "price": 1.0, "markup_percent": 5},
+        {"upcs": [1], "report_code": 10, "price": 1.0},
+        {"report_code": 10},
+        {"upcs": [1], "price": -1.0},
+    ])
+    def test_invalid_price_update(self, manager_token, body):
+        """Test ambiguous or invalid price updates are rejected"""
+        headers = TestHelper.auth_headers(manager_token)
+
+        assert client.patch("/products/prices", json=body, headers=headers).status_code == 422
+
+    def test_update_prices_requires_manager(self, employee_token):
+        """Test employees can't change prices"""
+        headers = TestHelper.auth_headers(employee_token)
+
+        response = client.patch("/products/prices", json={"upcs": [1], "price": 1.0}, headers=headers)
+        assert response.status_code == 403
+
+class TestProductChanges:
+    def read_events(self, response):
+        events = []
+        for block in response.text.strip().split("\n\n"):
+            fields = dict(line.split(": ", 1) for line in block.splitlines() if not line.startswith(":"))
+            events.append(fields)
+        return events
+
+    def test_changes_replay_after_token(self, manager_token, sample_product):
+        """Test a reconnecting register gets every write it missed, in order"""
+        headers = TestHelper.auth_headers(manager_token)
+        ready = self.read_events(client.get("/products/changes?follow=false"))
+        assert ready[0]["event"] == "ready"
+        token = ready[0]["id"]
+
+        client.post("/products/", json=sample_product, headers=headers)
+        client.patch("/products/prices", json={"upcs": [123], "price": 1.5}, headers=headers)
+        client.post("/products/checkout", json={"items": [{"upc": 123, "quantity": 2}]}, headers=headers)
+        client.delete("/products/123", headers=headers)
+
+        response = client.get("/products/changes?follow=false", headers={"Last-Event-ID": token})
+
+        assert response.headers["content-type"].startswith("text/event-stream")
+        events = [json.loads(e["data"]) for e in self.read_events(response)]
+        assert [e["type"] for e in events] == ["product.upserted", "product.price", "product.stock", "product.deleted"]
+        assert events[1] == {"type": "product.price", "upc": 123, "price": 1.5}
+        assert events[2]["quantity"] == 48
+
+        last_token = self.read_events(response)[-1]["id"]
+        response = client.get(f"/products/changes?follow=false&after={last_token}")
+        assert response.text == ""
+
+    def test_changes_unknown_token_resets(self):
+        """Test a token the server can't resume from asks the client to resync"""
+        response = client.get("/products/changes?follow=false&after=stale-42")
+
+        events = self.read_events(response)
+        assert events[0]["event"] == "reset"
+
+class TestSyncProducts:
+    def test_sync_returns_only_changes(self, manager_token, sample_product):
+        """Test a sync after a version returns only later writes and deletions"""
+        headers = TestHelper.auth_headers(manager_token)
+        for upc in (1, 2, 3):
+            client.post("/products/", json=dict(sample_product, upc=upc), headers=headers)
+
+        full = client.get("/products/sync").json()
+        assert [p["upc"] for p in full["products"]] == [1, 2, 3]
+        assert full["deleted"] == []
+
+        client.patch("/products/prices", json={"upcs": [2], "price": 1.0}, headers=headers)
+        client.delete("/products/3", headers=headers)
+
+        delta = client.get(f"/products/sync?since={full['version']}").json()
+        assert [p["upc"] for p in delta["products"]] == [2]
+        assert delta["products"][0]["price"] == 1.0
+        assert delta["deleted"] == [3]
+        assert delta["version"] > full["version"]
+
+        empty = client.get(f"/products/sync?since={delta['version']}").json()
+        assert empty["products"] == [] and empty["deleted"] == []
+        assert empty["version"] == delta["version"]
+
+    def test_sync_pages_through_changes(self, manager_token, sample_product):
+        """Test a small page size walks every change exactly once"""
+        headers = TestHelper.auth_headers(manager_token)
+        ndjson = "\n".join(json.dumps(dict(sample_product, upc=upc)) for upc in range(1, 6))
+        client.post("/products/bulk", content=ndjson, headers=dict(headers, **{"Content-Type": "application/x-ndjson"}))
+        client.post("/products/checkout", json={"items": [{"upc": 1, "quantity": 1}]}, headers=headers)
+
+        seen, since = [], 0
+        while True:
+            page = client.get(f"/products/sync?since={since}&size=2").json()
+            seen.extend(p["upc"] for p in page["products"])
+            since = page["version"]
+            if not page["has_more"]:
+                break
+
+        # upc 1 was rewritten by the checkout, so it syncs once at its newest version
+        assert seen == [2, 3, 4, 5, 1]
+
+    def test_upgrade_versions_rows_left_at_zero(self, manager_token, sample_product):
+        """Test rows sharing version 0 get versions of their own, so a full sync pages past them"""
+        from sqlalchemy import create_engine, text
+        from app.migrations import upgrade
+        client.post("/products/", json=dict(sample_product, upc=1), headers=TestHelper.auth_headers(manager_token))
+        with SessionLocal() as session:
+            for upc in (2, 3, 4):
+                session.execute(text(
+                    f"INSERT INTO products (upc, name, price, version) VALUES ({upc}, 'Old', 1.0, 0)"
+                ))
+            session.commit()
+
+        existing = create_engine(settings.TEST_DATABASE_URL)
+        assert "versioned 3 products rows" in upgrade(existing)
+        existing.dispose()
+
+        seen, since = [], 0
+        while True:
+            page = client.get(f"/products/sync?since={since}&size=2").json()
+            seen += [p["upc"] for p in page["products"]]
+            since = page["version"]
+            if not page["has_more"]:
+                break
+        assert sorted(seen) == [1, 2, 3, 4]
+        # written after the product made through the API, so they sync after it too
+        assert seen[0] == 1
+
+    def test_upgrade_adds_and_backfills_version(self, tmp_path):
+        """Test a database from before delta sync gets versioned rows and its indexes"""
+        from sqlalchemy import create_engine, inspect, text
+        from app.database import Base
+        from app.migrations import upgrade
+        from app.services.sync import changes_since
+        from app.models.product import Product
+        from sqlalchemy.orm import Session
+
+        old = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+        Base.metadata.create_all(old)
+        with old.begin() as connection:
+            for table in ("products", "sales"):
+                connection.execute(text(f"DROP INDEX ix_{table}_version"))
+                connection.execute(text(f"ALTER TABLE {table} DROP COLUMN version"))
+            connection.execute(text("DROP INDEX ix_sales_end_start"))
+            for upc in (10, 20, 30):
+                connection.execute(text(f"INSERT INTO products (upc, name, price) VALUES ({upc}, 'Old', 1.0)"))
+
+        applied = upgrade(old)
+        assert "added products.version" in applied
+        assert "versioned 3 products rows" in applied
+        assert "created index ix_sales_end_start" in applied
+        assert inspect(old).has_index("products", "ix_products_version")
+        assert upgrade(old) == []
+
+        with Session(old) as session:
+            first = changes_since(session, Product, "product", 0, 2)
+            rest = changes_since(session, Product, "product", first["version"], 2)
+            assert [p.upc for p in first["rows"] + rest["rows"]] == [10, 20, 30]
+            assert rest["has_more"] is False
+            # new writes land above the backfilled rows
+            assert session.execute(text("SELECT value FROM sync_counter")).scalar_one() == 3
+        old.dispose()
+
+@pytest.mark.skipif(
+    not settings.TEST_DATABASE_URL.startswith("postgresql"),
+    reason="extensions and concurrent index builds are Postgres only"
+)
+class TestUpgradePostgres:
+
+    def test_upgrade_builds_missing_indexes_concurrently(self):
+        """Test an existing database gets pg_trgm and its missing indexes, rebuilding invalid ones"""
+        from sqlalchemy import create_engine, text
+        from app.migrations import upgrade
+
+        existing = create_engine(settings.TEST_DATABASE_URL)
+        with existing.begin() as connection:
+            connection.execute(text("DROP EXTENSION IF EXISTS pg_trgm CASCADE"))
+            connection.execute(text("DROP INDEX ix_sales_end_start"))
+            # what an interrupted CREATE INDEX CONCURRENTLY leaves behind
+            connection.execute(text(
+                "UPDATE pg_index SET indisvalid = false WHERE indexrelid = 'ix_products_low_stock'::regclass"
+            ))
+
+        applied = upgrade(existing)
+
+        assert "created index ix_sales_end_start" in applied
+        assert "created index ix_products_low_stock" in applied
+        with existing.connect() as connection:
+            assert connection.execute(text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")).scalar() == 1
+            assert connection.execute(text("SELECT bool_and(indisvalid) FROM pg_index")).scalar() is True
+        assert upgrade(existing) == []
+        existing.dispose()
+
+@pytest.mark.skipif(
+    not settings.TEST_DATABASE_URL.startswith("postgresql"),
+    reason="row locks and transaction ids only matter on Postgres"
+)
+class TestConcurrentWritesPostgres:
+
+    def test_sync_holds_back_running_transactions(self, manager_token, sample_product):
+        """Test a sync never passes a version whose transaction is still running"""
+        from sqlalchemy import update
+        from app.models.product import Product
+        from app.services.sync import reserve_versions
+        headers = TestHelper.auth_headers(manager_token)
+        for upc in (1, 2):
+            client.post("/products/", json=dict(sample_product, upc=upc), headers=headers)
+        since = client.get("/products/sync").json()["version"]
+
+        with SessionLocal() as slow:
+            slow.execute(update(Product).where(Product.upc == 1).values(price=2.0, version=reserve_versions(slow)))
+            client.patch("/products/prices", json={"upcs": [2], "price": 3.0}, headers=headers)
+
+            held = client.get(f"/products/sync?since={since}").json()
+            assert held["products"] == [] and held["version"] == since
+            slow.commit()
+
+        delta = client.get(f"/products/sync?since={since}").json()
+        assert [p["upc"] for p in delta["products"]] == [1, 2]
+
+    def test_mixed_writers_do_not_deadlock(self, manager_token, sample_product):
+        """Test checkouts, repricing, sales, ledger compaction and deletes running together all succeed"""
+        from app.services.stock_ledger import run_compaction
+        headers = TestHelper.auth_headers(manager_token)
+        for upc in range(1, 11):
+            client.post("/products/", json=dict(sample_product, upc=upc, quantity=10_000), headers=headers)
+
+        def checkout(i):
+            upcs = list(range(1, 11)) if i % 2 else list(range(10, 0, -1))
+            basket = {"items": [{"upc": upc, "quantity": 1} for upc in upcs]}
+            return client.post("/products/checkout", json=basket, headers=headers).status_code
+
+        def reprice(i):
+            upcs = list(range(10, 0, -1)) if i % 2 else list(range(1, 11))
+            return client.patch("/products/prices", json={"upcs": upcs, "price": 1.0 + i}, headers=headers).status_code
+
+        def sale(i):
+            start = date(2030, 1, 1) + timedelta(days=7 * i)
+            body = {"product_id": i % 9 + 1, "sale_price": 1.0, "sale_start": str(start), "sale_end": str(start + timedelta(days=6))}
+            return client.post("/sales/", json=body, headers=headers).status_code
+
+        def movements(i):
+            batch = {"movements": [{"upc": upc, "kind": "receipt", "quantity": 1} for upc in range(10, 0, -1)]}
+            status = client.post("/products/movements", json=batch, headers=headers).status_code
+            run_compaction()
+            return status
+
+        def delete(i):
+            return client.delete("/products/10", headers=headers).status_code if i == 5 else 200
+
+        jobs = [job for i in range(10) for job in (
+            lambda i=i: checkout(i), lambda i=i: reprice(i), lambda i=i: sale(i),
+            lambda i=i: movements(i), lambda i=i: delete(i),
+        )]
+        with ThreadPoolExecutor(max_workers=16) as pool:
+            statuses = list(pool.map(lambda job: job(), jobs))
+
+        # checkouts touching the deleted product are turned away with 404, nothing else fails
+        assert set(statuses) <= {200, 404}
+        assert client.get("/admin/summary/check", headers=headers).json()["consistent"] is True
+
+class TestStockLedger:
+    def stock(self, upc, as_of=None):
+        params = {"as_of": as_of.isoformat()} if as_of else {}
+        return client.get(f"/products/{upc}/stock", params=params).json()
+
+    def test_movements_require_auth(self):
+        """Test recording movements without authentication fails"""
+        response = client.post("/products/movements", json={"movements": [{"upc": 123, "kind": "receipt", "quantity": 1}]})
+
+        assert response.status_code == 401
+
+    @pytest.mark.parametrize("movement", [
+        {"upc": 123, "kind": "receipt", "quantity": -5},
+        {"upc": 123, "kind": "adjustment", "quantity": 0},
+        {"upc": 123, "kind": "theft", "quantity": 1},
+    ])
+    def test_invalid_movement(self, employee_token, movement):
+        """Test movements with a bad kind or quantity are rejected"""
+        headers = TestHelper.auth_headers(employee_token)
+        response = client.post("/products/movements", json={"movements": [movement]}, headers=headers)
+
+        assert response.status_code == 422
+
+    def test_movements_unknown_upc(self, employee_token, sample_product):
+        """Test a batch naming an unknown upc records nothing"""
+        headers = TestHelper.auth_headers(employee_token)
+        client.post("/products/", json=sample_product, headers=headers)
+
+        batch = {"movements": [{"upc": 123, "kind": "receipt", "quantity": 5}, {"upc": 999, "kind": "shrink", "quantity": 1}]}
+        response = client.post("/products/movements", json=batch, headers=headers)
+
+        assert response.status_code == 404
+        assert response.json()["detail"]["upcs"] == [999]
+        assert self.stock(123)["on_hand"] == 50
+
+    def test_compaction_folds_movements(self, manager_token, sample_product):
+        """Test movements count on hand at once and reach quantity at the next compaction"""
+        headers = TestHelper.auth_headers(manager_token)
+        client.post("/products/", json=sample_product, headers=headers)
+        client.post("/products/", json=dict(sample_product, upc=456), headers=headers)
+
+        batch = {"movements": [
+            {"upc": 123, "kind": "receipt", "quantity": 24},
+            {"upc": 123, "kind": "shrink", "quantity": 2},
+            {"upc": 456, "kind": "adjustment", "quantity": -10},
+        ]}
+        response = client.post("/products/movements", json=batch, headers=headers)
+        assert response.status_code == 200
+        assert response.json()["recorded"] == 3
+        assert client.get("/products/123").json()["quantity"] == 50
+        assert self.stock(123)["on_hand"] == 72
+
+        response = client.post("/admin/stock/compact", headers=headers)
+        assert response.status_code == 200
+        assert client.get("/products/123").json()["quantity"] == 72
+        assert client.get("/products/456").json()["quantity"] == 40
+        assert self.stock(123)["on_hand"] == 72
+        assert self.stock(123)["snapshot_at"] is not None
+        assert client.get("/admin/summary/check", headers=headers).json()["consistent"] is True
+
+        # nothing left to fold
+        assert client.post("/admin/stock/compact", headers=headers).json()["message"] == "Compacted stock for 0 products."
+
+    def test_on_hand_as_of(self, manager_token, sample_product):
+        """Test past stock levels are rebuilt from snapshots and the ledger tail"""
+        headers = TestHelper.auth_headers(manager_token)
+        before_create = datetime.now()
+        time.sleep(0.01)
+        client.post("/products/", json=sample_product, headers=headers)
+        client.post("/products/movements", json={"movements": [{"upc": 123, "kind": "receipt", "quantity": 10}]}, headers=headers)
+        after_receipt = datetime.now()
+        time.sleep(0.01)
+        client.post("/products/checkout", json={"items": [{"upc": 123, "quantity": 5}]}, headers=headers)
+        after_checkout = datetime.now()
+        time.sleep(0.01)
+
+        # no snapshot yet, so worked back from the current quantity
+        assert self.stock(123, before_create)["on_hand"] == 0
+        assert self.stock(123, after_receipt)["on_hand"] == 60
+
+        client.post("/admin/stock/compact", headers=headers)
+        time.sleep(0.01)
+        client.post("/products/movements", json={"movements": [{"upc": 123, "kind": "shrink", "quantity": 3}]}, headers=headers)
+
+        assert self.stock(123, after_receipt)["on_hand"] == 60
+        assert self.stock(123, after_checkout)["on_hand"] == 55
+        latest = self.stock(123)
+        assert latest["on_hand"] == 52
+        assert latest["snapshot_at"] is not None
+
+    def test_movement_committed_after_compaction_is_not_lost(self, manager_token, sample_product):
+        """Test a movement committing after a compaction counts, even with a lower id than those it folded"""
+        from app.models.stock import StockMovement
+        headers = TestHelper.auth_headers(manager_token)
+        client.post("/products/", json=sample_product, headers=headers)
+        started = datetime.now()
+        with SessionLocal() as session:
+            session.add(StockMovement(id=50, product_id=1, kind="receipt", quantity=10, created_at=started))
+            session.commit()
+        client.post("/admin/stock/compact", headers=headers)
+
+        # inserted before the compaction ran, but only committed after it
+        with SessionLocal() as session:
+            session.add(StockMovement(id=10, product_id=1, kind="shrink", quantity=-4, created_at=started))
+            session.commit()
+
+        assert self.stock(123)["on_hand"] == 56
+        client.post("/admin/stock/compact", headers=headers)
+        assert client.get("/products/123").json()["quantity"] == 56
+        assert self.stock(123)["on_hand"] == 56
+
+    def test_compaction_requires_manager(self, employee_token):
+        """Test employees can't trigger a compaction"""
+        headers = TestHelper.auth_headers(employee_token)
+
+        assert client.post("/admin/stock/compact", headers=headers).status_code == 403
+
+class TestReorderRecommendations:
+    def test_thresholds_from_demand(self):
+        """Test steady demand needs no safety stock and variable demand adds some"""
+        demand = np.array([[2, 2, 2, 2], [0, 4, 0, 4], [0, 0, 0, 0]], dtype=float)
+        average, thresholds = recommend_thresholds(demand, lead_time_days=7, service_z=1.65)
+
+        assert average.tolist() == [2, 2, 0]
+        assert thresholds.tolist() == [14, math.ceil(14 + 1.65 * 2 * math.sqrt(7)), 0]
+
+    def test_recommendations_follow_sales(self, manager_token, sample_product):
+        """Test a refresh turns checkouts into recommendations for every product"""
+        headers = TestHelper.auth_headers(manager_token)
+        client.post("/products/", json=sample_product, headers=headers)
+        client.post("/products/", json=dict(sample_product, upc=456, report_code=99), headers=headers)
+        client.post("/products/checkout", json={"items": [{"upc": 123, "quantity": 28}]}, headers=headers)
+
+        # nothing until the job has run
+        assert client.get("/products/reorder-recommendations").json()["recommendations"] == []
+        response = client.post("/admin/reorder-recommendations/refresh", headers=headers)
+        assert response.status_code == 200
+
+        data = client.get("/products/reorder-recommendations").json()
+        rows = {row["upc"]: row for row in data["recommendations"]}
+        assert rows[123]["average_daily_demand"] == 28 / settings.REORDER_DEMAND_DAYS
+        assert rows[123]["recommended_threshold"] > rows[123]["reorder_threshold"]
+        assert rows[456]["recommended_threshold"] == 0
+
+        filtered = client.get("/products/reorder-recommendations?report_code=99").json()
+        assert [row["upc"] for row in filtered["recommendations"]] == [456]
+
+    def test_product_sold_between_reads_is_skipped(self, manager_token, sample_product):
+        """Test a product created and sold after the ids were read doesn't break the job"""
+        from app.services.reorder import daily_demand
+        headers = TestHelper.auth_headers(manager_token)
+        client.post("/products/", json=sample_product, headers=headers)
+        client.post("/products/checkout", json={"items": [{"upc": 123, "quantity": 28}]}, headers=headers)
+
+        class RacingSession:
+            """Lets another request commit between daily_demand's two statements"""
+            def __init__(self, session):
+                self.session = session
+                self.statements = 0
+
+            def execute(self, statement):
+                # read every row first, as the other request's write must not wait on this one
+                result = self.session.execute(statement).freeze()
+                self.statements += 1
+                if self.statements == 1:
+                    client.post("/products/", json=dict(sample_product, upc=456), headers=headers)
+                    client.post("/products/checkout", json={"items": [{"upc": 456, "quantity": 5}]}, headers=headers)
+                return result()
+
+        with SessionLocal() as session:
+            product_ids, demand = daily_demand(RacingSession(session), 7, date.today())
+        assert product_ids.tolist() == [1]
+        assert demand.sum() == 28
+
+    def test_refresh_requires_manager(self, employee_token):
+        """Test employees can't trigger a refresh"""
+        headers = TestHelper.auth_headers(employee_token)
+
+        assert client.post("/admin/reorder-recommendations/refresh", headers=headers).status_code == 403
@@ -4,6 +4,8 @@ from fastapi.testclient import TestClient
 from datetime import date, timedelta
 
 from app.main import app
+from app.services.sale_index import ActiveSaleIndex
+from app.services.sale_archive import archive_expired_sales
 
 client = TestClient(app)
 
@@ -109,6 +111,43 @@ class TestGetSales:
         assert data["page"] == 1
         assert data["size"] < 999999
 
+    def test_get_sales_expand_product(self, employee_token, count_queries):
+        """Test expand=product embeds products with the same number of queries for any page size"""
+        headers = TestHelper.auth_headers(employee_token)
+        counts = []
+        for count in (2, 20):
+            product = TestHelper.create_test_product(headers)
+            for week in range(count - len(client.get("/sales/?size=1000").json()["sales"])):
+                client.post("/sales/", json={
+                    "product_id": product["id"],
+                    "sale_price": 1.0,
+                    "sale_start": str(date.today() + timedelta(weeks=week)),
+                    "sale_end": str(date.today() + timedelta(weeks=week, days=6))
+                }, headers=headers)
+
+            count_queries.clear()
+            response = client.get("/sales/?expand=product&size=1000")
+            counts.append(len(count_queries))
+            sales = response.json()["sales"]
+            assert len(sales) == count
+            assert all(sale["product"]["id"] == sale["product_id"] for sale in sales)
+
+        assert counts[0] == counts[1]
+
+    def test_export_sales_csv(self, employee_token, sample_sale):
+        """Test sales are exported as CSV with dates in ISO format"""
+        headers = TestHelper.auth_headers(employee_token)
+        product = TestHelper.create_test_product(headers)
+        sample_sale["product_id"] = product["id"]
+        client.post("/sales/", json=sample_sale, headers=headers)
+
+        response = client.get("/sales/export?format=csv")
+
+        assert response.status_code == 200
+        lines = response.text.splitlines()
+        assert lines[0] == "id,product_id,sale_price,sale_start,sale_end,version"
+        assert f"{sample_sale['sale_start']},{sample_sale['sale_end']}" in lines[1]
+
 class TestCreateSale:
     
     def test_create_sale_requires_auth(self, sample_sale):
@@ -164,6 +203,107 @@ class TestCreateSale:
         response = client.post("/sales/", json=invalid_sale, headers=headers)
         assert response.status_code == 422
 
+    def test_create_sale_rejects_overlap(self, employee_token, sample_sale):
+        """Test a sale sharing any day with another sale of the product is rejected with the conflict"""
+        headers = TestHelper.auth_headers(employee_token)
+        product = TestHelper.create_test_product(headers)
+        sample_sale["product_id"] = product["id"]
+        client.post("/sales/", json=sample_sale, headers=headers)
+
+        overlapping = dict(sample_sale, sale_start=sample_sale["sale_end"], sale_end=str(date.today() + timedelta(days=10)))
+        response = client.post("/sales/", json=overlapping, headers=headers)
+
+        assert response.status_code == 409
+        conflicts = response.json()["detail"]["conflicts"]
+        assert [(c["sale_start"], c["sale_end"]) for c in conflicts] == [(sample_sale["sale_start"], sample_sale["sale_end"])]
+        assert len(client.get("/sales/").json()["sales"]) == 1
+
+    def test_create_sale_adjacent_or_other_product(self, employee_token, sample_sale):
+        """Test a sale starting the day after another ends, or on another product, is accepted"""
+        headers = TestHelper.auth_headers(employee_token)
+        product = TestHelper.create_test_product(headers)
+        other = TestHelper.create_test_product(headers)
+        sample_sale["product_id"] = product["id"]
+        client.post("/sales/", json=sample_sale, headers=headers)
+
+        adjacent = dict(
+            sample_sale,
+            sale_start=str(date.today() + timedelta(days=8)),
+            sale_end=str(date.today() + timedelta(days=14))
+        )
+        assert client.post("/sales/", json=adjacent, headers=headers).status_code == 200
+        assert client.post("/sales/", json=dict(sample_sale, product_id=other["id"]), headers=headers).status_code == 200
+
+
+class TestBulkCreateSales:
+
+    def flyer_row(self, upc, start_offset=0, days=6, price=1.0):
+        start = date.today() + timedelta(days=start_offset)
+        return {"upc": upc, "sale_price": price, "sale_start": str(start), "sale_end": str(start + timedelta(days=days))}
+
+    def test_bulk_sales_requires_auth(self):
+        """Test loading a flyer without authentication fails"""
+        response = client.post("/sales/bulk", json=[])
+
+        assert response.status_code == 401
+
+    def test_bulk_sales_json(self, employee_token):
+        """Test a JSON flyer creates every valid row and reports the rest by row number"""
+        headers = TestHelper.auth_headers(employee_token)
+        first = TestHelper.create_test_product(headers)
+        second = TestHelper.create_test_product(headers)
+        flyer = [
+            self.flyer_row(first["upc"]),
+            self.flyer_row(second["upc"]),
+            self.flyer_row(999_999_999_999),                       # unknown upc
+            dict(self.flyer_row(first["upc"], 20), sale_end=str(date.today())),  # ends before it starts
+            self.flyer_row(second["upc"], 3),                      # overlaps row 2
+            self.flyer_row(first["upc"], 7),                       # starts the day after row 1 ends
+        ]
+
+        response = client.post("/sales/bulk", json=flyer, headers=headers)
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["processed"] == 6
+        assert data["created"] == 3
+        assert [(e["row"], e["error"]) for e in data["errors"][::2]] == [(3, "Product not found"), (5, "Sale overlaps row 2")]
+        assert data["errors"][1]["row"] == 4
+        assert len(client.get("/sales/").json()["sales"]) == 3
+        assert len(client.get(f"/sales/active?product_id={first['id']}").json()["sales"]) == 1
+
+    def test_bulk_sales_csv_reports_existing_overlaps(self, employee_token, sample_sale):
+        """Test a CSV flyer row overlapping a sale already in the database is rejected with the conflict"""
+        headers = TestHelper.auth_headers(employee_token)
+        product = TestHelper.create_test_product(headers)
+        sample_sale["product_id"] = product["id"]
+        client.post("/sales/", json=sample_sale, headers=headers)
+
+        later = date.today() + timedelta(days=8)
+        csv_body = "\n".join([
+            "upc,sale_price,sale_start,sale_end",
+            f"{product['upc']},2.50,{date.today()},{date.today() + timedelta(days=2)}",
+            f"{product['upc']},2.50,{later},{later + timedelta(days=6)}",
+        ])
+        response = client.post("/sales/bulk", content=csv_body, headers=dict(headers, **{"Content-Type": "text/csv"}))
+
+        data = response.json()
+        assert data["created"] == 1
+        assert data["errors"][0]["row"] == 1
+        assert data["errors"][0]["conflicts"][0]["sale_start"] == sample_sale["sale_start"]
+
+    @pytest.mark.parametrize("content_type, body, status", [
+        ("text/plain", "upc", 415),
+        ("application/json", "{not json", 400),
+        ("application/json", '{"upc": 1}', 400),
+    ])
+    def test_bulk_sales_bad_body(self, employee_token, content_type, body, status):
+        """Test unsupported or malformed flyers are rejected outright"""
+        headers = TestHelper.auth_headers(employee_token)
+        response = client.post("/sales/bulk", content=body, headers=dict(headers, **{"Content-Type": content_type}))
+
+        assert response.status_code == status
+
 
 class TestDeleteSale:
     
@@ -214,6 +354,88 @@ class TestDeleteSale:
         assert response.status_code == 401
 
 
+class TestBulkDeleteSales:
+
+    def create_sales(self, headers, count):
+        product = TestHelper.create_test_product(headers)
+        for week in range(count):
+            client.post("/sales/", json={
+                "product_id": product["id"],
+                "sale_price": 1.0,
+                "sale_start": str(date.today() + timedelta(weeks=week)),
+                "sale_end": str(date.today() + timedelta(weeks=week, days=6))
+            }, headers=headers)
+        return [s["id"] for s in client.get("/sales/").json()["sales"]]
+
+    def test_bulk_delete_sales_by_id(self, manager_token):
+        """Test deleting several sales by id"""
+        headers = TestHelper.auth_headers(manager_token)
+        ids = self.create_sales(headers, 3)
+
+        response = client.request("DELETE", "/sales/", json={"ids": ids[:2]}, headers=headers)
+
+        assert response.status_code == 200
+        assert response.json()["deleted"] == 2
+        assert [s["id"] for s in client.get("/sales/").json()["sales"]] == ids[2:]
+
+    def test_bulk_delete_sales_by_end_date(self, manager_token):
+        """Test deleting every sale ending within a date range"""
+        headers = TestHelper.auth_headers(manager_token)
+        self.create_sales(headers, 4)
+
+        response = client.request("DELETE", "/sales/", json={
+            "end_from": str(date.today() + timedelta(weeks=1)),
+            "end_to": str(date.today() + timedelta(weeks=2, days=6))
+        }, headers=headers)
+
+        assert response.json()["deleted"] == 2
+        assert len(client.get("/sales/").json()["sales"]) == 2
+
+    def test_bulk_delete_sales_needs_a_filter(self, manager_token):
+        """Test a bulk delete without ids or dates is rejected rather than clearing the table"""
+        headers = TestHelper.auth_headers(manager_token)
+
+        response = client.request("DELETE", "/sales/", json={}, headers=headers)
+
+        assert response.status_code == 422
+
+    def test_bulk_delete_sales_requires_manager(self, employee_token):
+        """Test employees can't bulk delete sales"""
+        headers = TestHelper.auth_headers(employee_token)
+
+        response = client.request("DELETE", "/sales/", json={"ids": [1]}, headers=headers)
+
+        assert response.status_code == 403
+
+
+class TestSyncSales:
+
+    def test_sync_sales_includes_tombstones(self, manager_token):
+        """Test sale sync reports sales removed directly and by deleting their product"""
+        headers = TestHelper.auth_headers(manager_token)
+        product = TestHelper.create_test_product(headers)
+        for week in range(3):
+            client.post("/sales/", json={
+                "product_id": product["id"],
+                "sale_price": 1.0,
+                "sale_start": str(date.today() + timedelta(weeks=week)),
+                "sale_end": str(date.today() + timedelta(weeks=week, days=6))
+            }, headers=headers)
+
+        full = client.get("/sales/sync").json()
+        ids = [s["id"] for s in full["sales"]]
+        assert len(ids) == 3
+
+        client.delete(f"/sales/{ids[0]}", headers=headers)
+        delta = client.get(f"/sales/sync?since={full['version']}").json()
+        assert delta["sales"] == []
+        assert delta["deleted"] == [ids[0]]
+
+        client.delete(f"/products/{product['upc']}", headers=headers)
+        delta = client.get(f"/sales/sync?since={delta['version']}").json()
+        assert sorted(delta["deleted"]) == ids[1:]
+
+
 class TestCascadeDelete:
     
     def test_product_delete_cascades_to_sales(self, manager_token):
@@ -289,4 +511,183 @@ class TestCascadeDelete:
         # Verify product still exists
         product_check = client.get("/products/")
         assert product_check.status_code == 200
-        assert len(product_check.json()["products"]) > 0
\ No newline at end of file
+        assert len(product_check.json()["products"]) > 0
+
+class TestActiveSales:
+
+    def create_sale(self, headers, product_id, start_offset, days):
+        start = date.today() + timedelta(days=start_offset)
+        client.post("/sales/", json={
+            "product_id": product_id,
+            "sale_price": 1.0,
+            "sale_start": str(start),
+            "sale_end": str(start + timedelta(days=days))
+        }, headers=headers)
+
+    def test_active_sales_on_date(self, manager_token):
+        """Test only sales running on the date are returned, across products and for one"""
+        headers = TestHelper.auth_headers(manager_token)
+        first = TestHelper.create_test_product(headers)
+        second = TestHelper.create_test_product(headers)
+        self.create_sale(headers, first["id"], -30, 7)    # long over
+        self.create_sale(headers, first["id"], -2, 5)     # running
+        self.create_sale(headers, first["id"], 10, 5)     # not started
+        self.create_sale(headers, second["id"], 0, 0)     # today only
+
+        response = client.get("/sales/active")
+        assert response.status_code == 200
+        assert sorted((s["product_id"], s["sale_start"]) for s in response.json()["sales"]) == [
+            (first["id"], str(date.today() - timedelta(days=2))),
+            (second["id"], str(date.today()))
+        ]
+
+        one = client.get(f"/sales/active?product_id={first['id']}").json()["sales"]
+        assert [s["sale_start"] for s in one] == [str(date.today() - timedelta(days=2))]
+
+        later = str(date.today() + timedelta(days=12))
+        assert len(client.get(f"/sales/active?date={later}").json()["sales"]) == 1
+        assert len(client.get(f"/sales/active?date={later}&product_id={first['id']}").json()["sales"]) == 1
+
+    def test_active_sales_follow_deletes(self, manager_token):
+        """Test the interval index drops sales deleted singly, in bulk and with their product"""
+        headers = TestHelper.auth_headers(manager_token)
+        product = TestHelper.create_test_product(headers)
+        self.create_sale(headers, product["id"], 0, 3)
+        assert len(client.get(f"/sales/active?product_id={product['id']}").json()["sales"]) == 1
+
+        sale_id = client.get("/sales/").json()["sales"][0]["id"]
+        client.delete(f"/sales/{sale_id}", headers=headers)
+        assert client.get(f"/sales/active?product_id={product['id']}").json()["sales"] == []
+
+        self.create_sale(headers, product["id"], 0, 3)
+        assert len(client.get(f"/sales/active?product_id={product['id']}").json()["sales"]) == 1
+        client.delete(f"/products/{product['upc']}", headers=headers)
+        assert client.get(f"/sales/active?product_id={product['id']}").json()["sales"] == []
+
+    def test_interval_index_overlapping_history(self):
+        """Test a long finished sale is still found behind many later ones, and old ones are skipped"""
+        today = date.today()
+        sales = [
+            {"id": i, "product_id": 1, "sale_price": 1.0,
+             "sale_start": today - timedelta(days=400 - i), "sale_end": today - timedelta(days=399 - i)}
+            for i in range(1, 300)
+        ]
+        sales.append({"id": 1000, "product_id": 1, "sale_price": 1.0,
+                      "sale_start": today - timedelta(days=500), "sale_end": today + timedelta(days=1)})
+        index = ActiveSaleIndex()
+        index.load(sales)
+
+        assert [s["id"] for s in index.active(1, today)] == [1000]
+        assert [s["id"] for s in index.active(1, today - timedelta(days=200))] == [1000, 199, 200]
+
+        index.remove([1000])
+        assert index.active(1, today) == []
+        assert index.active(2, today) == []
+
+
+class TestArchiveSales:
+
+    def create_weekly_sales(self, headers, product_id, weeks_ago):
+        for week in weeks_ago:
+            start = date.today() - timedelta(weeks=week)
+            client.post("/sales/", json={
+                "product_id": product_id,
+                "sale_price": 1.0,
+                "sale_start": str(start),
+                "sale_end": str(start + timedelta(days=6))
+            }, headers=headers)
+
+    def test_archive_moves_only_expired_sales(self, manager_token):
+        """Test sales past the retention leave the live table but stay listable with include_archived"""
+        headers = TestHelper.auth_headers(manager_token)
+        product = TestHelper.create_test_product(headers)
+        self.create_weekly_sales(headers, product["id"], [52, 30, 4, 0])
+
+        response = client.post("/admin/sales/archive", headers=headers)
+        assert response.status_code == 200
+        assert response.json()["message"] == "Archived 2 sales."
+
+        live = client.get("/sales/").json()["sales"]
+        assert len(live) == 2
+        everything = client.get("/sales/?include_archived=true&expand=product").json()["sales"]
+        assert [sale["id"] for sale in everything] == sorted(sale["id"] for sale in everything)
+        assert [sale["archived"] for sale in everything] == [True, True, False, False]
+        assert all(sale["product"]["upc"] == product["upc"] for sale in everything)
+
+        # archived ids are never handed out again
+        self.create_weekly_sales(headers, product["id"], [-2])
+        ids = [sale["id"] for sale in client.get("/sales/?include_archived=true").json()["sales"]]
+        assert len(ids) == len(set(ids)) == 5
+
+    def test_archive_in_batches(self, manager_token):
+        """Test archival walks through more expired sales than fit in one batch"""
+        headers = TestHelper.auth_headers(manager_token)
+        product = TestHelper.create_test_product(headers)
+        self.create_weekly_sales(headers, product["id"], range(20, 27))
+
+        assert archive_expired_sales(batch_size=3) == 7
+        assert client.get("/sales/").json()["sales"] == []
+        assert len(client.get("/sales/?include_archived=true").json()["sales"]) == 7
+
+    def test_archived_sales_are_tombstoned(self, manager_token):
+        """Test registers following delta sync drop sales once they're archived"""
+        headers = TestHelper.auth_headers(manager_token)
+        product = TestHelper.create_test_product(headers)
+        self.create_weekly_sales(headers, product["id"], [30, 0])
+        full = client.get("/sales/sync").json()
+        assert len(full["sales"]) == 2
+
+        archive_expired_sales()
+
+        delta = client.get(f"/sales/sync?since={full['version']}").json()
+        assert delta["deleted"] == [full["sales"][0]["id"]]
+        assert delta["sales"] == []
+
+    def test_archive_cursor_paging(self, manager_token):
+        """Test include_archived pages with the `after` cursor across both tables"""
+        headers = TestHelper.auth_headers(manager_token)
+        product = TestHelper.create_test_product(headers)
+        self.create_weekly_sales(headers, product["id"], [30, 20, 2, 1])
+        archive_expired_sales()
+
+        first = client.get("/sales/?include_archived=true&size=3").json()
+        second = client.get(f"/sales/?include_archived=true&size=3&after={first['next_cursor']}").json()
+        assert [sale["archived"] for sale in first["sales"] + second["sales"]] == [True, True, False, False]
+
+    def test_upgrade_keeps_new_sale_ids_clear_of_the_archive(self, tmp_path):
+        """Test an old SQLite sales table is rebuilt so new sales never take an archived sale's id"""
+        from sqlalchemy import create_engine, text
+        from app.database import Base
+        from app.migrations import upgrade
+
+        old = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+        Base.metadata.create_all(old)
+        with old.begin() as connection:
+            connection.execute(text("DROP TABLE sales"))
+            connection.execute(text(
+                "CREATE TABLE sales (id INTEGER PRIMARY KEY, product_id INTEGER NOT NULL REFERENCES products (id), "
+                "sale_price FLOAT NOT NULL, sale_start DATE NOT NULL, sale_end DATE NOT NULL)"
+            ))
+            connection.execute(text("INSERT INTO products (id, upc, name, price, version) VALUES (1, 1, 'Milk', 1.0, 1)"))
+            connection.execute(text("INSERT INTO sales VALUES (1, 1, 0.5, '2026-01-01', '2026-01-07')"))
+            # sale 2 ended long ago and was archived
+            connection.execute(text(
+                "INSERT INTO sales_archive (id, product_id, sale_price, sale_start, sale_end, version, archived_at) "
+                "VALUES (2, 1, 0.5, '2020-01-01', '2020-01-07', 2, '2021-01-01')"
+            ))
+
+        assert "rebuilt sales with AUTOINCREMENT" in upgrade(old)
+        with old.begin() as connection:
+            connection.execute(text(
+                "INSERT INTO sales (product_id, sale_price, sale_start, sale_end, version) "
+                "VALUES (1, 0.5, '2026-02-01', '2026-02-07', 5)"
+            ))
+            assert connection.execute(text("SELECT MAX(id) FROM sales")).scalar_one() == 3
+            assert connection.execute(text("SELECT version FROM sales WHERE id = 1")).scalar_one() != 0
+        old.dispose()
+
+    def test_archive_requires_manager(self, employee_token):
+        """Test employees can't run the archival"""
+        headers = TestHelper.auth_headers(employee_token)
+
+        assert client.post("/admin/sales/archive", headers=headers).status_code == 403
@@ -1,6 +1,12 @@
+import jwt
 import pytest
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from fastapi import HTTPException
 from fastapi.testclient import TestClient
 from app.main import app
+from app.services.password_hasher import password_hasher
+from app.config import settings
 
 client = TestClient(app)
 
@@ -136,6 +142,27 @@ class TestUserLogin:
         response = client.post("/users/login", data={})
         assert response.status_code == 422  # Validation error
 
+    def test_login_overloaded_hasher_returns_503(self, sample_user, monkeypatch):
+        """Test logins are turned away with 503 once the password pool queue is full"""
+        client.post("/users/register", json=sample_user)
+        monkeypatch.setattr(password_hasher, "max_pending", 0)
+
+        response = client.post("/users/login", data={"username": sample_user["username"], "password": sample_user["password"]})
+
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "1"
+
+    def test_concurrent_logins(self, sample_user):
+        """Test a burst of parallel logins all succeed through the worker pool"""
+        client.post("/users/register", json=sample_user)
+        login_data = {"username": sample_user["username"], "password": sample_user["password"]}
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            responses = list(pool.map(lambda _: client.post("/users/login", data=login_data), range(8)))
+
+        assert [response.status_code for response in responses] == [200] * 8
+        assert password_hasher.pending == 0
+
 class TestGetUsers:
     
     def test_get_users_default_pagination(self, sample_user):
@@ -170,6 +197,19 @@ class TestGetUsers:
         assert data["page"] == 1
         assert data["size"] < 999999
 
+    def test_get_users_cursor_pagination(self):
+        """Test getting the next page of users with a cursor"""
+        for i in range(3):
+            TestHelper.create_test_user(f"cursoruser{i}", email=f"cursor{i}@gmail.com")
+
+        first = client.get("/users/?size=2").json()
+        assert len(first["users"]) == 2
+        assert first["next_cursor"] is not None
+
+        second = client.get(f"/users/?size=2&after={first['next_cursor']}").json()
+        assert [u["username"] for u in second["users"]] == ["cursoruser2"]
+        assert second["next_cursor"] is None
+
 class TestDeleteUser:
     
     def test_delete_user_requires_manager_role(self):
@@ -214,6 +254,33 @@ class TestDeleteUser:
         assert response.status_code == 404
         assert response.json()["detail"] == "User not found!"
     
+    def test_deleted_user_token_stops_working(self):
+        """Test deleting a user drops them from the user cache, so their token is refused at once"""
+        _, _ = TestHelper.create_test_user("testmanager", "manager", "manager@gmail.com")
+        manager_headers = TestHelper.auth_headers(TestHelper.get_auth_token("testmanager"))
+        _, _ = TestHelper.create_test_user("deleteme", "employee", "employee@gmail.com")
+        employee_headers = TestHelper.auth_headers(TestHelper.get_auth_token("deleteme"))
+
+        # cached by the first call
+        assert client.get("/users/me", headers=employee_headers).status_code == 200
+        client.delete("/users/2", headers=manager_headers)
+
+        assert client.get("/users/me", headers=employee_headers).status_code == 401
+
+    def test_user_lookups_are_cached(self, count_queries):
+        """Test repeated authenticated calls resolve the user from the cache"""
+        _, _ = TestHelper.create_test_user("testmanager", "manager", "manager@gmail.com")
+        headers = TestHelper.auth_headers(TestHelper.get_auth_token("testmanager"))
+        client.get("/users/me", headers=headers)
+
+        count_queries.clear()
+        for _ in range(5):
+            assert client.get("/users/me", headers=headers).status_code == 200
+
+        assert count_queries == []
+        stats = client.get("/admin/cache-stats").json()["users"]
+        assert stats["hits"] >= 5 and stats["misses"] >= 1
+
     def test_delete_user_without_auth(self):
         """Test deleting user without authentication"""
         response = client.delete("/users/1")
@@ -263,4 +330,331 @@ class TestGetCurrentUser:
     def test_get_current_user_without_auth(self):
         """Test that /users/me requires authentication"""
         response = client.get("/users/me")
-        assert response.status_code == 401
\ No newline at end of file
+        assert response.status_code == 401
+
+class TestStatelessAuth:
+
+    @pytest.fixture
+    def stateless(self, monkeypatch):
+        monkeypatch.setattr(settings, "STATELESS_AUTH", True)
+
+    def login(self, username):
+        return client.post("/users/login", data={"username": username, "password": "testpassword123"}).json()
+
+    def test_stateless_auth_needs_no_user_queries(self, stateless, count_queries):
+        """Test role claims authorize manager endpoints without touching the users table"""
+        TestHelper.create_test_user("testmanager", "manager", "manager@gmail.com")
+        TestHelper.create_test_user("testemployee", "employee", "employee@gmail.com")
+        manager = TestHelper.auth_headers(self.login("testmanager")["access_token"])
+        employee = TestHelper.auth_headers(self.login("testemployee")["access_token"])
+
+        count_queries.clear()
+        me = client.get("/users/me", headers=manager)
+        assert me.json()["role"] == "manager"
+        assert count_queries == []
+
+        assert client.get("/admin/summary/check", headers=manager).status_code == 200
+        assert client.get("/admin/summary/check", headers=employee).status_code == 403
+        assert not any("users" in statement for statement in count_queries)
+
+    def test_stateless_tokens_are_short_lived(self, stateless):
+        """Test access tokens use the short expiry in stateless mode"""
+        TestHelper.create_test_user("testuser")
+        token = self.login("testuser")["access_token"]
+
+        claims = jwt.decode(token, settings.JWT_SECRET, algorithms=[settings.JWT_ALGORITHM])
+        lifetime = datetime.fromtimestamp(claims["exp"], tz=timezone.utc) - datetime.now(timezone.utc)
+        assert lifetime <= timedelta(minutes=settings.STATELESS_ACCESS_TOKEN_EXPIRE_MINUTES)
+        assert claims["role"] == "employee" and "uid" in claims
+
+    def test_refresh_issues_new_access_token(self):
+        """Test a refresh token buys a new access token and the two can't be swapped"""
+        TestHelper.create_test_user("testuser")
+        tokens = self.login("testuser")
+
+        response = client.post("/users/refresh", json={"refresh_token": tokens["refresh_token"]})
+        assert response.status_code == 200
+        headers = TestHelper.auth_headers(response.json()["access_token"])
+        assert client.get("/users/me", headers=headers).json()["username"] == "testuser"
+
+        assert client.post("/users/refresh", json={"refresh_token": tokens["access_token"]}).status_code == 401
+        assert client.get("/users/me", headers=TestHelper.auth_headers(tokens["refresh_token"])).status_code == 401
+
+    def test_deleted_user_is_revoked(self, stateless):
+        """Test a deleted user's stateless token and refresh token stop working at once"""
+        TestHelper.create_test_user("testmanager", "manager", "manager@gmail.com")
+        TestHelper.create_test_user("deleteme", "employee", "employee@gmail.com")
+        manager = TestHelper.auth_headers(self.login("testmanager")["access_token"])
+        tokens = self.login("deleteme")
+        headers = TestHelper.auth_headers(tokens["access_token"])
+        assert client.get("/users/me", headers=headers).status_code == 200
+
+        client.delete("/users/2", headers=manager)
+
+        assert client.get("/users/me", headers=headers).status_code == 401
+        assert client.post("/users/refresh", json={"refresh_token": tokens["refresh_token"]}).status_code == 401
+
+    def test_deleted_user_stays_revoked_after_restart(self, stateless):
+        """Test a worker starting up, or one that didn't handle the delete, rejects the user's tokens"""
+        from app.services.revocation import revocation_list
+        TestHelper.create_test_user("testmanager", "manager", "manager@gmail.com")
+        TestHelper.create_test_user("deleteme", "employee", "employee@gmail.com")
+        manager = TestHelper.auth_headers(self.login("testmanager")["access_token"])
+        headers = TestHelper.auth_headers(self.login("deleteme")["access_token"])
+        client.delete("/users/2", headers=manager)
+
+        revocation_list.clear()
+        revocation_list.load_from_database()
+
+        assert revocation_list.is_revoked(None, 2)
+        assert client.get("/users/me", headers=headers).status_code == 401
+
+    def test_reused_user_id_keeps_working(self, stateless):
+        """Test a user revocation only covers tokens issued before it, not a new user given the same id"""
+        from app.services.revocation import revocation_list
+        TestHelper.create_test_user("newuser")
+        # the id's previous owner was deleted a few seconds ago
+        revocation_list.add_user(1, datetime.now() - timedelta(seconds=5))
+        old = jwt.encode({
+            "sub": "olduser", "uid": 1, "role": "manager",
+            "iat": datetime.now(timezone.utc) - timedelta(seconds=10),
+            "exp": datetime.now(timezone.utc) + timedelta(minutes=5)
+        }, settings.JWT_SECRET, algorithm=settings.JWT_ALGORITHM)
+        new = self.login("newuser")["access_token"]
+
+        assert client.get("/users/me", headers=TestHelper.auth_headers(old)).status_code == 401
+        assert client.get("/users/me", headers=TestHelper.auth_headers(new)).json()["username"] == "newuser"
+
+    def test_upgrade_stops_user_id_reuse(self, tmp_path):
+        """Test an old SQLite users table is rebuilt so a deleted user's id is never given out again"""
+        from sqlalchemy import create_engine, text
+        from app.database import Base
+        from app.migrations import upgrade
+
+        old = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+        Base.metadata.create_all(old)
+        with old.begin() as connection:
+            connection.execute(text("DROP TABLE users"))
+            connection.execute(text(
+                "CREATE TABLE users (id INTEGER PRIMARY KEY, username VARCHAR UNIQUE NOT NULL, "
+                "email VARCHAR UNIQUE NOT NULL, password_hash VARCHAR NOT NULL, role VARCHAR NOT NULL)"
+            ))
+            for i in (1, 2):
+                connection.execute(text(
+                    f"INSERT INTO users VALUES ({i}, 'user{i}', 'user{i}@gmail.com', 'x', 'employee')"
+                ))
+            # user 3 has been deleted and revoked
+            connection.execute(text("INSERT INTO revoked_users VALUES (3, '2099-01-01', '2026-01-01')"))
+
+        assert "rebuilt users with AUTOINCREMENT" in upgrade(old)
+        assert upgrade(old) == []
+        with old.begin() as connection:
+            connection.execute(text(
+                "INSERT INTO users (username, email, password_hash, role) VALUES ('new', 'n@gmail.com', 'x', 'employee')"
+            ))
+            assert connection.execute(text("SELECT id FROM users WHERE username = 'new'")).scalar_one() == 4
+            assert connection.execute(text("SELECT COUNT(*) FROM users")).scalar_one() == 3
+        old.dispose()
+
+class TestTokenRevocation:
+
+    def login(self, username):
+        return client.post("/users/login", data={"username": username, "password": "testpassword123"}).json()
+
+    def test_logout_revokes_tokens(self):
+        """Test logging out kills the access token and the refresh token passed with it"""
+        TestHelper.create_test_user("testuser")
+        tokens = self.login("testuser")
+        other = self.login("testuser")
+        headers = TestHelper.auth_headers(tokens["access_token"])
+
+        response = client.post("/users/logout", headers=headers, json={"refresh_token": tokens["refresh_token"]})
+        assert response.status_code == 200
+
+        assert client.get("/users/me", headers=headers).status_code == 401
+        assert client.post("/users/refresh", json={"refresh_token": tokens["refresh_token"]}).status_code == 401
+        # other sessions of the same user carry on
+        assert client.get("/users/me", headers=TestHelper.auth_headers(other["access_token"])).status_code == 200
+
+    def test_logout_rejects_someone_elses_refresh_token(self):
+        """Test a refresh token can only be revoked by its own user"""
+        TestHelper.create_test_user("testuser")
+        TestHelper.create_test_user("otheruser", email="other@gmail.com")
+        headers = TestHelper.auth_headers(self.login("testuser")["access_token"])
+        other = self.login("otheruser")
+
+        response = client.post("/users/logout", headers=headers, json={"refresh_token": other["refresh_token"]})
+        assert response.status_code == 400
+        assert client.post("/users/refresh", json={"refresh_token": other["refresh_token"]}).status_code == 200
+
+    def test_manager_revokes_by_jti(self):
+        """Test managers can revoke any token by id and employees can't"""
+        TestHelper.create_test_user("testmanager", "manager", "manager@gmail.com")
+        TestHelper.create_test_user("testemployee", email="employee@gmail.com")
+        manager = TestHelper.auth_headers(self.login("testmanager")["access_token"])
+        employee_token = self.login("testemployee")["access_token"]
+        employee = TestHelper.auth_headers(employee_token)
+        jti = jwt.decode(employee_token, settings.JWT_SECRET, algorithms=[settings.JWT_ALGORITHM])["jti"]
+
+        assert client.post("/users/revoke", headers=employee, json={"jti": jti}).status_code == 403
+        assert client.post("/users/revoke", headers=manager, json={"jti": jti}).status_code == 200
+        assert client.get("/users/me", headers=employee).status_code == 401
+
+    def test_revocations_survive_a_reload(self, count_queries):
+        """Test a list rebuilt from the table still rejects revoked tokens, without a query per check"""
+        TestHelper.create_test_user("testuser")
+        from app.services.revocation import revocation_list
+        tokens = self.login("testuser")
+        headers = TestHelper.auth_headers(tokens["access_token"])
+        client.post("/users/logout", headers=headers)
+
+        revocation_list.clear()
+        revocation_list.load_from_database()
+        assert len(revocation_list) == 1
+
+        count_queries.clear()
+        assert client.get("/users/me", headers=headers).status_code == 401
+        assert not any("revoked_tokens" in statement for statement in count_queries)
+
+    def test_reload_picks_up_other_processes_revocations(self):
+        """Test revocations written by another worker take effect here on the next reload"""
+        from app.database import SessionLocal
+        from app.scheduler import revocation_reload
+        from app.services.revocation import revoke_token
+        TestHelper.create_test_user("testuser")
+        token = self.login("testuser")["access_token"]
+        headers = TestHelper.auth_headers(token)
+        claims = jwt.decode(token, settings.JWT_SECRET, algorithms=[settings.JWT_ALGORITHM])
+        with SessionLocal() as session:
+            revoke_token(session, claims["jti"], datetime.fromtimestamp(claims["exp"]))
+            session.commit()
+        assert client.get("/users/me", headers=headers).status_code == 200
+
+        revocation_reload()
+
+        assert client.get("/users/me", headers=headers).status_code == 401
+
+    def test_revocation_during_reload_is_kept(self, monkeypatch):
+        """Test a token revoked here while a reload reads the tables isn't dropped by the swap"""
+        from app.services import revocation
+        open_session = revocation.SessionLocal
+
+        class RevokeMidRead:
+            """Session whose first read lets this process revoke a token and a user"""
+            def __enter__(self):
+                self.session = open_session()
+                return self
+
+            def __exit__(self, *exc):
+                self.session.close()
+
+            def execute(self, statement):
+                result = self.session.execute(statement).freeze()
+                revocation.revocation_list.add("late-jti")
+                revocation.revocation_list.add_user(7, datetime.now())
+                return result()
+
+        monkeypatch.setattr(revocation, "SessionLocal", RevokeMidRead)
+        revocation.revocation_list.load_from_database()
+
+        assert revocation.revocation_list.is_revoked("late-jti")
+        assert revocation.revocation_list.is_revoked(None, 7)
+
+class TestLoginRateLimit:
+
+    def test_burst_then_429_before_password_check(self, sample_user, monkeypatch):
+        """Test a username gets its burst of attempts, then 429s without bcrypt being run"""
+        from app.services.login_limiter import username_limiter
+        client.post("/users/register", json=sample_user)
+        wrong = {"username": sample_user["username"], "password": "wrongpassword"}
+        for _ in range(username_limiter.burst):
+            assert client.post("/users/login", data=wrong).status_code == 401
+
+        verified = []
+        monkeypatch.setattr(password_hasher, "verify", lambda *args: verified.append(args))
+        right = {"username": sample_user["username"], "password": sample_user["password"]}
+        response = client.post("/users/login", data=right)
+
+        assert response.status_code == 429
+        assert int(response.headers["Retry-After"]) >= 1
+        assert verified == []
+
+    def test_limit_is_per_username_and_per_ip(self, monkeypatch):
+        """Test one username running out doesn't affect another, but the shared IP bucket does"""
+        from app.services import login_limiter
+        monkeypatch.setattr(login_limiter, "username_limiter", login_limiter.TokenBucketLimiter(1, 1, 60))
+        monkeypatch.setattr(login_limiter, "ip_limiter", login_limiter.TokenBucketLimiter(3, 1, 60))
+
+        assert client.post("/users/login", data={"username": "a", "password": "x"}).status_code == 401
+        assert client.post("/users/login", data={"username": "a", "password": "x"}).status_code == 429
+        assert client.post("/users/login", data={"username": "b", "password": "x"}).status_code == 401
+        assert client.post("/users/login", data={"username": "c", "password": "x"}).status_code == 401
+        # the IP has now spent its three tokens
+        assert client.post("/users/login", data={"username": "d", "password": "x"}).status_code == 429
+
+    def test_ip_refusal_leaves_username_uncharged(self, monkeypatch):
+        """Test a username isn't charged when the IP's last token goes to a concurrent attempt"""
+        from app.services import login_limiter
+        monkeypatch.setattr(login_limiter, "username_limiter", login_limiter.TokenBucketLimiter(2, 1, 60))
+        ip_limiter = login_limiter.TokenBucketLimiter(1, 1, 60)
+        monkeypatch.setattr(login_limiter, "ip_limiter", ip_limiter)
+        # another request takes the IP's token between the check and the take
+        monkeypatch.setattr(ip_limiter, "retry_after", lambda key: 0)
+        ip_limiter.take("10.0.0.1")
+
+        with pytest.raises(HTTPException) as refused:
+            login_limiter.check_login_allowed("victim", "10.0.0.1")
+        assert refused.value.status_code == 429
+        assert login_limiter.username_limiter.retry_after("victim") == 0
+        assert login_limiter.username_limiter.take("victim") and login_limiter.username_limiter.take("victim")
+
+    def test_forwarded_for_only_from_trusted_proxies(self, monkeypatch):
+        """Test X-Forwarded-For picks the IP bucket only when the connection is a trusted proxy"""
+        from app.services import login_limiter
+        monkeypatch.setattr(login_limiter, "ip_limiter", login_limiter.TokenBucketLimiter(1, 1, 60))
+        spoofed = {"X-Forwarded-For": "203.0.113.9"}
+
+        # the test client connects as "testclient"; untrusted, the header is ignored
+        assert client.post("/users/login", data={"username": "a", "password": "x"}, headers=spoofed).status_code == 401
+        assert client.post("/users/login", data={"username": "b", "password": "x"}, headers=spoofed).status_code == 429
+
+        monkeypatch.setattr(settings, "LOGIN_TRUSTED_PROXIES", frozenset({"testclient", "10.0.0.2"}))
+        for address in ("203.0.113.9", "198.51.100.7, 10.0.0.2"):
+            response = client.post(
+                "/users/login", data={"username": "c", "password": "x"}, headers={"X-Forwarded-For": address}
+            )
+            assert response.status_code == 401
+        # a client can prepend anything, but the hop the proxy added still counts
+        response = client.post(
+            "/users/login", data={"username": "d", "password": "x"}, headers={"X-Forwarded-For": "1.2.3.4, 203.0.113.9"}
+        )
+        assert response.status_code == 429
+
+    def test_sustained_rate_refills_tokens(self):
+        """Test a drained bucket allows exactly the configured rate afterwards"""
+        from app.services.login_limiter import TokenBucketLimiter
+        now = [0.0]
+        limiter = TokenBucketLimiter(burst=5, per_minute=6, sweep_seconds=60, clock=lambda: now[0])
+
+        assert [limiter.take("user") for _ in range(6)] == [True] * 5 + [False]
+        assert limiter.retry_after("user") == pytest.approx(10)
+
+        # ten minutes at one attempt every five seconds: only every other one gets through
+        allowed = 0
+        for _ in range(120):
+            now[0] += 5
+            allowed += limiter.take("user")
+        assert allowed == 60
+
+    def test_idle_buckets_are_evicted(self):
+        """Test buckets that have fully refilled are dropped at the next sweep"""
+        from app.services.login_limiter import TokenBucketLimiter
+        now = [0.0]
+        limiter = TokenBucketLimiter(burst=2, per_minute=60, sweep_seconds=10, clock=lambda: now[0])
+        for i in range(100):
+            limiter.take(f"user{i}")
+        assert len(limiter) == 100
+
+        now[0] = 11
+        limiter.take("active")
+        assert len(limiter) == 1